@@ -0,0 +1,36 @@
+""" Exchanging data with ClickHouse in Apache Arrow format
+
+Requires `pyarrow` extra.
+"""
+
+from typing import Union
+
+import pyarrow as pa
+
+
+__all__ = [
+    'ARROW_STREAM', 'ArrowDecodeError', 'parse_arrow_stream',
+    'encode_arrow_stream',
+]
+
+
+ARROW_STREAM = 'ArrowStream'
+
+
+class ArrowDecodeError(ValueError):
+    """ Data in ArrowStream format is malformed or incomplete """
+
+
+def parse_arrow_stream(types, content: bytes) -> pa.Table:
+    # `types` are not used: values are never converted to Python objects
+    try:
+        return pa.ipc.open_stream(content).read_all()
+    except pa.ArrowException as exc:
+        raise ArrowDecodeError(str(exc)) from exc
+
+
+def encode_arrow_stream(data: Union[pa.Table, pa.RecordBatch]) -> bytes:
+    sink = pa.BufferOutputStream()
+    with pa.ipc.new_stream(sink, data.schema) as writer:
+        writer.write(data)
+    return sink.getvalue().to_pybytes()
@@ -0,0 +1,296 @@
+""" Load balancing and failover across several servers (usually replicas) of
+multi-host pool
+"""
+
+import asyncio
+from collections import deque
+from itertools import count
+import logging
+import random
+from typing import Collection, Dict, List, Optional, Sequence, Type, Union
+
+from .exc import ProtocolError
+
+
+__all__ = [
+    'Host', 'Balancer', 'RoundRobinBalancer', 'RandomBalancer',
+    'LeastInFlightBalancer', 'LatencyEWMABalancer', 'BALANCERS',
+    'get_balancer', 'HostGroup', 'LatencyWindow',
+]
+
+
+logger = logging.getLogger(__name__)
+
+
+class Host:
+    """ Server of multi-host pool with its client and state used for
+    balancing
+    """
+
+    # Weight of the last observation in moving average of latency
+    LATENCY_WEIGHT = 0.3
+
+    def __init__(self, client):
+        self.client = client
+        self.url = client.url
+        # Number of acquired connections
+        self.in_flight = 0
+        # Exponentially weighted moving average of query time (seconds)
+        self.latency: Optional[float] = None
+        self.ejected = False
+        # Replication delay (seconds) sampled last time, `None` when unknown
+        self.delay: Optional[float] = None
+
+    def observe_latency(self, seconds: float):
+        if self.latency is None:
+            self.latency = seconds
+        else:
+            self.latency += self.LATENCY_WEIGHT * (seconds - self.latency)
+
+    def __repr__(self):
+        return f'<{type(self).__name__} {self.url}>'
+
+
+class Balancer:
+    """ Base class of strategies choosing host for the next query """
+
+    name: str
+
+    def choose(self, hosts: Sequence[Host]) -> Host:
+        """ Returns one of `hosts` (never empty) """
+        raise NotImplementedError()
+
+    def __repr__(self):
+        return f'<{type(self).__name__}>'
+
+
+class RoundRobinBalancer(Balancer):
+    name = 'round_robin'
+
+    def __init__(self):
+        self._counter = count()
+
+    def choose(self, hosts: Sequence[Host]) -> Host:
+        return hosts[next(self._counter) % len(hosts)]
+
+
+class RandomBalancer(Balancer):
+    name = 'random'
+
+    def choose(self, hosts: Sequence[Host]) -> Host:
+        return random.choice(hosts)
+
+
+class LeastInFlightBalancer(Balancer):
+    name = 'least_in_flight'
+
+    def choose(self, hosts: Sequence[Host]) -> Host:
+        # Shuffled to spread load across idle hosts
+        return min(
+            random.sample(list(hosts), len(hosts)),
+            key=lambda host: host.in_flight,
+        )
+
+
+class LatencyEWMABalancer(Balancer):
+    """ Chooses host with the least expected time to complete the query:
+    moving average of latency multiplied by number of queries in flight.
+    Hosts without observed latency are tried first.
+    """
+
+    name = 'latency_ewma'
+
+    def _cost(self, host: Host) -> float:
+        if host.latency is None:
+            return 0.
+        return host.latency * (host.in_flight + 1)
+
+    def choose(self, hosts: Sequence[Host]) -> Host:
+        return min(random.sample(list(hosts), len(hosts)), key=self._cost)
+
+
+BALANCERS: Dict[str, Type[Balancer]] = {
+    balancer_class.name: balancer_class
+    for balancer_class in [
+        RoundRobinBalancer, RandomBalancer, LeastInFlightBalancer,
+        LatencyEWMABalancer,
+    ]
+}
+
+
+def get_balancer(balancer: Union[str, Balancer]) -> Balancer:
+    """ Returns balancer by name or the instance itself """
+    if isinstance(balancer, Balancer):
+        return balancer
+    try:
+        balancer_class = BALANCERS[balancer]
+    except KeyError:
+        raise ValueError(f'Unsupported balancer {balancer!r}') from None
+    return balancer_class()
+
+
+class HostGroup:
+    """ Hosts queries are balanced across
+
+    Host failed with connection error is ejected: it's not chosen while there
+    are other ones available.  Ejected hosts are checked with ping every
+    `health_check_interval` seconds in background and brought back when
+    they respond.
+
+    Replication delay of hosts is sampled every `delay_interval` seconds
+    once `track_delays()` is called, so that queries with `max_staleness`
+    budget skip lagging replicas.
+    """
+
+    # Maximal replication delay of tables on host
+    DELAY_QUERY = 'SELECT max(absolute_delay) FROM system.replicas'
+
+    def __init__(
+        self, hosts: List[Host], balancer: Balancer,
+        health_check_interval: float, delay_interval: float = 10,
+    ):
+        self.hosts = hosts
+        self.balancer = balancer
+        self.health_check_interval = health_check_interval
+        self.delay_interval = delay_interval
+        self._health_check_task: Optional[asyncio.Future] = None
+        self._delay_task: Optional[asyncio.Future] = None
+        # The first sample shared by concurrent callers of `track_delays()`
+        self._first_delays: Optional[asyncio.Future] = None
+
+    def choose(
+        self, exclude: Collection[Host] = (),
+        max_staleness: Optional[float] = None,
+    ) -> Host:
+        """ Returns available host not in `exclude`, or ejected one when
+        there is no such host.  With `max_staleness` hosts with known
+        replication delay within it are preferred, otherwise the freshest
+        one is returned.
+        """
+        candidates = [
+            host for host in self.hosts
+            if not host.ejected and host not in exclude
+        ]
+        if not candidates:
+            # Trying ejected host is better than failing without attempt
+            candidates = [
+                host for host in self.hosts if host not in exclude
+            ] or self.hosts
+        if max_staleness is not None and len(candidates) > 1:
+            fresh = [
+                host for host in candidates
+                if host.delay is not None and host.delay <= max_staleness
+            ]
+            if not fresh:
+                return min(
+                    candidates,
+                    key=lambda host: (host.delay is None, host.delay or 0),
+                )
+            candidates = fresh
+        return self.balancer.choose(candidates)
+
+    def has_available(self, exclude: Collection[Host] = ()) -> bool:
+        return any(
+            not host.ejected and host not in exclude for host in self.hosts
+        )
+
+    def eject(self, host: Host):
+        if len(self.hosts) == 1 or host.ejected:
+            return
+        logger.warning(f'Ejecting {host.url} after failure')
+        host.ejected = True
+        if self._health_check_task is None or self._health_check_task.done():
+            self._health_check_task = asyncio.ensure_future(
+                self._check_health(),
+            )
+
+    async def _check_host(self, host: Host):
+        try:
+            await host.client.ping()
+        except (ProtocolError, asyncio.TimeoutError) as exc:
+            logger.debug(f'Health check of {host.url} failed: {exc}')
+        else:
+            logger.info(f'Host {host.url} is back after health check')
+            host.ejected = False
+
+    async def _check_health(self):
+        while any(host.ejected for host in self.hosts):
+            await asyncio.sleep(self.health_check_interval)
+            await asyncio.gather(*[
+                self._check_host(host)
+                for host in self.hosts if host.ejected
+            ])
+
+    async def _sample_delay(self, host: Host):
+        try:
+            host.delay = float(await host.client.fetchval(self.DELAY_QUERY))
+        except Exception as exc:
+            logger.debug(f'Sampling delay of {host.url} failed: {exc}')
+            host.delay = None
+
+    async def sample_delays(self):
+        """ Updates replication delay of all hosts """
+        await asyncio.gather(*[
+            self._sample_delay(host) for host in self.hosts
+        ])
+
+    async def _sample_delays_periodically(self):
+        while True:
+            await asyncio.sleep(self.delay_interval)
+            await self.sample_delays()
+
+    async def _start_tracking_delays(self):
+        await self.sample_delays()
+        self._delay_task = asyncio.ensure_future(
+            self._sample_delays_periodically(),
+        )
+
+    async def track_delays(self):
+        """ Starts sampling replication delay in background (the first
+        sample is awaited)
+        """
+        if self._delay_task is not None or len(self.hosts) == 1:
+            return
+        if self._first_delays is None:
+            self._first_delays = asyncio.ensure_future(
+                self._start_tracking_delays(),
+            )
+        # Cancelled caller must not cancel the sample awaited by others
+        await asyncio.shield(self._first_delays)
+
+    async def close(self):
+        tasks = [
+            self._health_check_task, self._first_delays, self._delay_task,
+        ]
+        self._health_check_task = self._first_delays = None
+        self._delay_task = None
+        for task in tasks:
+            if task is not None and not task.done():
+                task.cancel()
+                try:
+                    await task
+                except asyncio.CancelledError:
+                    pass
+
+
+class LatencyWindow:
+    """ Recent query times to get their percentiles """
+
+    # Percentiles of fewer samples are not reliable
+    MIN_SAMPLES = 20
+
+    def __init__(self, maxsize: int = 1000):
+        self._samples: deque = deque(maxlen=maxsize)
+
+    def add(self, seconds: float):
+        self._samples.append(seconds)
+
+    def percentile(self, percent: float) -> Optional[float]:
+        """ Returns `percent` percentile (nearest rank) of recent samples, or
+        `None` when there are not enough of them
+        """
+        if len(self._samples) < self.MIN_SAMPLES:
+            return None
+        samples = sorted(self._samples)
+        rank = max(round(percent / 100 * len(samples)), 1)
+        return samples[min(rank, len(samples)) - 1]
@@ -0,0 +1,704 @@
+from array import array
+import calendar
+from collections import namedtuple
+from decimal import Context, Decimal
+from functools import lru_cache
+from ipaddress import IPv4Address, IPv6Address
+import re
+import struct
+from typing import (
+    Any, Callable, Dict, Iterable, List, Mapping, Optional, Sequence, Tuple,
+)
+from uuid import UUID
+
+from lark import v_args
+from lark.exceptions import VisitError
+
+from .parser import ARRAY_TYPECODES, TypeTransformer, type_parser
+from .record import RowFactory, record_factory, tuple_factory
+from .types import (
+    EPOCH_DATE, DecimalType, FloatType, IntType, TypeRegistry, zoneinfo,
+)
+
+
+__all__ = [
+    'ROW_BINARY', 'ROW_BINARY_INSERT', 'RowBinaryParser',
+    'RowBinaryDecodeError', 'parse_row_binary', 'parse_row_binary_columns',
+    'parse_row_binary_column_list', 'encode_row_binary',
+    'set_datetime_timezone',
+]
+
+
+ROW_BINARY = 'RowBinaryWithNamesAndTypes'
+ROW_BINARY_INSERT = 'RowBinary'
+
+
+class RowBinaryDecodeError(ValueError):
+    """ Data in RowBinary format is malformed or incomplete """
+
+
+# Format characters of `struct` module for fixed-width types
+FIXED_FORMATS = {
+    'UInt8': 'B', 'UInt16': 'H', 'UInt32': 'I', 'UInt64': 'Q',
+    'Int8': 'b', 'Int16': 'h', 'Int32': 'i', 'Int64': 'q',
+    'Float32': 'f', 'Float64': 'd',
+    # Number of days since the epoch
+    'Date': 'H',
+    # Unix timestamp
+    'DateTime': 'I',
+    'UUID': '16s',
+    'IPv4': 'I',
+    # In network byte order
+    'IPv6': '16s',
+    'Enum8': 'b',
+    'Enum16': 'h',
+}
+
+
+# Reader and writer of any column type.  `fmt`, `convert` (from packed
+# value) and `prepare` (to packed value) are set for fixed-width types only,
+# so that several such columns can be (un)packed at once.
+BinaryColumn = namedtuple(
+    'BinaryColumn',
+    ['type_obj', 'fmt', 'convert', 'read', 'prepare', 'write'],
+)
+
+
+def read_varint(buf, pos):
+    # LEB128
+    result = shift = 0
+    while True:
+        byte = buf[pos]
+        pos += 1
+        result |= (byte & 0x7f) << shift
+        if byte < 0x80:
+            return result, pos
+        shift += 7
+
+
+def write_varint(out: bytearray, value: int):
+    while value >= 0x80:
+        out.append(value & 0x7f | 0x80)
+        value >>= 7
+    out.append(value)
+
+
+def read_string(buf, pos):
+    size, pos = read_varint(buf, pos)
+    end = pos + size
+    if end > len(buf):
+        raise IndexError('Incomplete string')
+    return bytes(buf[pos:end]), end
+
+
+_escape_re = re.compile(r'\\(x[0-9a-fA-F]{2}|.)', re.S)
+
+_ESCAPES = {
+    'a': '\a', 'b': '\b', 'e': '\x1b', 'f': '\f', 'n': '\n', 'r': '\r',
+    't': '\t', 'v': '\v', '0': '\0',
+}
+
+
+def _unescape_sub(m):
+    seq = m.group(1)
+    if seq[0] == 'x' and len(seq) == 3:
+        return chr(int(seq[1:], 16))
+    return _ESCAPES.get(seq, seq)
+
+
+def unescape(value: str) -> str:
+    """ Unescape string literal from ClickHouse type definition """
+    return _escape_re.sub(_unescape_sub, value)
+
+
+def _compose(*funcs: Optional[Callable]) -> Optional[Callable]:
+    present = [func for func in funcs if func is not None]
+    if not present:
+        return None
+    elif len(present) == 1:
+        return present[0]
+    first, second = present
+    return lambda value: second(first(value))
+
+
+_IDENTITY_CONVERTERS = {
+    IntType.from_binary, FloatType.from_binary, DecimalType.from_binary,
+}
+
+
+def _is_identity(type_obj):
+    return type(type_obj).from_binary in _IDENTITY_CONVERTERS
+
+
+@lru_cache(maxsize=1024)
+def _array_struct(fmt, size):
+    return struct.Struct('<' + fmt * size)
+
+
+def _fixed_column(type_obj, fmt, raw_convert=None, prepare=None):
+    convert = raw_convert
+    if not _is_identity(type_obj):
+        convert = _compose(raw_convert, type_obj.from_binary)
+    packer = struct.Struct('<' + fmt)
+    size = packer.size
+    unpack_from = packer.unpack_from
+    pack = packer.pack
+
+    if convert is None:
+        def read(buf, pos):
+            return unpack_from(buf, pos)[0], pos + size
+    else:
+        def read(buf, pos):
+            return convert(unpack_from(buf, pos)[0]), pos + size
+
+    if prepare is None:
+        def write(out, value):
+            out += pack(value)
+    else:
+        def write(out, value):
+            out += pack(prepare(value))
+
+    return BinaryColumn(type_obj, fmt, convert, read, prepare, write)
+
+
+# Enough to scale any `Decimal256` without rounding
+_DECIMAL_CONTEXT = Context(prec=100)
+
+
+def _decimal_column(type_obj, precision, scale):
+    def to_decimal(value):
+        # Constructing from string doesn't round to context precision
+        return Decimal(f'{value}E-{scale}')
+
+    limit = 10 ** precision
+
+    def from_decimal(value):
+        result = int(Decimal(value).scaleb(scale, _DECIMAL_CONTEXT))
+        if not -limit < result < limit:
+            raise ValueError(
+                f'Value {value} is out of range of Decimal({precision}, '
+                f'{scale})'
+            )
+        return result
+
+    if precision <= 9:
+        return _fixed_column(type_obj, 'i', to_decimal, from_decimal)
+    elif precision <= 18:
+        return _fixed_column(type_obj, 'q', to_decimal, from_decimal)
+    # `Decimal128` and `Decimal256` have no `struct` format character
+    size = 16 if precision <= 38 else 32
+    return _fixed_column(
+        type_obj, f'{size}s',
+        lambda value: to_decimal(int.from_bytes(value, 'little', signed=True)),
+        lambda value: from_decimal(value).to_bytes(
+            size, 'little', signed=True,
+        ),
+    )
+
+
+_EPOCH_ORDINAL = EPOCH_DATE.toordinal()
+
+
+def _prepare_date(value):
+    if value is None:
+        # Zero date, like in `DateType.escape()`
+        return 0
+    return value.toordinal() - _EPOCH_ORDINAL
+
+
+def _prepare_datetime(value):
+    # Naive datetime is packed as UTC
+    if isinstance(value, int):
+        return value
+    return calendar.timegm(value.utctimetuple())
+
+
+def _datetime_preparer(tz_name: Optional[str] = None) -> Callable:
+    """ Returns function packing naive datetime as wall clock time in
+    `tz_name` timezone (like server reads it from text formats)
+    """
+    if tz_name is None:
+        return _prepare_datetime
+    tzinfo = zoneinfo.ZoneInfo(tz_name)
+
+    def prepare(value):
+        if isinstance(value, int):
+            return value
+        if value.tzinfo is None:
+            value = value.replace(tzinfo=tzinfo)
+        return int(value.timestamp())
+
+    return prepare
+
+
+_plain_datetime_re = re.compile(r'\bDateTime\b(?!\s*\()')
+
+
+def set_datetime_timezone(type_str: str, tz_name: str) -> str:
+    """ Adds timezone to `DateTime` types without explicit one in
+    `type_str`, so that naive values are packed in this timezone
+    """
+    return _plain_datetime_re.sub(f"DateTime('{tz_name}')", type_str)
+
+
+def _prepare_uuid(value):
+    if not isinstance(value, UUID):
+        value = UUID(value)
+    value = value.bytes
+    # Two little-endian 64-bit halves, high one first
+    return value[7::-1] + value[:7:-1]
+
+
+def _prepare_ipv4(value):
+    if not isinstance(value, IPv4Address):
+        value = IPv4Address(value)
+    return int(value)
+
+
+def _prepare_ipv6(value):
+    if not isinstance(value, IPv6Address):
+        value = IPv6Address(value)
+    return value.packed
+
+
+_FIXED_PREPARE = {
+    'Date': _prepare_date,
+    'UUID': _prepare_uuid,
+    'IPv4': _prepare_ipv4,
+    'IPv6': _prepare_ipv6,
+}
+
+
+def _prepare_string(value):
+    if isinstance(value, str):
+        # `str.encode()` to get proper value of `str` subclasses like enums
+        return str.encode(value)
+    return value
+
+
+_DECIMAL_PRECISIONS = {'Decimal32': 9, 'Decimal64': 18, 'Decimal128': 38}
+
+
+@v_args(inline=True)
+class BinaryTypeTransformer(TypeTransformer):
+    """ Builds `BinaryColumn` from type tree
+
+    Conversion to Python objects is done by `from_binary()` method of type
+    objects, so `TypeRegistry` is the extension point for both JSON and
+    binary formats.
+    """
+
+    def composite_type(self, name, *columns):
+        type_obj = self._types[name](*[column.type_obj for column in columns])
+        if type_obj is columns[0].type_obj:
+            # `LowCardinality()` is just transparent
+            return columns[0]
+        convert = type_obj.from_binary
+
+        if name == 'Nullable':
+            [item] = columns
+            item_read = item.read
+            item_write = item.write
+
+            def read(buf, pos):
+                if buf[pos]:
+                    return None, pos + 1
+                return item_read(buf, pos + 1)
+
+            def write(out, value):
+                if value is None:
+                    out.append(1)
+                else:
+                    out.append(0)
+                    item_write(out, value)
+
+        elif name == 'Array':
+            [item] = columns
+            if item.fmt is not None:
+                item_fmt = item.fmt
+                item_convert = item.convert
+                item_prepare = item.prepare
+
+                def read(buf, pos):
+                    size, pos = read_varint(buf, pos)
+                    packer = _array_struct(item_fmt, size)
+                    values = packer.unpack_from(buf, pos)
+                    if item_convert is None:
+                        values = list(values)
+                    else:
+                        values = [item_convert(value) for value in values]
+                    return convert(values), pos + packer.size
+
+                def write(out, value):
+                    write_varint(out, len(value))
+                    if item_prepare is not None:
+                        value = [item_prepare(v) for v in value]
+                    out += _array_struct(item_fmt, len(value)).pack(*value)
+            else:
+                item_read = item.read
+                item_write = item.write
+
+                def read(buf, pos):
+                    size, pos = read_varint(buf, pos)
+                    values = []
+                    for _ in range(size):
+                        value, pos = item_read(buf, pos)
+                        values.append(value)
+                    return convert(values), pos
+
+                def write(out, value):
+                    write_varint(out, len(value))
+                    for v in value:
+                        item_write(out, v)
+
+        elif name == 'Tuple':
+            item_reads = [column.read for column in columns]
+            item_writes = [column.write for column in columns]
+
+            def read(buf, pos):
+                values = []
+                for item_read in item_reads:
+                    value, pos = item_read(buf, pos)
+                    values.append(value)
+                return convert(values), pos
+
+            def write(out, value):
+                if len(value) != len(item_writes):
+                    raise ValueError(
+                        f'Expected tuple of {len(item_writes)} items, got '
+                        f'{len(value)}'
+                    )
+                for item_write, v in zip(item_writes, value):
+                    item_write(out, v)
+
+        else:
+            raise TypeError(f'Type {name} is not supported in RowBinary')
+
+        return BinaryColumn(type_obj, None, None, read, None, write)
+
+    def aggregate_type(self, name, func, column):
+        type_obj = self._types[name](column.type_obj)
+        if type_obj is column.type_obj:
+            # `SimpleAggregateFunction()` is stored as its argument
+            return column
+        raise TypeError(f'Type {name} is not supported in RowBinary')
+
+    def simple_type(self, name, *params):
+        type_obj = self._types[name](*params)
+
+        if name in ('Enum8', 'Enum16'):
+            labels = {
+                option.value: unescape(option.label) for option in params
+            }
+            values = {label: value for value, label in labels.items()}
+
+            def prepare_enum(value):
+                if isinstance(value, int):
+                    return value
+                return values[value]
+
+            return _fixed_column(
+                type_obj, FIXED_FORMATS[name], labels.__getitem__,
+                prepare_enum,
+            )
+        elif name == 'DateTime':
+            return _fixed_column(
+                type_obj, FIXED_FORMATS[name],
+                prepare=_datetime_preparer(*params),
+            )
+        elif name in FIXED_FORMATS:
+            return _fixed_column(
+                type_obj, FIXED_FORMATS[name], prepare=_FIXED_PREPARE.get(name),
+            )
+        elif name == 'FixedString':
+            [size] = params
+            # `struct` pads value with zeros
+            return _fixed_column(
+                type_obj, f'{size}s', prepare=_prepare_string,
+            )
+        elif name == 'Decimal':
+            precision, scale = params
+            return _decimal_column(type_obj, precision, scale)
+        elif name in _DECIMAL_PRECISIONS:
+            [scale] = params
+            return _decimal_column(type_obj, _DECIMAL_PRECISIONS[name], scale)
+        elif name == 'String':
+            convert = type_obj.from_binary
+
+            def read(buf, pos):
+                value, pos = read_string(buf, pos)
+                return convert(value), pos
+
+            def write(out, value):
+                value = _prepare_string(value)
+                write_varint(out, len(value))
+                out += value
+
+            return BinaryColumn(type_obj, None, None, read, None, write)
+        elif name == 'Nothing':
+            # Only appears as `Nullable(Nothing)`, so it's always NULL
+            return BinaryColumn(
+                type_obj, None, None, lambda buf, pos: (None, pos),
+                None, lambda out, value: None,
+            )
+        else:
+            raise TypeError(f'Type {name} is not supported in RowBinary')
+
+
+def _parse_binary_column(types: TypeRegistry, type_str: str) -> BinaryColumn:
+    tree = type_parser.parse(type_str)
+    try:
+        return BinaryTypeTransformer(types).transform(tree)
+    except VisitError as exc:
+        raise exc.orig_exc from None
+
+
+def parse_binary_column(types: TypeRegistry, type_str: str) -> BinaryColumn:
+    return types.cached(
+        (ROW_BINARY, type_str), lambda: _parse_binary_column(types, type_str),
+    )
+
+
+def make_row_reader(columns: List[BinaryColumn]) -> Callable:
+    """ Returns function reading one row at given position
+
+    Adjacent fixed-width columns are unpacked with single precompiled
+    `struct.Struct`.
+    """
+    steps: List[tuple] = []
+    group: list = []
+
+    def flush_group():
+        if group:
+            packer = struct.Struct(
+                '<' + ''.join(column.fmt for _, column in group)
+            )
+            steps.append((
+                packer.unpack_from, packer.size,
+                [(idx, column.convert) for idx, column in group],
+            ))
+            group.clear()
+
+    for idx, column in enumerate(columns):
+        if column.fmt is not None:
+            group.append((idx, column))
+        else:
+            flush_group()
+            steps.append((None, idx, column.read))
+    flush_group()
+
+    num_columns = len(columns)
+
+    def read_row(buf, pos):
+        values = [None] * num_columns
+        for unpack_from, arg, items in steps:
+            if unpack_from is None:
+                values[arg], pos = items(buf, pos)
+            else:
+                raw_values = unpack_from(buf, pos)
+                pos += arg
+                for (idx, convert), value in zip(items, raw_values):
+                    values[idx] = value if convert is None else convert(value)
+        return values, pos
+
+    return read_row
+
+
+def read_header(buf, pos):
+    """ Reads names and types of columns, returns them with new position """
+    num_columns, pos = read_varint(buf, pos)
+    names = []
+    for _ in range(num_columns):
+        name, pos = read_string(buf, pos)
+        names.append(name.decode())
+    type_strs = []
+    for _ in range(num_columns):
+        type_str, pos = read_string(buf, pos)
+        type_strs.append(type_str.decode())
+    return names, type_strs, pos
+
+
+class RowBinaryParser:
+    """ Incremental parser of `RowBinaryWithNamesAndTypes` output
+
+    Data is fed in chunks of arbitrary size, incomplete row at the end of
+    chunk is kept until the next one arrives.
+    """
+
+    def __init__(
+        self, types: TypeRegistry, row_factory: RowFactory = record_factory,
+    ):
+        self._types = types
+        self._row_factory = row_factory
+        self._tail = b''
+        self._make_row: Optional[Callable[[list], Any]] = None
+        self._read_row: Optional[Callable] = None
+
+    def feed(self, data: bytes) -> List[Any]:
+        if self._tail:
+            data = self._tail + data
+        buf = memoryview(data)
+        size = len(buf)
+        pos = 0
+        records = []
+        try:
+            if self._read_row is None:
+                names, type_strs, pos = read_header(buf, pos)
+                if getattr(self._row_factory, 'lazy', False):
+                    # Values are converted while reading
+                    self._make_row = self._row_factory(names, None)
+                else:
+                    self._make_row = self._row_factory(names)
+                self._read_row = make_row_reader([
+                    parse_binary_column(self._types, type_str)
+                    for type_str in type_strs
+                ])
+            read_row = self._read_row
+            make_row = self._make_row
+            while pos < size:
+                values, pos = read_row(buf, pos)
+                records.append(make_row(values))  # type: ignore
+        except (IndexError, struct.error):
+            # Incomplete row, wait for more data
+            pass
+        except (KeyError, ValueError) as exc:
+            self._tail = bytes(buf[pos:])
+            raise RowBinaryDecodeError(str(exc)) from exc
+        self._tail = bytes(buf[pos:])
+        return records
+
+    def close(self):
+        if self._tail:
+            raise RowBinaryDecodeError(
+                f'Unexpected {len(self._tail)} bytes at the end of data'
+            )
+
+    @property
+    def tail(self) -> bytes:
+        return self._tail
+
+
+def parse_row_binary(
+    types: TypeRegistry, content: bytes,
+    row_factory: RowFactory = record_factory,
+) -> List[Any]:
+    # Unlike JSON, data is decoded eagerly: binary data can't be checked for
+    # validity (e.g. to detect exception in the middle) without decoding
+    parser = RowBinaryParser(types, row_factory)
+    records = parser.feed(content)
+    parser.close()
+    return records
+
+
+def parse_row_binary_columns(
+    types: TypeRegistry, content: bytes,
+) -> Dict[str, Sequence]:
+    return dict(zip(*parse_row_binary_column_list(types, content)))
+
+
+def parse_row_binary_column_list(
+    types: TypeRegistry, content: bytes,
+) -> Tuple[List[str], List[Sequence]]:
+    """ The same as `parse_row_binary_columns()`, but returns list of names
+    and list of columns, so that duplicate names are preserved
+    """
+    buf = memoryview(content)
+    try:
+        names, type_strs, pos = read_header(buf, 0)
+        columns = [
+            parse_binary_column(types, type_str) for type_str in type_strs
+        ]
+        if not all(column.fmt is not None for column in columns):
+            rows = parse_row_binary(types, content, tuple_factory)
+            raw_columns = list(zip(*rows)) or [()] * len(names)
+            # Values are already converted while reading rows
+            return names, list(map(list, raw_columns))
+
+        # Rows of fixed width: all of them are unpacked in C, then
+        # transposed with `zip()`
+        packer = struct.Struct(''.join(['<'] + [c.fmt for c in columns]))
+        raw_rows = packer.iter_unpack(buf[pos:])
+        raw_columns = list(zip(*raw_rows)) or [()] * len(names)
+    except (IndexError, struct.error) as exc:
+        raise RowBinaryDecodeError(f'Incomplete data: {exc}') from exc
+    except (KeyError, ValueError) as exc:
+        raise RowBinaryDecodeError(str(exc)) from exc
+
+    result: List[Sequence] = []
+    for column, values in zip(columns, raw_columns):
+        if column.convert is not None:
+            result.append(list(map(column.convert, values)))
+        elif column.fmt in ARRAY_TYPECODES.values():
+            result.append(array(column.fmt, values))
+        else:
+            result.append(list(values))
+    return names, result
+
+
+def make_row_writer(columns: List[BinaryColumn]) -> Callable:
+    """ Returns function appending one row (sequence of values) to buffer
+
+    Adjacent fixed-width columns are packed with single precompiled
+    `struct.Struct`.
+    """
+    steps: List[tuple] = []
+    group: list = []
+
+    def flush_group():
+        if group:
+            packer = struct.Struct(
+                '<' + ''.join(column.fmt for _, column in group)
+            )
+            steps.append((
+                packer.pack,
+                [(idx, column.prepare) for idx, column in group],
+            ))
+            group.clear()
+
+    for idx, column in enumerate(columns):
+        if column.fmt is not None:
+            group.append((idx, column))
+        else:
+            flush_group()
+            steps.append((None, (idx, column.write)))
+    flush_group()
+
+    def write_row(out, values):
+        for pack, items in steps:
+            if pack is None:
+                idx, write = items
+                write(out, values[idx])
+            else:
+                out += pack(*[
+                    values[idx] if prepare is None else prepare(values[idx])
+                    for idx, prepare in items
+                ])
+
+    return write_row
+
+
+def encode_row_binary(
+    types: TypeRegistry, names: List[str], type_strs: List[str],
+    rows: Iterable[Mapping],
+) -> bytearray:
+    """ Encodes rows (mappings with `names` as keys) in RowBinary format """
+    write_row = make_row_writer([
+        parse_binary_column(types, type_str) for type_str in type_strs
+    ])
+    to_binary = types.to_binary # lookup optimization
+    out = bytearray()
+    for row in rows:
+        if len(row) != len(names):
+            raise ValueError(
+                f'All rows must have the same set of columns {names}, got '
+                f'{list(row)}'
+            )
+        try:
+            values = [to_binary(row[name]) for name in names]
+        except KeyError as exc:
+            raise ValueError(
+                f'All rows must have the same set of columns {names}, got '
+                f'{list(row)}'
+            ) from exc
+        write_row(out, values)
+    return out
@@ -0,0 +1,58 @@
+from collections import OrderedDict, namedtuple
+import threading
+from typing import Any, Callable, Hashable
+
+
+__all__ = ['CacheInfo', 'LRUCache']
+
+
+# The same fields as for `functools.lru_cache()`
+CacheInfo = namedtuple('CacheInfo', ['hits', 'misses', 'maxsize', 'currsize'])
+
+
+class LRUCache:
+    """ Bounded mapping discarding least recently used items
+
+    Safe to use from several threads, e.g. when results are decoded in
+    executor.  `factory` is called without lock, so concurrent misses may
+    create the value more than once.
+    """
+
+    def __init__(self, maxsize: int = 1024):
+        self.maxsize = maxsize
+        self._data: OrderedDict = OrderedDict()
+        self._hits = self._misses = 0
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable, factory: Callable[[], Any]) -> Any:
+        """ Returns cached value or stores the one created with `factory` """
+        with self._lock:
+            try:
+                value = self._data[key]
+            except KeyError:
+                self._misses += 1
+            else:
+                self._hits += 1
+                self._data.move_to_end(key)
+                return value
+
+        value = factory()
+        if self.maxsize > 0:
+            with self._lock:
+                self._data[key] = value
+                if len(self._data) > self.maxsize:
+                    self._data.popitem(last=False)
+        return value
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self._hits = self._misses = 0
+
+    def __reduce__(self):
+        # Pickled empty: cached values (e.g. generated functions) might be not
+        # picklable, while the owner is passed to worker process
+        return type(self), (self.maxsize,)
+
+    def info(self) -> CacheInfo:
+        return CacheInfo(self._hits, self._misses, self.maxsize, len(self._data))
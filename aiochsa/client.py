@@ -1,27 +1,143 @@
+from collections import deque
+from concurrent.futures import Executor
+from functools import partial
+from itertools import chain
 import logging
-import simplejson as json
-from typing import Any, AsyncGenerator, Iterable, List, Optional
+from typing import (
+    Any, AsyncGenerator, AsyncIterator, Callable, Deque, Dict, Iterable,
+    Iterator, List, Mapping, Optional, Sequence, Tuple, Union,
+)
 
 import aiohttp
+from sqlalchemy import Table
+from sqlalchemy.sql.ddl import DDLElement
+from sqlalchemy.sql.dml import Insert
 
+from .binary import (
+    ROW_BINARY, ROW_BINARY_INSERT, encode_row_binary, parse_row_binary,
+    parse_row_binary_columns, parse_row_binary_column_list,
+    set_datetime_timezone, RowBinaryDecodeError, RowBinaryParser,
+)
+from .cache import CacheInfo
 from .compiler import Compiler, Statement
-from .dialect import ClickhouseSaDialect
-from .exc import DBException, ProtocolError, exc_message_re
-from .parser import parse_json_compact, JSONDecodeError
-from .record import Record
-from .types import TypeRegistry
+from .compression import (
+    NATIVE, BodyCompressor, BodyDecompressor, CompressionInfo,
+    DecompressionError,
+)
+from .dialect import ClickhouseSaDialect, JSON_EACH_ROW
+from . import error_codes
+from .exc import DBException, ProtocolError, RecentRows, exc_message_re
+from .json_codec import JSONCodec, encode_json_each_row, get_json_codec
+from .offload import OffloadInfo, Offloader, decode_rows, rows_from_columns
+from .parser import (
+    JSON_COMPACT, JSON_COMPACT_EACH_ROW, parse_json_compact,
+    parse_json_compact_columns, parse_json_compact_column_list,
+    JSONCompactEachRowParser, JSONDecodeError,
+)
+from .record import RowFactory, record_factory, tuple_factory
+from .types import (
+    DEFAULT_CONVERTES, FAST_WIRE_CONVERTERS, FAST_WIRE_SETTINGS, TypeRegistry,
+    UnixDateTimeType, UnixDateTimeUTCType,
+)
 
 
 logger = logging.getLogger(__name__)
 sql_logger = logging.getLogger(f'{__name__}.SQL')
 
 
+async def _iter_lines(chunks: AsyncIterator[bytes]) -> AsyncIterator[bytes]:
+    # `StreamReader.readline()` fails on lines exceeding buffer limit, while
+    # rows can be arbitrary long
+    buffer = bytearray()
+    async for chunk in chunks:
+        pos = chunk.rfind(b'\n')
+        if pos == -1:
+            buffer += chunk
+            continue
+        buffer += chunk[:pos]
+        lines = bytes(buffer).split(b'\n')
+        buffer = bytearray(chunk[pos + 1:])
+        for line in lines:
+            yield line
+    if buffer:
+        yield bytes(buffer)
+
+
+async def _aiter_sync(rows: Iterator) -> AsyncIterator:
+    for row in rows:
+        yield row
+
+
+# Boolean flags might come from DSN as strings
+_BOOL_STRINGS = {
+    '1': True, 'true': True, 'yes': True, 'on': True,
+    '0': False, 'false': False, 'no': False, 'off': False,
+}
+
+
+def _parse_bool(value) -> bool:
+    if isinstance(value, str):
+        try:
+            return _BOOL_STRINGS[value.lower()]
+        except KeyError:
+            raise ValueError(f'Invalid boolean value {value!r}') from None
+    return bool(value)
+
+
+def is_row_stream(args) -> bool:
+    """ Checks whether single iterator (e.g. generator) or asynchronous
+    iterable of rows is passed instead of multiple rows for `INSERT`.  Such
+    rows are consumed while sending, so the query can't be retried.
+    """
+    return len(args) == 1 and (
+        hasattr(args[0], '__aiter__') or isinstance(args[0], Iterator)
+    )
+
+
+def _row_source(args) -> Optional[AsyncIterator[Mapping]]:
+    if not is_row_stream(args):
+        return None
+    if hasattr(args[0], '__aiter__'):
+        return args[0].__aiter__()
+    return _aiter_sync(args[0])
+
+
 class Client:
 
+    # Size of data tail to search exception in when it's reported after
+    # streaming some binary data
+    EXCEPTION_SEARCH_SIZE = 64 * 1024
+
+    # Minimal size of response to decode in `decode_executor`
+    DEFAULT_DECODE_THRESHOLD = 4 * 1024 * 1024
+
+    # Number of insert rows encoded at once in `encode_executor`
+    DEFAULT_ENCODE_CHUNK_SIZE = 20_000
+
+    # Number of rows from iterator encoded and sent at once
+    DEFAULT_INSERT_CHUNK_SIZE = 1000
+
+    # Number of recently sent rows from iterator kept for exception details
+    RECENT_ROWS_SIZE = 1000
+
+    # Minimal size of request body chunk to compress in executor
+    DEFAULT_COMPRESS_REQUEST_THRESHOLD = 256 * 1024
+
     def __init__(
         self, session: aiohttp.ClientSession, *, url='http://localhost:8123/',
         user=None, password=None, database='default', compress_response=False,
-        dialect=None, types=None, **settings,
+        dialect=None, types=None, result_format=JSON_COMPACT,
+        insert_format=JSON_EACH_ROW, statement_cache_size=0,
+        row_factory: RowFactory = record_factory, fast_wire=False,
+        json_codec: Union[str, JSONCodec, None] = None,
+        decode_executor: Optional[Executor] = None,
+        decode_threshold=DEFAULT_DECODE_THRESHOLD,
+        encode_executor: Optional[Executor] = None,
+        encode_chunk_size=DEFAULT_ENCODE_CHUNK_SIZE,
+        insert_chunk_size=DEFAULT_INSERT_CHUNK_SIZE,
+        compress_request: Optional[str] = None, compress_request_level=None,
+        compress_request_threshold=DEFAULT_COMPRESS_REQUEST_THRESHOLD,
+        **settings,
     ):
         self._session = session
         self.url = url
@@ -32,96 +148,743 @@ class Client:
             self.params["password"] = password
         if database:
             self.params["database"] = database
-        if compress_response:
+        self._headers = {}
+        # Options of `session.post()` besides headers
+        self._request_options: Dict[str, Any] = {}
+        self._response_decompressor = None
+        # Might come from DSN as string, the rest strings are methods
+        if (
+            isinstance(compress_response, str) and
+            compress_response.lower() in _BOOL_STRINGS
+        ):
+            compress_response = _parse_bool(compress_response)
+        if compress_response is True:
+            # Negotiated and decompressed by aiohttp
             self.params["enable_http_compression"] = 1
+        elif compress_response:
+            self._response_decompressor = BodyDecompressor(compress_response)
+            if compress_response == NATIVE:
+                self.params["compress"] = 1
+            else:
+                self.params["enable_http_compression"] = 1
+                self._headers['Accept-Encoding'] = compress_response
+                # Per request option requires aiohttp 3.9
+                self._request_options['auto_decompress'] = False
+        fast_wire = _parse_bool(fast_wire)
+        if fast_wire:
+            self.params.update(FAST_WIRE_SETTINGS)
         self.params.update(settings)
         if dialect is None: # pragma: no cover
             # XXX Do we actualy need the ability to pass custom dialect?
             dialect = ClickhouseSaDialect()
         if types is None:
-            types = TypeRegistry()
+            types = TypeRegistry(
+                FAST_WIRE_CONVERTERS if fast_wire else DEFAULT_CONVERTES
+            )
+        elif fast_wire and not issubclass(
+            types['DateTime'], (UnixDateTimeType, UnixDateTimeUTCType),
+        ):
+            raise ValueError(
+                'fast_wire requires converter of DateTime from Unix timestamp '
+                '(e.g. from FAST_WIRE_CONVERTERS) in types'
+            )
         self._types = types
-        self._compiler = Compiler(dialect=dialect, escape=types.escape)
+        self._compiler = Compiler(
+            dialect=dialect, escape=types.escape,
+            # Might come from DSN as string
+            cache_size=int(statement_cache_size),
+        )
+        self._result_format = self._check_result_format(result_format)
+        self._insert_format = self._check_insert_format(insert_format)
+        self._row_factory = row_factory
+        self._json_codec = get_json_codec(json_codec)
+        # Thresholds might come from DSN as strings
+        self._decode_offloader = Offloader(
+            decode_executor, int(decode_threshold),
+        )
+        self._encode_offloader = Offloader(
+            encode_executor, int(encode_chunk_size),
+        )
+        self._insert_chunk_size = int(insert_chunk_size)
+        self._request_compressor = None
+        # Set when server turns out to be older than 20.1
+        self._stream_json_unsupported = False
+        if compress_request:
+            if compress_request_level is not None:
+                compress_request_level = int(compress_request_level)
+            self._request_compressor = BodyCompressor(
+                compress_request, compress_request_level,
+                int(compress_request_threshold),
+            )
+            self._headers['Content-Encoding'] = compress_request
+        # Column types of tables used for inserts in RowBinary format
+        self._table_columns: Dict[str, Dict[str, str]] = {}
+        self._server_timezone: Optional[str] = None
+
+    @staticmethod
+    def _check_result_format(result_format):
+        if result_format not in (JSON_COMPACT, ROW_BINARY):
+            raise ValueError(f'Unsupported result format {result_format!r}')
+        return result_format
+
+    @staticmethod
+    def _check_insert_format(insert_format):
+        if insert_format not in (JSON_EACH_ROW, ROW_BINARY_INSERT):
+            raise ValueError(f'Unsupported insert format {insert_format!r}')
+        return insert_format
+
+    def statement_cache_info(self) -> CacheInfo:
+        """ Returns statistics of compiled statements cache """
+        return self._compiler.cache_info()
+
+    def decode_info(self) -> OffloadInfo:
+        """ Returns statistics of results decoded in `decode_executor` """
+        return self._decode_offloader.info()
+
+    def encode_info(self) -> OffloadInfo:
+        """ Returns statistics of insert rows encoded in `encode_executor` """
+        return self._encode_offloader.info()
+
+    def request_compression_info(self) -> CompressionInfo:
+        """ Returns total size of request bodies before and after
+        compression
+        """
+        if self._request_compressor is None:
+            return CompressionInfo(0, 0)
+        return self._request_compressor.info()
+
+    def response_compression_info(self) -> CompressionInfo:
+        """ Returns total size of response bodies after and before
+        decompression (only when decompressed by client itself)
+        """
+        if self._response_decompressor is None:
+            return CompressionInfo(0, 0)
+        return self._response_decompressor.info()
 
-    async def _execute(self, statement: Statement, *args) -> Iterable[Record]:
-        compiled, json_each_row_parameters = self._compiler.compile_statement(
-            statement, args,
+    def clear_table_cache(self):
+        """ Forget column types of tables cached for RowBinary inserts
+
+        Must be called after changing structure of tables with other
+        connection.
+        """
+        self._table_columns.clear()
+
+    async def _get_server_timezone(self) -> str:
+        if self._server_timezone is None:
+            self._server_timezone = await self.fetchval('SELECT timezone()')
+        return self._server_timezone
+
+    async def _get_column_types(self, table, names) -> List[str]:
+        table_name = self._compiler.format_table(table)
+        column_types = self._table_columns.get(table_name)
+        if column_types is None:
+            column_types = {
+                name: type_str
+                for name, type_str, *_ in await self._execute(
+                    f'DESCRIBE TABLE {table_name}', result_format=JSON_COMPACT,
+                    row_factory=tuple_factory,
+                )
+            }
+            if any('DateTime' in type_str for type_str in column_types.values()):
+                # Naive values are packed in server timezone, like server
+                # reads them from JSON
+                tz_name = await self._get_server_timezone()
+                column_types = {
+                    name: set_datetime_timezone(type_str, tz_name)
+                    for name, type_str in column_types.items()
+                }
+            self._table_columns[table_name] = column_types
+        try:
+            return [column_types[name] for name in names]
+        except KeyError as exc:
+            # Probably the structure is changed since it's cached
+            del self._table_columns[table_name]
+            raise ValueError(
+                f'There is no column {exc.args[0]!r} in table {table_name}'
+            ) from exc
+
+    @staticmethod
+    def _exception_from_body(
+        body: bytes, *, statement, rows,
+    ) -> Optional[DBException]:
+        # Exception occured after sending some data is appended to it
+        body_str = body.decode(errors='replace')
+        m = exc_message_re.search(body_str)
+        if not m:
+            return None
+        return DBException.from_message(
+            body_str[m.start():], statement=statement, rows=rows,
+        )
+
+    async def _encode_rows(self, encoder, rows) -> list:
+        """ Returns list of `encoder()` results for chunks of rows, which are
+        encoded concurrently in `encode_executor` when there are enough of
+        them
+        """
+        offloader = self._encode_offloader
+        if not offloader.should_offload(len(rows)):
+            return [encoder(rows)]
+        return await offloader.run_chunked(encoder, rows, offloader.threshold)
+
+    async def _prepare(self, statement: Statement, args, insert_format=None):
+        if insert_format is None:
+            insert_format = self._insert_format
+        else:
+            self._check_insert_format(insert_format)
+
+        row_source = _row_source(args)
+        if row_source is not None:
+            return await self._prepare_stream(
+                statement, row_source, insert_format,
+            )
+
+        compiled, insert_parameters, insert_format = (
+            self._compiler.compile_statement(statement, args, insert_format)
         )
         sql_logger.debug(compiled)
-        compiled_with_params = compiled
-        rows = None
-        if json_each_row_parameters:
-            to_json = self._types.to_json # lookup optimization
-            rows = [
-                json.dumps(
-                    {name: to_json(value) for name, value in row.items()},
-                    use_decimal=True,
-                )
-                for row in json_each_row_parameters
-            ]
+
+        if isinstance(statement, DDLElement):
+            # Structure of tables might be changed
+            self.clear_table_cache()
+
+        if insert_format == ROW_BINARY_INSERT:
+            # Only `INSERT` is compiled for this format
+            assert isinstance(statement, Insert)
+            names = list(insert_parameters[0])
+            type_strs = await self._get_column_types(statement.table, names)
+            # There are no textual rows, so mappings are used for
+            # exception details
+            rows = insert_parameters
             if sql_logger.isEnabledFor(logging.DEBUG):
                 for idx, row in enumerate(rows):
                     sql_logger.debug(f'{idx}: {row}')
-            compiled_with_params += '\n' + '\n'.join(rows)
+            encoded = await self._encode_rows(
+                partial(encode_row_binary, self._types, names, type_strs),
+                rows,
+            )
+            data = b''.join([compiled.encode(), b'\n', *encoded])
+            return compiled, rows, data
+
+        if not insert_parameters:
+            return compiled, None, compiled.encode()
+        rows = list(chain.from_iterable(await self._encode_rows(
+            partial(encode_json_each_row, self._types, self._json_codec),
+            insert_parameters,
+        )))
+        if sql_logger.isEnabledFor(logging.DEBUG):
+            for idx, row in enumerate(rows):
+                sql_logger.debug(f'{idx}: {row}')
+        return compiled, rows, '\n'.join([compiled, *rows]).encode()
+
+    async def _prepare_stream(
+        self, statement: Statement, row_source: AsyncIterator[Mapping],
+        insert_format,
+    ):
+        """ Returns generator of body chunks, rows are encoded as it's
+        consumed
+        """
+        try:
+            first_row = await row_source.__anext__()
+        except StopAsyncIteration:
+            # Nothing to insert, while columns are unknown
+            compiled, _, _ = self._compiler.compile_statement(
+                statement, (), JSON_EACH_ROW,
+            )
+            sql_logger.debug(compiled)
+            return compiled, None, compiled.encode()
+
+        compiled, _, insert_format = self._compiler.compile_statement(
+            statement, (first_row,), insert_format,
+        )
+        if insert_format is None:
+            raise TypeError('Iterator of rows is supported for INSERT only')
+        sql_logger.debug(compiled)
+
+        encoder: Callable
+        if insert_format == ROW_BINARY_INSERT:
+            assert isinstance(statement, Insert)
+            names = list(first_row)
+            type_strs = await self._get_column_types(statement.table, names)
+            encoder = partial(encode_row_binary, self._types, names, type_strs)
+        else:
+            encoder = partial(
+                encode_json_each_row, self._types, self._json_codec,
+            )
+        rows = RecentRows(self.RECENT_ROWS_SIZE)
+        data = self._stream_rows(
+            compiled, first_row, row_source, encoder,
+            textual = insert_format != ROW_BINARY_INSERT,
+            recent_rows = rows,
+        )
+        return compiled, rows, data
+
+    async def _stream_rows(
+        self, compiled: str, first_row: Mapping,
+        row_source: AsyncIterator[Mapping], encoder, *, textual: bool,
+        recent_rows: RecentRows,
+    ) -> AsyncIterator[bytes]:
+        yield compiled.encode() + b'\n'
+        chunk = [first_row]
+        async for row in row_source:
+            chunk.append(row)
+            if len(chunk) >= self._insert_chunk_size:
+                yield await self._encode_chunk(
+                    encoder, chunk, textual, recent_rows,
+                )
+                chunk = []
+        if chunk:
+            yield await self._encode_chunk(
+                encoder, chunk, textual, recent_rows,
+            )
+
+    async def _encode_chunk(
+        self, encoder, chunk: List[Mapping], textual: bool,
+        recent_rows: RecentRows,
+    ) -> bytes:
+        encoded = await self._encode_rows(encoder, chunk)
+        if textual:
+            # Lines of `JSONEachRow` are used for exception details
+            rows = list(chain.from_iterable(encoded))
+            data = ''.join([row + '\n' for row in rows]).encode()
+        else:
+            rows = chunk
+            data = b''.join(encoded)
+        if sql_logger.isEnabledFor(logging.DEBUG):
+            for idx, row in enumerate(rows, len(recent_rows)):
+                sql_logger.debug(f'{idx}: {row}')
+        recent_rows.extend(rows)
+        return data
+
+    async def _compress(
+        self, data: Union[bytes, AsyncIterator[bytes]],
+    ) -> Union[bytes, AsyncIterator[bytes]]:
+        compressor = self._request_compressor
+        if compressor is None:
+            return data
+        if isinstance(data, bytes):
+            return await compressor.compress(data)
+        return compressor.compress_stream(data)
+
+    def _iter_content(
+        self, response: aiohttp.ClientResponse,
+    ) -> AsyncIterator[bytes]:
+        """ Returns iterator over chunks of response body, decompressed ones
+        when response is compressed with method chosen by `compress_response`
+        """
+        chunks = response.content.iter_any()
+        decompressor = self._response_decompressor
+        if decompressor is None:
+            return chunks
+        if decompressor.method == NATIVE:
+            # Errors reported before sending result are not compressed
+            compressed = response.status == 200
+        else:
+            compressed = (
+                response.headers.get(aiohttp.hdrs.CONTENT_ENCODING) ==
+                    decompressor.method
+            )
+        if not compressed:
+            return chunks
+        return decompressor.decompress_stream(chunks)
+
+    async def _read_body(self, response: aiohttp.ClientResponse) -> bytes:
+        if self._response_decompressor is None:
+            return await response.read()
+        return b''.join([
+            chunk async for chunk in self._iter_content(response)
+        ])
+
+    def _resolve_result_format(self, result_format):
+        if result_format is None:
+            return self._result_format
+        return self._check_result_format(result_format)
 
+    def _request_params(
+        self, result_format, query_id: Optional[str],
+    ) -> Dict[str, Any]:
+        params = {'default_format': result_format, **self.params}
+        if query_id is not None:
+            params['query_id'] = query_id
+        return params
+
+    async def _post(
+        self, compiled: str, rows, data: Union[bytes, AsyncIterator[bytes]],
+        result_format, query_id: Optional[str] = None,
+    ) -> Tuple[str, bytes]:
+        """ Sends prepared query and returns content type and body of
+        response
+        """
         # First attempt may fail due to broken state of aiohttp session
-        # (aiohttp doesn't handle connection closing properly?)
-        for retrying in [False, True]:
+        # (aiohttp doesn't handle connection closing properly?).  Streamed
+        # data can't be sent twice.
+        attempts = [False, True] if isinstance(data, bytes) else [True]
+        data = await self._compress(data)
+        for retrying in attempts:
             try:
                 async with self._session.post(
                     self.url,
-                    params = {'default_format': 'JSONCompact', **self.params},
-                    data = compiled_with_params.encode(),
+                    params = self._request_params(result_format, query_id),
+                    data = data,
+                    headers = self._headers,
+                    **self._request_options,
                 ) as response:
-                    body = await response.read()
+                    body = await self._read_body(response)
                     if response.status != 200:
                         raise DBException.from_message(
                             body.decode(errors='replace'),
                             statement=compiled, rows=rows,
                         )
-
-                    elif response.content_type == 'application/json':
-                        try:
-                            return parse_json_compact(self._types, body)
-                        except JSONDecodeError:
-                            body_str = body.decode(errors='replace')
-                            m = exc_message_re.search(body_str)
-                            if not m:
-                                raise
-                            raise DBException.from_message(
-                                body_str[m.start():],
-                                statement=compiled, rows=rows,
-                            )
-                    else:
-                        return ()
+                    return response.content_type, body
             except aiohttp.ClientError as exc:
                 if retrying:
                     raise ProtocolError(exc) from exc
                 logger.debug(f'First attempt failed, retrying (error: {exc})')
+            except DecompressionError as exc:
+                raise ProtocolError(exc) from exc
 
         assert False, 'Unreachable'  # To silence mypy
 
+    async def _decode(
+        self, decoder, body: bytes, *, statement, rows,
+        errors=(JSONDecodeError, RowBinaryDecodeError),
+    ):
+        try:
+            offloader = self._decode_offloader
+            if offloader.should_offload(len(body)):
+                return await offloader.run(
+                    decoder, self._types, body, size=len(body),
+                )
+            return decoder(self._types, body)
+        except errors:
+            exc = self._exception_from_body(
+                body, statement=statement, rows=rows,
+            )
+            if exc is None:
+                raise
+            raise exc
+
+    async def _execute(
+        self, statement: Statement, *args, result_format=None,
+        insert_format=None, row_factory: Optional[RowFactory] = None,
+        query_id: Optional[str] = None,
+    ) -> Iterable[Any]:
+        result_format = self._resolve_result_format(result_format)
+        compiled, rows, data = await self._prepare(
+            statement, args, insert_format,
+        )
+        content_type, body = await self._post(
+            compiled, rows, data, result_format, query_id,
+        )
+        return await self._decode_result(
+            content_type, body, statement=compiled, rows=rows,
+            row_factory=row_factory,
+        )
+
+    async def _decode_result(
+        self, content_type: str, body: bytes, *, statement, rows,
+        row_factory: Optional[RowFactory] = None,
+    ) -> Iterable[Any]:
+        if row_factory is None:
+            row_factory = self._row_factory
+        decoder: Callable
+        columns_decoder: Callable
+        if content_type == 'application/json':
+            decoder = partial(
+                parse_json_compact, row_factory=row_factory,
+                codec=self._json_codec,
+            )
+            columns_decoder = partial(
+                parse_json_compact_column_list, codec=self._json_codec,
+            )
+        elif content_type == 'application/octet-stream':
+            decoder = partial(parse_row_binary, row_factory=row_factory)
+            columns_decoder = parse_row_binary_column_list
+        else:
+            return ()
+
+        if self._decode_offloader.should_offload(len(body)):
+            if self._decode_offloader.in_process:
+                # Columns are much cheaper to pickle than rows, and row
+                # factories are not necessary picklable
+                names, columns = await self._decode(
+                    columns_decoder, body, statement=statement, rows=rows,
+                )
+                return rows_from_columns(row_factory, names, columns)
+            decoder = partial(decode_rows, decoder)
+        return await self._decode(
+            decoder, body, statement=statement, rows=rows,
+        )
+
     async def iterate(
-        self, statement: Statement, *args,
-    ) -> AsyncGenerator[Record, None]:
-        for row in await self._execute(statement, *args):
-            yield row
+        self, statement: Statement, *args, result_format=None,
+        insert_format=None, row_factory: Optional[RowFactory] = None,
+        query_id: Optional[str] = None,
+    ) -> AsyncGenerator[Any, None]:
+        if row_factory is None:
+            row_factory = self._row_factory
+        result_format = self._resolve_result_format(result_format)
+        if result_format == JSON_COMPACT:
+            if self._stream_json_unsupported:
+                # Result is downloaded completely before decoding
+                for record in await self._execute(
+                    statement, *args, result_format=result_format,
+                    insert_format=insert_format, row_factory=row_factory,
+                    query_id=query_id,
+                ):
+                    yield record
+                return
+            # Line-delimited variant of the same format
+            result_format = JSON_COMPACT_EACH_ROW
+        compiled, rows, raw_data = await self._prepare(
+            statement, args, insert_format,
+        )
 
-    async def execute(self, statement: Statement, *args) -> None:
-        await self._execute(statement, *args)
+        # Retrying is only possible before any row is yielded, so unlike
+        # `_execute()` it covers sending request only
+        resendable = isinstance(raw_data, bytes)
+        attempts = [False, True] if resendable else [True]
+        data = await self._compress(raw_data)
+        for retrying in attempts:
+            try:
+                response = await self._session.post(
+                    self.url,
+                    params = self._request_params(result_format, query_id),
+                    data = data,
+                    headers = self._headers,
+                    **self._request_options,
+                )
+            except aiohttp.ClientError as exc:
+                if retrying:
+                    raise ProtocolError(exc) from exc
+                logger.debug(f'First attempt failed, retrying (error: {exc})')
+            else:
+                break
 
-    async def fetch(self, statement: Statement, *args) -> List[Record]:
-        return list(await self._execute(statement, *args))
+        async with response:
+            chunks = self._iter_content(response)
+            try:
+                if response.status != 200:
+                    body = b''.join([chunk async for chunk in chunks])
+                    db_exc = DBException.from_message(
+                        body.decode(errors='replace'),
+                        statement=compiled, rows=rows,
+                    )
+                    if not (
+                        result_format == JSON_COMPACT_EACH_ROW and
+                        db_exc.code == error_codes.UNKNOWN_FORMAT
+                    ):
+                        raise db_exc
+                    # The format is added in ClickHouse 20.1, older servers
+                    # get the whole result in `JSONCompact` format
+                    self._stream_json_unsupported = True
+                    if not resendable:
+                        raise db_exc
+                    content_type, body = await self._post(
+                        compiled, rows, raw_data, JSON_COMPACT, query_id,
+                    )
+                    for record in await self._decode_result(
+                        content_type, body, statement=compiled, rows=rows,
+                        row_factory=row_factory,
+                    ):
+                        yield record
+                    return
+
+                if result_format == ROW_BINARY:
+                    # Exception text appended to binary data may be decoded
+                    # as (garbage) rows before the error is detected, so
+                    # recent chunks are kept to search it there.
+                    recent_chunks: Deque[bytes] = deque()
+                    recent_size = 0
+                    binary_parser = RowBinaryParser(self._types, row_factory)
+                    try:
+                        async for chunk in chunks:
+                            recent_chunks.append(chunk)
+                            recent_size += len(chunk)
+                            while (
+                                recent_size - len(recent_chunks[0]) >=
+                                    self.EXCEPTION_SEARCH_SIZE
+                            ):
+                                recent_size -= len(recent_chunks.popleft())
+                            for record in binary_parser.feed(chunk):
+                                yield record
+                        binary_parser.close()
+                    except RowBinaryDecodeError:
+                        body = (
+                            b''.join(recent_chunks) +
+                            b''.join([chunk async for chunk in chunks])
+                        )
+                        db_exc = self._exception_from_body(
+                            body, statement=compiled, rows=rows,
+                        )
+                        if db_exc is None:
+                            raise
+                        raise db_exc
+                    return
+
+                parser = JSONCompactEachRowParser(
+                    self._types, row_factory, self._json_codec,
+                )
+                lines = _iter_lines(chunks)
+                async for line in lines:
+                    try:
+                        record = parser.feed(line)
+                    except JSONDecodeError:
+                        body = b'\n'.join([line, *[
+                            rest async for rest in lines
+                        ]])
+                        db_exc = self._exception_from_body(
+                            body, statement=compiled, rows=rows,
+                        )
+                        if db_exc is None:
+                            raise
+                        raise db_exc
+                    if record is not None:
+                        yield record
+            except (aiohttp.ClientError, DecompressionError) as exc:
+                raise ProtocolError(exc) from exc
 
-    async def fetchrow(self, statement: Statement, *args) -> Optional[Record]:
-        gen = await self._execute(statement, *args)
+    async def execute(self, statement: Statement, *args, **kwargs) -> None:
+        await self._execute(statement, *args, **kwargs)
+
+    async def fetch(
+        self, statement: Statement, *args, **kwargs,
+    ) -> List[Any]:
+        return list(await self._execute(statement, *args, **kwargs))
+
+    async def fetch_columns(
+        self, statement: Statement, *args, result_format=None,
+        insert_format=None, query_id: Optional[str] = None,
+    ) -> Dict[str, Sequence]:
+        """ Returns result as mapping of column names to sequences of values
+
+        Columns of numeric types are returned as `array.array`, the rest
+        as lists.
+        """
+        result_format = self._resolve_result_format(result_format)
+        compiled, rows, data = await self._prepare(
+            statement, args, insert_format,
+        )
+        content_type, body = await self._post(
+            compiled, rows, data, result_format, query_id,
+        )
+        decoder: Callable
+        if content_type == 'application/json':
+            decoder = partial(
+                parse_json_compact_columns, codec=self._json_codec,
+            )
+        elif content_type == 'application/octet-stream':
+            decoder = parse_row_binary_columns
+        else:
+            return {}
+        return await self._decode(
+            decoder, body, statement=compiled, rows=rows,
+        )
+
+    async def fetch_numpy(
+        self, statement: Statement, *args, insert_format=None,
+        query_id: Optional[str] = None,
+    ) -> Dict[str, Any]:
+        """ Returns result as mapping of column names to NumPy arrays
+
+        Requires `numpy` extra.  Result is always requested in
+        `RowBinaryWithNamesAndTypes` format.
+        """
+        from .ndarray import parse_row_binary_numpy
+
+        compiled, rows, data = await self._prepare(
+            statement, args, insert_format,
+        )
+        content_type, body = await self._post(
+            compiled, rows, data, ROW_BINARY, query_id,
+        )
+        if content_type != 'application/octet-stream':
+            return {}
+        return await self._decode(
+            parse_row_binary_numpy, body, statement=compiled, rows=rows,
+        )
+
+    async def fetch_arrow(
+        self, statement: Statement, *args, insert_format=None,
+        query_id: Optional[str] = None,
+    ) -> Any:
+        """ Returns result as `pyarrow.Table`
+
+        Requires `pyarrow` extra.  Result is requested in `ArrowStream`
+        format, so values are never converted to Python objects.
+        """
+        import pyarrow as pa
+        from .arrow import ARROW_STREAM, ArrowDecodeError, parse_arrow_stream
+
+        compiled, rows, data = await self._prepare(
+            statement, args, insert_format,
+        )
+        content_type, body = await self._post(
+            compiled, rows, data, ARROW_STREAM, query_id,
+        )
+        if content_type != 'application/octet-stream':
+            return pa.table({})
+        return await self._decode(
+            parse_arrow_stream, body, statement=compiled, rows=rows,
+            errors=ArrowDecodeError,
+        )
+
+    async def insert_arrow(
+        self, table: Union[str, Table], data, query_id: Optional[str] = None,
+    ) -> None:
+        """ Inserts `pyarrow.Table` or `pyarrow.RecordBatch` into table
+
+        Requires `pyarrow` extra.  Columns are matched by names.
+        """
+        from .arrow import ARROW_STREAM, encode_arrow_stream
+
+        if not isinstance(table, str):
+            table = self._compiler.format_table(table)
+        compiled = f'INSERT INTO {table} FORMAT {ARROW_STREAM}'
+        sql_logger.debug(compiled)
+        await self._post(
+            compiled, None,
+            compiled.encode() + b'\n' + encode_arrow_stream(data),
+            self._result_format, query_id,
+        )
+
+    async def fetchrow(
+        self, statement: Statement, *args, **kwargs,
+    ) -> Optional[Any]:
+        gen = await self._execute(statement, *args, **kwargs)
         return next(iter(gen), None)
 
-    async def fetchval(self, statement: Statement, *args) -> Any:
-        row = await self.fetchrow(statement, *args)
+    async def fetchval(self, statement: Statement, *args, **kwargs) -> Any:
+        # Row object is not exposed, so the cheapest one is used
+        kwargs['row_factory'] = tuple_factory
+        row = await self.fetchrow(statement, *args, **kwargs)
         if row is not None:
             return row[0]
 
+    async def kill_query(self, query_id: str) -> None:
+        """ Asks server to cancel query started with `query_id` (doesn't
+        wait for completion)
+        """
+        await self.execute(
+            f'KILL QUERY WHERE query_id = {self._types.escape(query_id)} ASYNC'
+        )
+
+    async def ping(self) -> None:
+        """ Checks that server is available.  Connection used is kept alive
+        by session, so it's also a way to open connections in advance.
+        """
+        try:
+            async with self._session.get(
+                self.url.rstrip('/') + '/ping',
+            ) as response:
+                body = await response.read()
+        except aiohttp.ClientError as exc:
+            raise ProtocolError(exc) from exc
+        if response.status != 200:
+            raise ProtocolError(
+                f'Unexpected response to ping: {response.status} '
+                f'{body.decode(errors="replace")}'
+            )
+
     def __await__(self):
         # For compartibility with asyncpg (`await pool.acquire(...)`)
         yield from []
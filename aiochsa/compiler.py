@@ -1,23 +1,111 @@
+import re
 from types import SimpleNamespace
 from typing import Union
 
 from sqlalchemy.engine.util import _distill_params
 from sqlalchemy.sql import func, ClauseElement
 from sqlalchemy.sql.ddl import DDLElement
-from sqlalchemy.sql.dml import Insert
+from sqlalchemy.sql.dml import Insert, UpdateBase
+from sqlalchemy.sql.elements import TextClause
 from sqlalchemy.sql.functions import FunctionElement
+from sqlalchemy.sql.selectable import SelectBase
+
+from .cache import CacheInfo, LRUCache
+from .dialect import JSON_EACH_ROW
 
 
 Statement = Union[str, ClauseElement]
 
 
+# Kinds of statements to route them to different hosts
+READ = 'read'
+WRITE = 'write'
+
+# Leading keyword of textual statement, skipping comments and parentheses
+_first_keyword_re = re.compile(r'(?:\s|\(|--[^\n]*|/\*.*?\*/)*(\w*)', re.S)
+
+_READ_KEYWORDS = frozenset([
+    'SELECT', 'WITH', 'SHOW', 'DESCRIBE', 'DESC', 'EXISTS', 'EXPLAIN',
+])
+
+
+def _first_keyword(statement: str) -> str:
+    return _first_keyword_re.match(statement).group(1).upper()  # type: ignore
+
+
+def statement_kind(statement: Statement) -> str:
+    """ Returns `WRITE` for `INSERT`, DDL and other statements modifying
+    data, `READ` for the rest
+    """
+    if isinstance(statement, TextClause):
+        statement = statement.text
+    if isinstance(statement, str):
+        return READ if _first_keyword(statement) in _READ_KEYWORDS else WRITE
+    elif isinstance(statement, (DDLElement, UpdateBase)):
+        return WRITE
+    return READ
+
+
+def is_select(statement: Statement) -> bool:
+    """ Tells whether statement is known to only read data, so that it's
+    safe to run it twice.  Unlike `statement_kind()`, unknown constructs are
+    not considered reads.
+    """
+    if isinstance(statement, TextClause):
+        statement = statement.text
+    if isinstance(statement, str):
+        return _first_keyword(statement) in _READ_KEYWORDS
+    # Functions are executed as `SELECT func()`
+    return isinstance(statement, (SelectBase, FunctionElement))
+
+
 class Compiler:
 
-    def __init__(self, dialect, escape):
+    def __init__(self, dialect, escape, cache_size=0):
         self._dialect = dialect
         self._escape = escape
-
-    def _execute_clauseelement(self, elem, multiparams):
+        # Like `compiled_cache` execution option of SQLAlchemy, it's keyed by
+        # statement object, since there is no structural cache key in 1.3:
+        # only statements reused by caller benefit from it.  Statements are
+        # referenced from cached values, so that their ids can't be reused
+        # by other objects while cached.
+        self._cache = LRUCache(cache_size)
+
+    def cache_info(self) -> CacheInfo:
+        return self._cache.info()
+
+    def cache_clear(self):
+        self._cache.clear()
+
+    def format_table(self, table) -> str:
+        return self._dialect.identifier_preparer.format_table(table)
+
+    def _compile(self, elem, compile_kwargs, key_elem):
+        def compile_elem():
+            return key_elem, elem.compile(
+                dialect=self._dialect,
+                inline=True, # Never add constructs to return default values
+                compile_kwargs=compile_kwargs,
+            )
+
+        if not self._cache.maxsize:
+            return compile_elem()[1]
+        # Compiled INSERT depends on format and columns of values
+        key = (
+            id(key_elem),
+            compile_kwargs.get('clickhouse_insert_format'),
+            tuple(compile_kwargs.get('clickhouse_insert_columns', ())),
+        )
+        cached_elem, compiled = self._cache.get(key, compile_elem)
+        if cached_elem is not key_elem:
+            # Never happens while reference is kept, but stale result for
+            # other statement would be silently wrong
+            return compile_elem()[1]
+        return compiled
+
+    def _execute_clauseelement(
+        self, elem, multiparams, insert_format=JSON_EACH_ROW, key_elem=None,
+    ):
         # Modeled after `sqlalchemy.engine.base.Connection._execute_clauseelement`
         # (event signaling, caching are removed; separate parameters are merge into
         # clause element)
@@ -41,9 +129,21 @@ class Compiler:
             # pretend that we don't have parameters at all.
             init_compiled_parameters = ()
 
-        compiled_sql = elem.compile(
-            dialect=self._dialect,
-            inline=True, # Never add constructs to return default values
+        compile_kwargs = {}
+        if (
+            isinstance(elem, Insert) and insert_format != JSON_EACH_ROW and
+            distilled_params
+        ):
+            # All rows must have the same set of columns in formats without
+            # column names
+            compile_kwargs = {
+                'clickhouse_insert_format': insert_format,
+                'clickhouse_insert_columns': list(distilled_params[0]),
+            }
+
+        compiled_sql = self._compile(
+            elem, compile_kwargs,
+            key_elem = elem if key_elem is None else key_elem,
         )
         return self._execute_context(
             self._dialect,
@@ -57,7 +157,9 @@ class Compiler:
 
     def _execute_function(self, func, multiparams):
         # Modeled after `sqlalchemy.engine.base.Connection._execute_function`
-        return self._execute_clauseelement(func.select(), multiparams)
+        return self._execute_clauseelement(
+            func.select(), multiparams, key_elem=func,
+        )
 
     def _execute_ddl(self, ddl, multiparams):
         # Modeled after `sqlalchemy.engine.base.Connection._execute_ddl` (event
@@ -81,33 +183,40 @@ class Compiler:
         context = constructor(dialect, conn, db_api_conn, *args)
 
         # Only SQL compiler has this attribute, but not DDL compiler
-        if getattr(statement, '_clickhouse_json_each_row', False):
+        insert_format = getattr(statement, '_clickhouse_insert_format', None)
+        if insert_format is not None:
             # We can't use `context.parameters` here, since we trick
             # `_init_compiled()` to think we have no parameters, meaning
             # they're always empty here.
-            return context.statement, parameters or context.parameters
+            return (
+                context.statement, parameters or context.parameters,
+                insert_format,
+            )
         else:
             assert len(context.parameters) == 1
             escaped = {
                 name: self._escape(value)
                 for name, value in context.parameters[0].items()
             }
-            return context.statement % escaped, ()
+            return context.statement % escaped, (), None
 
 
-    def compile_statement(self, statement: Statement, args):
+    def compile_statement(
+        self, statement: Statement, args, insert_format=JSON_EACH_ROW,
+    ):
+        """ Returns SQL, INSERT values to pass separately and their format
+        """
         if isinstance(statement, str):
             assert not args
-            return statement, args
+            return statement, args, None
         elif isinstance(statement, ClauseElement):
             if isinstance(statement, DDLElement):
-                statement, parameters = self._execute_ddl(statement, args)
+                return self._execute_ddl(statement, args)
             elif isinstance(statement, FunctionElement):
-                statement, parameters = self._execute_function(statement, args)
+                return self._execute_function(statement, args)
             else:
-                statement, parameters = self._execute_clauseelement(
-                    statement, args,
+                return self._execute_clauseelement(
+                    statement, args, insert_format,
                 )
-            return statement, parameters
         else:
             raise TypeError(f'Execution of {type(statement)} is not supported')
@@ -0,0 +1,346 @@
+""" HTTP compression of request bodies and decompression of responses
+
+Only `gzip` and `deflate` methods are supported out of the box, the rest
+require corresponding extra: `zstd` (`zstandard`), `lz4` (`lz4`) and `br`
+(`brotli`).  Native block compression of ClickHouse (`compress=1` parameter)
+requires `lz4` and/or `zstandard` depending on `network_compression_method`
+setting.
+"""
+
+import asyncio
+from collections import namedtuple
+import struct
+from typing import AsyncIterator, Callable, Dict, Optional
+import zlib
+
+
+__all__ = [
+    'COMPRESSORS', 'DECOMPRESSORS', 'NATIVE', 'CompressionInfo',
+    'BodyCompressor', 'BodyDecompressor', 'DecompressionError',
+    'NativeBlockDecompressor', 'make_compressor', 'make_decompressor',
+]
+
+
+# Pseudo-method for native block compression of ClickHouse
+NATIVE = 'native'
+
+
+class DecompressionError(ValueError):
+    """ Response data is malformed or incomplete """
+
+
+# Total size of data before and after compression
+CompressionInfo = namedtuple('CompressionInfo', ['uncompressed', 'compressed'])
+
+
+class _LZ4Compressor:
+    # Adapts `LZ4FrameCompressor` to `compress()`/`flush()` interface
+
+    def __init__(self, level: Optional[int]):
+        import lz4.frame
+        self._compressor = lz4.frame.LZ4FrameCompressor(
+            compression_level=level or 0,
+        )
+        self._header = self._compressor.begin()
+
+    def compress(self, data: bytes) -> bytes:
+        header, self._header = self._header, b''
+        return header + self._compressor.compress(data)
+
+    def flush(self) -> bytes:
+        header, self._header = self._header, b''
+        return header + self._compressor.flush()
+
+
+class _BrotliCompressor:
+    # Adapts `brotli.Compressor` to `compress()`/`flush()` interface
+
+    def __init__(self, level: Optional[int]):
+        import brotli
+        if level is None:
+            self._compressor = brotli.Compressor()
+        else:
+            self._compressor = brotli.Compressor(quality=level)
+
+    def compress(self, data: bytes) -> bytes:
+        return self._compressor.process(data)
+
+    def flush(self) -> bytes:
+        return self._compressor.finish()
+
+
+def _zstd_compressor(level: Optional[int]):
+    import zstandard
+    if level is None:
+        return zstandard.ZstdCompressor().compressobj()
+    return zstandard.ZstdCompressor(level=level).compressobj()
+
+
+# Factories of objects with `compress()` and `flush()` methods (like
+# `zlib.compressobj()`) for values of `Content-Encoding` header
+COMPRESSORS: Dict[str, Callable] = {
+    'gzip': lambda level: zlib.compressobj(
+        zlib.Z_DEFAULT_COMPRESSION if level is None else level,
+        zlib.DEFLATED, 16 + zlib.MAX_WBITS,
+    ),
+    'deflate': lambda level: zlib.compressobj(
+        zlib.Z_DEFAULT_COMPRESSION if level is None else level,
+    ),
+    'zstd': _zstd_compressor,
+    'lz4': _LZ4Compressor,
+    'br': _BrotliCompressor,
+}
+
+
+def make_compressor(method: str, level: Optional[int] = None):
+    try:
+        factory = COMPRESSORS[method]
+    except KeyError:
+        raise ValueError(
+            f'Unsupported compression method {method!r}'
+        ) from None
+    return factory(level)
+
+
+class BodyCompressor:
+    """ Compresses request bodies with `method`
+
+    Chunks of `threshold` bytes or larger are compressed in default executor
+    of event loop (all supported libraries release GIL while compressing).
+    """
+
+    def __init__(
+        self, method: str, level: Optional[int] = None,
+        threshold: int = 256 * 1024,
+    ):
+        # Fail early for unknown methods and missing libraries
+        make_compressor(method, level)
+        self.method = method
+        self.level = level
+        self.threshold = threshold
+        self._uncompressed = self._compressed = 0
+
+    async def _compress_chunk(self, compressor, data: bytes) -> bytes:
+        if len(data) >= self.threshold:
+            loop = asyncio.get_running_loop()
+            result = await loop.run_in_executor(
+                None, compressor.compress, data,
+            )
+        else:
+            result = compressor.compress(data)
+        self._uncompressed += len(data)
+        self._compressed += len(result)
+        return result
+
+    def _flush(self, compressor) -> bytes:
+        result = compressor.flush()
+        self._compressed += len(result)
+        return result
+
+    async def compress(self, data: bytes) -> bytes:
+        compressor = make_compressor(self.method, self.level)
+        result = await self._compress_chunk(compressor, data)
+        return result + self._flush(compressor)
+
+    async def compress_stream(
+        self, chunks: AsyncIterator[bytes],
+    ) -> AsyncIterator[bytes]:
+        compressor = make_compressor(self.method, self.level)
+        async for chunk in chunks:
+            result = await self._compress_chunk(compressor, chunk)
+            # Compressors buffer input, so result is often empty
+            if result:
+                yield result
+        yield self._flush(compressor)
+
+    def info(self) -> CompressionInfo:
+        return CompressionInfo(self._uncompressed, self._compressed)
+
+
+class _ZlibDecompressor:
+
+    def __init__(self, wbits: int):
+        self._decompressor = zlib.decompressobj(wbits)
+
+    def decompress(self, data: bytes) -> bytes:
+        try:
+            return self._decompressor.decompress(data)
+        except zlib.error as exc:
+            raise DecompressionError(str(exc)) from exc
+
+    def flush(self) -> bytes:
+        if not self._decompressor.eof:
+            raise DecompressionError('Incomplete compressed data')
+        return self._decompressor.flush()
+
+
+class _ZstdDecompressor:
+
+    def __init__(self):
+        import zstandard
+        self._error = zstandard.ZstdError
+        self._decompressor = zstandard.ZstdDecompressor().decompressobj()
+
+    def decompress(self, data: bytes) -> bytes:
+        try:
+            return self._decompressor.decompress(data)
+        except self._error as exc:
+            raise DecompressionError(str(exc)) from exc
+
+    def flush(self) -> bytes:
+        return b''
+
+
+class _LZ4Decompressor:
+
+    def __init__(self):
+        import lz4.frame
+        self._decompressor = lz4.frame.LZ4FrameDecompressor()
+
+    def decompress(self, data: bytes) -> bytes:
+        try:
+            return self._decompressor.decompress(data)
+        except RuntimeError as exc:
+            raise DecompressionError(str(exc)) from exc
+
+    def flush(self) -> bytes:
+        if not self._decompressor.eof:
+            raise DecompressionError('Incomplete compressed data')
+        return b''
+
+
+class _BrotliDecompressor:
+
+    def __init__(self):
+        import brotli
+        self._error = brotli.error
+        self._decompressor = brotli.Decompressor()
+
+    def decompress(self, data: bytes) -> bytes:
+        try:
+            return self._decompressor.process(data)
+        except self._error as exc:
+            raise DecompressionError(str(exc)) from exc
+
+    def flush(self) -> bytes:
+        if not self._decompressor.is_finished():
+            raise DecompressionError('Incomplete compressed data')
+        return b''
+
+
+class NativeBlockDecompressor:
+    """ Decompresses blocks of ClickHouse native compression format
+
+    Each block has header: 16 bytes of CityHash128 checksum (not verified),
+    method byte, 4 bytes of compressed size (including 9 bytes of method and
+    sizes) and 4 bytes of decompressed size.
+    """
+
+    HEADER = struct.Struct('<16xBII')
+
+    METHOD_NONE = 0x02
+    METHOD_LZ4 = 0x82
+    METHOD_ZSTD = 0x90
+
+    def __init__(self):
+        self._buffer = bytearray()
+
+    def _decompress_block(self, method: int, data, size: int) -> bytes:
+        if method == self.METHOD_NONE:
+            return bytes(data)
+        elif method == self.METHOD_LZ4:
+            import lz4.block
+            return lz4.block.decompress(data, uncompressed_size=size)
+        elif method == self.METHOD_ZSTD:
+            import zstandard
+            return zstandard.ZstdDecompressor().decompress(
+                data, max_output_size=size,
+            )
+        raise DecompressionError(f'Unknown compression method {method:#x}')
+
+    def decompress(self, data: bytes) -> bytes:
+        buffer = self._buffer
+        buffer += data
+        result = []
+        pos = 0
+        # Offset of compressed data from the start of block
+        offset = self.HEADER.size - 9
+        while len(buffer) - pos >= self.HEADER.size:
+            method, compressed_size, size = self.HEADER.unpack_from(
+                buffer, pos,
+            )
+            end = pos + offset + compressed_size
+            if len(buffer) < end:
+                break
+            with memoryview(buffer) as view:
+                block = view[pos + self.HEADER.size:end]
+                try:
+                    result.append(self._decompress_block(method, block, size))
+                except DecompressionError:
+                    raise
+                except Exception as exc:
+                    raise DecompressionError(str(exc)) from exc
+                finally:
+                    block.release()
+            pos = end
+        del buffer[:pos]
+        return b''.join(result)
+
+    def flush(self) -> bytes:
+        if self._buffer:
+            raise DecompressionError('Incomplete compressed data')
+        return b''
+
+
+# Factories of objects with `decompress()` and `flush()` methods (the latter
+# checks that data is complete) for values of `Content-Encoding` header
+DECOMPRESSORS: Dict[str, Callable] = {
+    # Both zlib and gzip headers are accepted
+    'gzip': lambda: _ZlibDecompressor(32 + zlib.MAX_WBITS),
+    'deflate': lambda: _ZlibDecompressor(32 + zlib.MAX_WBITS),
+    'zstd': _ZstdDecompressor,
+    'lz4': _LZ4Decompressor,
+    'br': _BrotliDecompressor,
+    NATIVE: NativeBlockDecompressor,
+}
+
+
+def make_decompressor(method: str):
+    try:
+        factory = DECOMPRESSORS[method]
+    except KeyError:
+        raise ValueError(
+            f'Unsupported compression method {method!r}'
+        ) from None
+    return factory()
+
+
+class BodyDecompressor:
+    """ Decompresses response bodies with `method` chunk by chunk as they are
+    received
+    """
+
+    def __init__(self, method: str):
+        # Fail early for unknown methods and missing libraries
+        make_decompressor(method)
+        self.method = method
+        self._uncompressed = self._compressed = 0
+
+    async def decompress_stream(
+        self, chunks: AsyncIterator[bytes],
+    ) -> AsyncIterator[bytes]:
+        decompressor = make_decompressor(self.method)
+        async for chunk in chunks:
+            self._compressed += len(chunk)
+            result = decompressor.decompress(chunk)
+            self._uncompressed += len(result)
+            # Decompressors buffer input, so result is often empty
+            if result:
+                yield result
+        result = decompressor.flush()
+        self._uncompressed += len(result)
+        if result:
+            yield result
+
+    def info(self) -> CompressionInfo:
+        return CompressionInfo(self._uncompressed, self._compressed)
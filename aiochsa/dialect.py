@@ -4,9 +4,14 @@ from sqlalchemy import exc
 from sqlalchemy.sql import crud
 
 
+JSON_EACH_ROW = 'JSONEachRow'
+
+
 class ClickhouseSaSQLCompiler(ClickHouseCompiler):
 
-    _clickhouse_json_each_row = False
+    # Format of INSERT values passed separately from statement (`None` if
+    # there is no such values)
+    _clickhouse_insert_format = None
 
     def get_from_hint_text(self, table, text):
         return text
@@ -60,8 +65,17 @@ class ClickhouseSaSQLCompiler(ClickHouseCompiler):
             # This is normally done by `crud._setup_crud_params()`
             self.isinsert = True
 
-            self._clickhouse_json_each_row = True
-            text += ' FORMAT JSONEachRow'
+            insert_columns = kw.get('clickhouse_insert_columns')
+            if insert_columns is not None:
+                # Required for formats without column names like RowBinary
+                text += " (%s)" % ", ".join(
+                    [preparer.quote(name) for name in insert_columns]
+                )
+
+            self._clickhouse_insert_format = kw.get(
+                'clickhouse_insert_format', JSON_EACH_ROW,
+            )
+            text += f' FORMAT {self._clickhouse_insert_format}'
 
         assert insert_stmt._post_values_clause is None
 
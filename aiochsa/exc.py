@@ -1,5 +1,6 @@
-from collections import namedtuple
+from collections import deque, namedtuple
 import re
+from typing import Deque, Iterable
 
 
 # Based on `getExceptionMessage()`:
@@ -28,6 +29,32 @@ class ProtocolError(AiochsaException):
 RowInfo = namedtuple('RowInfo', ['num', 'content'])
 
 
+class RecentRows:
+    """ Keeps the last `maxsize` of rows sent to server for exception details
+
+    Length is the total number of rows added, while only recent ones can be
+    got by index.
+    """
+
+    def __init__(self, maxsize: int):
+        self._rows: Deque = deque(maxlen=maxsize)
+        self._count = 0
+
+    def extend(self, rows: Iterable):
+        for row in rows:
+            self._rows.append(row)
+            self._count += 1
+
+    def __len__(self):
+        return self._count
+
+    def __getitem__(self, idx: int):
+        offset = idx - (self._count - len(self._rows))
+        if not 0 <= offset < len(self._rows):
+            raise IndexError(idx)
+        return self._rows[offset]
+
+
 class DBException(AiochsaException):
     """ Error returned from Clickhouse database """
 
@@ -64,8 +91,11 @@ class DBException(AiochsaException):
                 if at_row_m:
                     # It's 1-based
                     row_num = int(at_row_m.group('num'))
-                    if len(rows) >= row_num:
+                    try:
                         row = RowInfo(row_num, rows[row_num - 1])
+                    except IndexError:
+                        # Not available or already discarded by `RecentRows`
+                        pass
 
             return cls(
                 code=int(m.group('code')),
@@ -0,0 +1,151 @@
+""" JSON libraries used to decode results and encode values for inserts """
+
+from decimal import Decimal
+import json as stdlib_json
+from typing import Any, Dict, Iterable, List, Mapping, Optional, Type, Union
+
+import simplejson
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover
+    _has_orjson = False
+else:
+    _has_orjson = True
+
+
+__all__ = [
+    'JSONCodec', 'SimplejsonCodec', 'StdlibCodec', 'OrjsonCodec',
+    'JSON_CODECS', 'get_json_codec', 'encode_json_each_row',
+    'JSONDecodeError',
+]
+
+
+JSONDecodeError = simplejson.JSONDecodeError
+
+
+class JSONCodec:
+    """ Base class of JSON library adapters
+
+    `loads()` must raise `JSONDecodeError` for malformed data.  Decimals are
+    required to be exact in both directions: when `exact_floats` is true
+    `loads()` returns non-integer numbers as strings, otherwise they are
+    parsed as `float` and decoding of results with `Decimal` columns is
+    delegated to `simplejson`.  `dumps()` of `Decimal` must produce raw
+    number, since ClickHouse doesn't accept quoted ones, so values the
+    library can't serialize are passed to `simplejson` too.
+    """
+
+    name: str
+    exact_floats = True
+
+    def loads(self, data: Union[bytes, str]) -> Any:
+        raise NotImplementedError()
+
+    def _dumps(self, obj: Any) -> str:
+        raise NotImplementedError()
+
+    def dumps(self, obj: Any) -> str:
+        try:
+            return self._dumps(obj)
+        except TypeError:
+            return _simplejson_dumps(obj)
+
+    def __repr__(self):
+        return f'<{type(self).__name__}>'
+
+
+def _simplejson_dumps(obj: Any) -> str:
+    return simplejson.dumps(obj, use_decimal=True)
+
+
+class SimplejsonCodec(JSONCodec):
+    name = 'simplejson'
+
+    def loads(self, data: Union[bytes, str]) -> Any:
+        return simplejson.loads(data, parse_float=str)
+
+    def dumps(self, obj: Any) -> str:
+        return _simplejson_dumps(obj)
+
+
+class StdlibCodec(JSONCodec):
+    name = 'json'
+
+    def loads(self, data: Union[bytes, str]) -> Any:
+        try:
+            return stdlib_json.loads(data, parse_float=str)
+        except stdlib_json.JSONDecodeError as exc:
+            raise JSONDecodeError(exc.msg, exc.doc, exc.pos) from exc
+
+    def _dumps(self, obj: Any) -> str:
+        # Fails on `Decimal`
+        return stdlib_json.dumps(obj)
+
+
+class OrjsonCodec(JSONCodec):
+    name = 'orjson'
+    exact_floats = False
+
+    def __init__(self):
+        if not _has_orjson:
+            raise ImportError('orjson is not installed')
+
+    @staticmethod
+    def _default(obj: Any) -> Any:
+        # Raw JSON is supported since orjson 3.9
+        if isinstance(obj, Decimal) and hasattr(orjson, 'Fragment'):
+            return orjson.Fragment(str(obj))
+        raise TypeError(f'Type is not JSON serializable: {type(obj)}')
+
+    def loads(self, data: Union[bytes, str]) -> Any:
+        try:
+            return orjson.loads(data)
+        except orjson.JSONDecodeError as exc:
+            raise JSONDecodeError(exc.msg, exc.doc, exc.pos) from exc
+
+    def _dumps(self, obj: Any) -> str:
+        return orjson.dumps(obj, default=self._default).decode()
+
+
+# In order of preference
+JSON_CODECS: Dict[str, Type[JSONCodec]] = {
+    codec_class.name: codec_class
+    for codec_class in [OrjsonCodec, SimplejsonCodec, StdlibCodec]
+}
+
+_default_codec: Optional[JSONCodec] = None
+
+
+def get_json_codec(codec: Union[str, JSONCodec, None] = None) -> JSONCodec:
+    """ Returns codec by name, or the fastest installed one for `None` """
+    global _default_codec
+    if isinstance(codec, JSONCodec):
+        return codec
+    if codec is not None:
+        try:
+            codec_class = JSON_CODECS[codec]
+        except KeyError:
+            raise ValueError(f'Unsupported JSON codec {codec!r}') from None
+        return codec_class()
+    if _default_codec is None:
+        for codec_class in JSON_CODECS.values():
+            try:
+                _default_codec = codec_class()
+            except ImportError:
+                continue
+            break
+    return _default_codec  # type: ignore
+
+
+def encode_json_each_row(
+    types, codec: JSONCodec, rows: Iterable[Mapping],
+) -> List[str]:
+    """ Encodes rows of insert values (`JSONEachRow` format lines) """
+    # Lookup optimization
+    to_json = types.to_json
+    dumps = codec.dumps
+    return [
+        dumps({name: to_json(value) for name, value in row.items()})
+        for row in rows
+    ]
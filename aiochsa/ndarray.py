@@ -0,0 +1,196 @@
+""" Conversion of results in RowBinary format to NumPy arrays
+
+Requires `numpy` extra.
+"""
+
+from collections import namedtuple
+import struct
+from typing import Dict, List
+
+from lark import Transformer, v_args
+import numpy as np
+
+from .binary import (
+    FIXED_FORMATS, BinaryColumn, RowBinaryDecodeError, make_row_reader,
+    parse_binary_column, read_header,
+)
+from .parser import type_parser
+from .types import TypeRegistry
+
+
+__all__ = ['parse_row_binary_numpy']
+
+
+# Types stored in RowBinary format exactly as in NumPy arrays, so that
+# arrays can refer to response data directly
+NUMPY_TYPES = [
+    'UInt8', 'UInt16', 'UInt32', 'UInt64',
+    'Int8', 'Int16', 'Int32', 'Int64',
+    'Float32', 'Float64',
+    'Date', 'DateTime',
+]
+
+# Stored as number of units since the epoch
+DATETIME64_DTYPES = {
+    'Date': np.dtype('datetime64[D]'),
+    'DateTime': np.dtype('datetime64[s]'),
+}
+
+
+# Description of array for column.  `fmt` (`struct` format character) is set
+# for types from `NUMPY_TYPES` only, other columns are returned as arrays of
+# Python objects.
+NumpyColumn = namedtuple('NumpyColumn', ['fmt', 'datetime64', 'nullable'])
+
+_OBJECT_COLUMN = NumpyColumn(None, None, False)
+
+
+@v_args(inline=True)
+class NumpyTypeTransformer(Transformer):
+    """ Builds `NumpyColumn` from type tree """
+
+    def start(self, column):
+        return column
+
+    def composite_type(self, name, *columns):
+        if name == 'LowCardinality':
+            return columns[0]
+        elif name == 'Nullable':
+            return columns[0]._replace(nullable=True)
+        else:
+            return _OBJECT_COLUMN
+
+    def aggregate_type(self, name, func, column):
+        if name == 'SimpleAggregateFunction':
+            return column
+        return _OBJECT_COLUMN
+
+    def simple_type(self, name, *params):
+        if name in NUMPY_TYPES:
+            return NumpyColumn(
+                FIXED_FORMATS[name], DATETIME64_DTYPES.get(name), False,
+            )
+        return _OBJECT_COLUMN
+
+
+def parse_numpy_column(type_str: str) -> NumpyColumn:
+    tree = type_parser.parse(type_str)
+    return NumpyTypeTransformer().transform(tree)
+
+
+def _to_datetime64(array, column: NumpyColumn):
+    if column.datetime64 is None:
+        return array
+    return array.astype(column.datetime64)
+
+
+def _raw_nullable_column(column: BinaryColumn, fmt: str) -> BinaryColumn:
+    # Reads values of `Nullable()` column without conversion to Python
+    # objects (e.g. `date`)
+    unpack_from = struct.Struct('<' + fmt).unpack_from
+    size = struct.calcsize('<' + fmt)
+
+    def read(buf, pos):
+        if buf[pos]:
+            return None, pos + 1
+        return unpack_from(buf, pos + 1)[0], pos + 1 + size
+
+    return column._replace(fmt=None, convert=None, read=read)
+
+
+def _parse_fixed(
+    names: List[str], columns: List[NumpyColumn], content: bytes, pos: int,
+) -> Dict[str, np.ndarray]:
+    # Positional field names, since column names are not necessarily unique
+    dtype = np.dtype([
+        (f'f{idx}', '<' + column.fmt) for idx, column in enumerate(columns)
+    ])
+    count, rest = divmod(len(content) - pos, dtype.itemsize)
+    if rest:
+        raise RowBinaryDecodeError(
+            f'Unexpected {rest} bytes at the end of data'
+        )
+    rows = np.frombuffer(content, dtype, count, offset=pos)
+    return {
+        name: _to_datetime64(rows[f'f{idx}'], column)
+        for idx, (name, column) in enumerate(zip(names, columns))
+    }
+
+
+def _parse_rows(
+    types: TypeRegistry, names: List[str], type_strs: List[str],
+    columns: List[NumpyColumn], content: bytes, pos: int,
+) -> Dict[str, np.ndarray]:
+    binary_columns = []
+    for type_str, column in zip(type_strs, columns):
+        binary_column = parse_binary_column(types, type_str)
+        if column.fmt is None:
+            pass
+        elif column.nullable:
+            binary_column = _raw_nullable_column(binary_column, column.fmt)
+        else:
+            binary_column = binary_column._replace(convert=None)
+        binary_columns.append(binary_column)
+    read_row = make_row_reader(binary_columns)
+
+    buf = memoryview(content)
+    size = len(buf)
+    rows = []
+    while pos < size:
+        values, pos = read_row(buf, pos)
+        rows.append(values)
+    raw_columns = list(zip(*rows)) or [()] * len(names)
+
+    result = {}
+    for name, column, values in zip(names, columns, raw_columns):
+        if column.fmt is None:
+            # Assigning to preallocated array prevents NumPy from treating
+            # sequences (e.g. `Array()` values) as nested dimensions
+            array = np.empty(len(values), dtype=object)
+            array[:] = values
+        elif column.nullable:
+            mask = np.fromiter(
+                (value is None for value in values), dtype=bool,
+                count=len(values),
+            )
+            array = np.ma.masked_array(
+                np.fromiter(
+                    (0 if value is None else value for value in values),
+                    dtype='<' + column.fmt, count=len(values),
+                ),
+                mask=mask,
+            )
+            array = _to_datetime64(array, column)
+        else:
+            array = _to_datetime64(
+                np.array(values, dtype='<' + column.fmt), column,
+            )
+        result[name] = array
+    return result
+
+
+def parse_row_binary_numpy(
+    types: TypeRegistry, content: bytes,
+) -> Dict[str, np.ndarray]:
+    """ Decodes `RowBinaryWithNamesAndTypes` data into NumPy arrays
+
+    When all columns are of fixed-width numeric types, arrays are views of
+    `content` (read-only, no data is copied except for conversion to
+    `datetime64`).  `Nullable()` columns are returned as masked arrays,
+    other types as arrays of Python objects converted with `TypeRegistry`.
+    """
+    try:
+        names, type_strs, pos = read_header(content, 0)
+        columns = [parse_numpy_column(type_str) for type_str in type_strs]
+        if all(
+            column.fmt is not None and not column.nullable
+            for column in columns
+        ):
+            return _parse_fixed(names, columns, content, pos)
+        return _parse_rows(types, names, type_strs, columns, content, pos)
+    except RowBinaryDecodeError:
+        raise
+    except (IndexError, struct.error) as exc:
+        raise RowBinaryDecodeError(f'Incomplete data: {exc}') from exc
+    except (KeyError, ValueError) as exc:
+        raise RowBinaryDecodeError(str(exc)) from exc
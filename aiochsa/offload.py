@@ -0,0 +1,92 @@
+""" Decoding of large results and encoding of large inserts in executor, so
+that event loop is not blocked
+"""
+
+import asyncio
+from collections import namedtuple
+from concurrent.futures import Executor, ProcessPoolExecutor
+from functools import partial
+import time
+from typing import Any, Callable, List, Optional, Sequence, Tuple
+
+from .record import RowFactory
+
+
+__all__ = ['OffloadInfo', 'Offloader', 'decode_rows', 'rows_from_columns']
+
+
+# Statistics of work done in executor: number of calls, total size of
+# processed data (bytes of results for decoding, rows for encoding) and total
+# time spent in workers
+OffloadInfo = namedtuple('OffloadInfo', ['calls', 'size', 'seconds'])
+
+
+def _run_timed(func: Callable, *args) -> Tuple[Any, float]:
+    start = time.perf_counter()
+    result = func(*args)
+    return result, time.perf_counter() - start
+
+
+def decode_rows(decoder: Callable, types, content: bytes) -> list:
+    """ Runs row decoder to completion, since generators can't be consumed
+    outside of executor
+    """
+    return list(decoder(types, content))
+
+
+def rows_from_columns(
+    row_factory: RowFactory, names: List[str], columns: List[Sequence],
+) -> list:
+    """ Builds rows from already converted columns """
+    if getattr(row_factory, 'lazy', False):
+        make_row = row_factory(names, None)
+    else:
+        make_row = row_factory(names)
+    return [make_row(list(values)) for values in zip(*columns)]
+
+
+class Offloader:
+    """ Runs functions processing data of `threshold` size or larger in
+    `executor` (disabled when it's `None`)
+
+    Functions, their arguments (including type registry) and results are
+    pickled when `executor` is `ProcessPoolExecutor`, so in this case rows
+    are decoded by columns in worker process and assembled in event loop.
+    """
+
+    def __init__(self, executor: Optional[Executor], threshold: int):
+        self.executor = executor
+        self.threshold = threshold
+        self.in_process = isinstance(executor, ProcessPoolExecutor)
+        self._calls = self._size = 0
+        self._seconds = 0.
+
+    def should_offload(self, size: int) -> bool:
+        return self.executor is not None and size >= self.threshold
+
+    async def run(self, func: Callable, *args, size: int) -> Any:
+        loop = asyncio.get_running_loop()
+        result, seconds = await loop.run_in_executor(
+            self.executor, partial(_run_timed, func, *args),
+        )
+        self._calls += 1
+        self._size += size
+        self._seconds += seconds
+        return result
+
+    async def run_chunked(
+        self, func: Callable, items: Sequence, chunk_size: int,
+    ) -> list:
+        """ Runs `func` for chunks of `items` concurrently and returns list
+        of results in the same order
+        """
+        return await asyncio.gather(*[
+            self.run(func, chunk, size=len(chunk))
+            for chunk in (
+                items[start:start + chunk_size]
+                for start in range(0, len(items), chunk_size)
+            )
+        ])
+
+    def info(self) -> OffloadInfo:
+        return OffloadInfo(self._calls, self._size, self._seconds)
@@ -1,19 +1,44 @@
+from array import array
 from collections import namedtuple
 import pkgutil
-import simplejson as json
-from typing import Iterable
+import re
+from typing import (
+    Any, Callable, Dict, Iterable, List, Optional, Sequence, Tuple,
+)
 
 from lark import Lark, Transformer, v_args
 
-from .record import Record
-from .types import TypeRegistry
+from .json_codec import (
+    JSONCodec, JSONDecodeError, SimplejsonCodec, get_json_codec,
+)
+from .record import RowFactory, record_factory
+from .types import (
+    ArrayType, FloatType, IntType, NullableType, StrType, TupleType,
+    TypeRegistry, UnquotedIntType,
+)
+
 
+__all__ = [
+    'JSON_COMPACT', 'JSON_COMPACT_EACH_ROW', 'parse_type', 'parse_json_compact',
+    'parse_json_compact_columns', 'parse_json_compact_column_list',
+    'JSONCompactEachRowParser', 'JSONDecodeError',
+]
 
-__all__ = ['parse_type', 'parse_json_compact', 'JSONDecodeError']
 
+JSON_COMPACT = 'JSONCompact'
+# Line-delimited variant of `JSONCompact` used to stream results
+JSON_COMPACT_EACH_ROW = 'JSONCompactEachRowWithNamesAndTypes'
 
-# Re-export
-JSONDecodeError = json.JSONDecodeError
+# Used for results with `Decimal` columns when codec is not exact
+_exact_codec = SimplejsonCodec()
+
+
+# Typecodes of `array.array` used for columns of numeric types
+ARRAY_TYPECODES = {
+    'UInt8': 'B', 'UInt16': 'H', 'UInt32': 'I', 'UInt64': 'Q',
+    'Int8': 'b', 'Int16': 'h', 'Int32': 'i', 'Int64': 'q',
+    'Float32': 'f', 'Float64': 'd',
+}
 
 
 type_parser = Lark(
@@ -54,14 +79,156 @@ class TypeTransformer(Transformer):
         return int(value)
 
 
-def parse_type(types: TypeRegistry, type_str):
+def _parse_type(types: TypeRegistry, type_str):
     tree = type_parser.parse(type_str)
     return TypeTransformer(types).transform(tree)
 
 
+def parse_type(types: TypeRegistry, type_str):
+    return types.cached(type_str, lambda: _parse_type(types, type_str))
+
+
+class _DecoderSource:
+    """ Builds source of function converting JSON values of row
+
+    Conversions of standard types are inlined, the rest are called via
+    `from_json()` method of type objects stored in namespace.
+    """
+
+    def __init__(self):
+        self.namespace: Dict[str, Any] = {}
+        self._num_vars = 0
+
+    def _new_var(self, prefix):
+        self._num_vars += 1
+        return f'{prefix}{self._num_vars}'
+
+    def expr(self, type_obj, value: str) -> str:
+        # Exact methods are compared, so that registered subclasses
+        # overriding `from_json()` are honored
+        from_json = type(type_obj).from_json
+        if from_json in (StrType.from_json, UnquotedIntType.from_json):
+            # Already decoded by JSON parser
+            return value
+        elif from_json is IntType.from_json:
+            return f'int({value})'
+        elif from_json is FloatType.from_json:
+            return f'float({value})'
+        elif from_json is NullableType.from_json:
+            item_expr = self.expr(type_obj._item_type, value)
+            if item_expr == value:
+                return value
+            return f'(None if {value} is None else {item_expr})'
+        elif from_json is ArrayType.from_json:
+            var = self._new_var('i')
+            item_expr = self.expr(type_obj._item_type, var)
+            if item_expr == var:
+                # List is created by JSON parser for each value anyway
+                return value
+            return f'[{item_expr} for {var} in {value}]'
+        elif from_json is TupleType.from_json:
+            items = ''.join(
+                self.expr(item_type, f'{value}[{idx}]') + ', '
+                for idx, item_type in enumerate(type_obj._item_types)
+            )
+            return f'({items})'
+        else:
+            return f'{self.add(type_obj.from_json)}({value})'
+
+    def add(self, obj) -> str:
+        name = self._new_var('c')
+        self.namespace[name] = obj
+        return name
+
+
+# Maximum number of distinct values of interned column memoized per result
+INTERN_SIZE = 10_000
+
+_MISSING = object()
+
+# Name of outer type, `Nullable()` is transparent for interning
+_outer_type_name_re = re.compile(r'(?:Nullable\()*(\w+)')
+
+
+def _interning(convert: Callable) -> Callable:
+    memo: Dict[Any, Any] = {}
+
+    def get(value):
+        result = memo.get(value, _MISSING)
+        if result is _MISSING:
+            result = convert(value)
+            if len(memo) < INTERN_SIZE:
+                memo[value] = result
+        return result
+
+    return get
+
+
+def _make_json_decoder_factory(types: TypeRegistry, type_strs) -> Callable:
+    source = _DecoderSource()
+    names = [f'v{idx}' for idx in range(len(type_strs))]
+    memos: List[str] = []
+    exprs = []
+    for type_str, name in zip(type_strs, names):
+        type_obj = parse_type(types, type_str)
+        outer_name = _outer_type_name_re.match(type_str).group(1)  # type: ignore
+        if types[outer_name].intern:
+            memo = f'm{len(memos)}'
+            memos.append(f'    {memo} = intern({source.add(type_obj.from_json)})\n')
+            exprs.append(f'{memo}({name})')
+        else:
+            exprs.append(source.expr(type_obj, name))
+    # Memos of interned columns are created for each result
+    code = (
+        'def make_decoder(intern):\n'
+        f'{"".join(memos)}'
+        '    def decode(row):\n'
+        f'        {"".join(name + ", " for name in names)}= row\n'
+        f'        return [{", ".join(exprs)}]\n'
+        '    return decode\n'
+    )
+    exec(code, source.namespace)
+    return source.namespace['make_decoder']
+
+
+def _converters(types: TypeRegistry, type_strs) -> List[Callable]:
+    return [parse_type(types, type_str).from_json for type_str in type_strs]
+
+
+def make_json_decoder(types: TypeRegistry, type_strs) -> Callable:
+    """ Returns function converting list of JSON values of row
+
+    The code is generated once per set of column types, while values of
+    interned columns are shared within returned function only, so it must
+    be called once per result.
+    """
+    type_strs = tuple(type_strs)
+    make_decoder = types.cached(
+        (JSON_COMPACT, type_strs),
+        lambda: _make_json_decoder_factory(types, type_strs),
+    )
+    return make_decoder(_interning)
+
+
+def _has_decimals(type_strs: Iterable[str]) -> bool:
+    return any('Decimal' in type_str for type_str in type_strs)
+
+
+def _loads_json_compact(codec: Optional[JSONCodec], content: bytes) -> dict:
+    codec = get_json_codec(codec)
+    if not codec.exact_floats:
+        # Meta precedes data, so it's enough to search in the head
+        data_pos = content.find(b'"data"')
+        if content.find(b'Decimal', 0, data_pos) != -1:
+            codec = _exact_codec
+    return codec.loads(content)
+
+
 def parse_json_compact(
     types: TypeRegistry, content: bytes,
-) -> Iterable[Record]:
+    row_factory: RowFactory = record_factory,
+    codec: Optional[JSONCodec] = None,
+) -> Iterable[Any]:
     # The method is split into three phases:
     #   1. Parse JSON.  It's done immediately, so that we can fall back to
     #      parsing exception when it breaks normal response.
@@ -70,25 +237,132 @@ def parse_json_compact(
     #   3. Convert each row one-by-one.  It's done on demand at each iteration.
     # This way we can cleanup resources even when result is not used.
 
-    json_data = json.loads(content, parse_float=str)
-    return convert_json_compact(types, json_data)
+    json_data = _loads_json_compact(codec, content)
+    return convert_json_compact(types, json_data, row_factory)
 
 
 def convert_json_compact(
     types: TypeRegistry, json_data: dict,
-) -> Iterable[Record]:
-    names = []
-    converters = []
-    for column in json_data['meta']:
-        names.append(column['name'])
-        type_obj = parse_type(types, column['type'])
-        converters.append(type_obj.from_json)
+    row_factory: RowFactory = record_factory,
+) -> Iterable[Any]:
+    meta = json_data['meta']
+    names = [column['name'] for column in meta]
+    type_strs = [column['type'] for column in meta]
+    if getattr(row_factory, 'lazy', False):
+        make_row = row_factory(names, _converters(types, type_strs))
+        for row in json_data['data']:
+            yield make_row(row)
+        return
 
+    decode = make_json_decoder(types, type_strs)
+    make_row = row_factory(names)
     for row in json_data['data']:
-        yield Record(
-            names = names,
-            values = [
-                converter(value)
-                for converter, value in zip(converters, row)
-            ]
+        yield make_row(decode(row))
+
+
+def parse_json_compact_columns(
+    types: TypeRegistry, content: bytes, codec: Optional[JSONCodec] = None,
+) -> Dict[str, Sequence]:
+    json_data = _loads_json_compact(codec, content)
+    return convert_json_compact_columns(types, json_data)
+
+
+def parse_json_compact_column_list(
+    types: TypeRegistry, content: bytes, codec: Optional[JSONCodec] = None,
+) -> Tuple[List[str], List[Sequence]]:
+    """ The same as `parse_json_compact_columns()`, but returns list of names
+    and list of columns, so that duplicate names are preserved
+    """
+    json_data = _loads_json_compact(codec, content)
+    return convert_json_compact_column_list(types, json_data)
+
+
+def convert_json_compact_columns(
+    types: TypeRegistry, json_data: dict,
+) -> Dict[str, Sequence]:
+    return dict(zip(*convert_json_compact_column_list(types, json_data)))
+
+
+def convert_json_compact_column_list(
+    types: TypeRegistry, json_data: dict,
+) -> Tuple[List[str], List[Sequence]]:
+    meta = json_data['meta']
+    # Transposing is done by `zip()` in C, then each converter is applied
+    # once per column instead of once per value with loop in Python
+    raw_columns = list(zip(*json_data['data'])) or [()] * len(meta)
+    names = [column['name'] for column in meta]
+    columns = [
+        _convert_json_column(
+            parse_type(types, column['type']), column['type'], values,
         )
+        for column, values in zip(meta, raw_columns)
+    ]
+    return names, columns
+
+
+def _convert_json_column(type_obj, type_str, values) -> Sequence:
+    typecode = ARRAY_TYPECODES.get(type_str)
+    # Registered subclasses must be honored, so exact types are checked
+    if typecode is not None and type(type_obj) is IntType:
+        if typecode in 'qQ':
+            # 64-bit integers are quoted in JSON
+            values = map(int, values)
+        return array(typecode, values)
+    elif typecode is not None and type(type_obj) is UnquotedIntType:
+        return array(typecode, values)
+    elif typecode is not None and type(type_obj) is FloatType:
+        # Floats might be parsed as strings to preserve precision of decimals
+        return array(typecode, map(float, values))
+    elif type(type_obj).from_json is StrType.from_json:
+        # Strings are already decoded by JSON parser
+        return list(values)
+    else:
+        return list(map(type_obj.from_json, values))
+
+
+class JSONCompactEachRowParser:
+    """ Incremental parser of `JSONCompactEachRowWithNamesAndTypes` output
+
+    Lines are fed one by one as they arrive: the first two lines are header
+    with names and types of columns, each of the rest is converted to row
+    (`Record` by default).
+    """
+
+    def __init__(
+        self, types: TypeRegistry, row_factory: RowFactory = record_factory,
+        codec: Optional[JSONCodec] = None,
+    ):
+        self._types = types
+        self._row_factory = row_factory
+        self._codec = get_json_codec(codec)
+        self._names: Optional[List[str]] = None
+        self._make_row: Optional[Callable[[list], Any]] = None
+        self._decode: Optional[Callable[[list], list]] = None
+
+    def feed(self, line: bytes) -> Optional[Any]:
+        if not line.strip():
+            return None
+
+        json_data = self._codec.loads(line)
+        if isinstance(json_data, dict):
+            # Not a row, but exception reported in output format
+            raise JSONDecodeError('Unexpected object', line.decode(), 0)
+
+        if self._names is None:
+            self._names = json_data
+            return None
+        if self._make_row is None:
+            if not self._codec.exact_floats and _has_decimals(json_data):
+                self._codec = _exact_codec
+            if getattr(self._row_factory, 'lazy', False):
+                self._make_row = self._row_factory(
+                    self._names, _converters(self._types, json_data),
+                )
+                # Values are passed as is
+                self._decode = lambda values: values
+            else:
+                self._make_row = self._row_factory(self._names)
+                self._decode = make_json_decoder(self._types, json_data)
+            return None
+
+        return self._make_row(self._decode(json_data))  # type: ignore
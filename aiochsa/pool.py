@@ -1,9 +1,61 @@
-from typing import Optional, Union
+import asyncio
+from collections import namedtuple
+import logging
+import time
+from typing import Any, Collection, Dict, List, Optional, Set, Tuple, Union
 from urllib.parse import parse_qsl, urlsplit, urlunsplit, unquote
+from uuid import uuid4
 
+from aiohttp import ClientError, TCPConnector
 from aiohttp.client import ClientSession, ClientTimeout
 
-from .client import Client
+from .balancer import Host, HostGroup, LatencyWindow, get_balancer
+from .client import Client, is_row_stream
+from .compiler import READ, WRITE, is_select, statement_kind
+from .exc import ProtocolError
+
+
+logger = logging.getLogger(__name__)
+
+
+# Limit of concurrently acquired connections, number of acquired ones and
+# number of tasks waiting in `acquire()`
+PoolInfo = namedtuple('PoolInfo', ['max_size', 'acquired', 'waiting'])
+
+# Number of duplicate requests sent to another host and number of them
+# answered first
+HedgeInfo = namedtuple('HedgeInfo', ['fired', 'won'])
+
+# Methods returning query result, only they are hedged (for statements
+# known to be reads)
+_HEDGED_METHODS = frozenset([
+    'fetch', 'fetch_columns', 'fetch_numpy', 'fetch_arrow', 'fetchrow',
+    'fetchval',
+])
+
+
+def _is_host_failure(exc: ProtocolError) -> bool:
+    """ Tells whether error is caused by host or connection to it, not by
+    response that failed to decompress on client side
+    """
+    return exc.__cause__ is None or isinstance(exc.__cause__, ClientError)
+
+
+def _retrieve_exception(task: asyncio.Future):
+    if not task.cancelled():
+        task.exception()
+
+
+def _hosts_to_urls(hosts: str) -> List[str]:
+    # Several comma-separated hosts are allowed, each with optional port
+    urls = []
+    for host_port in hosts.split(','):
+        parsed_host = urlsplit(f'//{host_port}')
+        hostname = unquote(parsed_host.hostname or '') or '127.0.0.1'
+        port = int(parsed_host.port or 8123)
+        netloc = f'{hostname}:{port}'
+        urls.append(urlunsplit(('http', netloc, '', '', '')))
+    return urls
 
 
 def dsn_to_params(dsn):
@@ -20,9 +72,7 @@ def dsn_to_params(dsn):
     #   - path
     # https://datatracker.ietf.org/doc/html/rfc3986
 
-    hostname = unquote(parsed.hostname) or '127.0.0.1'
-    port = int(parsed.port or 8123)
-    netloc = f'{hostname}:{port}'
+    urls = _hosts_to_urls(parsed.netloc.rpartition('@')[2])
 
     database = unquote(parsed.path).lstrip('/')
     if not database:
@@ -36,16 +86,77 @@ def dsn_to_params(dsn):
 
     params = dict(parse_qsl(parsed.query))
 
+    if len(urls) == 1:
+        params['url'] = urls[0]
+    else:
+        params['urls'] = urls
+    # Separate group of hosts for writes
+    write_hosts = params.pop('write_hosts', None)
+    if write_hosts:
+        params['write_urls'] = _hosts_to_urls(write_hosts)
+
     return {
         **params,
-        'url': urlunsplit(('http', netloc, '', '', '')),
         'database': database,
         'user': user,
         'password': password,
     }
 
 
+class PoolAcquireContext:
+    """ Result of `Pool.acquire()`: either awaited (connection must be
+    released with `Pool.release()` then) or used as asynchronous context
+    manager
+    """
+
+    def __init__(self, pool: 'Pool', timeout: Optional[float], **options):
+        self._pool = pool
+        self._timeout = timeout
+        self._options = options
+        self._conn: Optional[Client] = None
+
+    def __await__(self):
+        return self._pool._acquire(self._timeout, **self._options).__await__()
+
+    async def __aenter__(self):
+        self._conn = await self._pool._acquire(self._timeout, **self._options)
+        return self._conn
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        conn, self._conn = self._conn, None
+        await self._pool.release(conn)
+
+
 class Pool:
+    """ Shares one HTTP session, which keeps up to `max_size` connections
+    alive (`max_size_per_host` limits them per host when not 0, idle ones are
+    closed after `keepalive_timeout` seconds).  Connections (actually the
+    same client per host) are acquired by bounded semaphore, so that no more
+    than `max_size` queries run concurrently, the rest wait in `acquire()`.
+    `min_size` connections are opened in advance when pool is awaited or
+    entered.
+
+    With several hosts in DSN (or `urls` parameter) each query is sent to
+    the host chosen by `balancer`.  Hosts failed with `ProtocolError` caused
+    by connection (not by response failed to decompress) are ejected until
+    they respond to health check, and the query is retried on another host
+    unless rows are streamed from iterator.  Reads with
+    `max_staleness` budget (pool default or per call) skip replicas lagging
+    more than this number of seconds, replication delay is sampled every
+    `replica_delay_interval` seconds.
+
+    `INSERT`, DDL and other statements modifying data are sent to hosts of
+    `write_urls` (`write_hosts` in DSN) when given, the rest to hosts of
+    DSN.  `route` argument of query methods and `acquire()` overrides it.
+
+    Reads are hedged when `hedge_delay` (seconds) or `hedge_percentile` (of
+    recent read times) is given: if the host hasn't answered within it, the
+    same query is sent to another host, the first response wins and the
+    other query is cancelled and killed on server by its `query_id`.  Only
+    `fetch*()` methods with `SELECT`-like statements are hedged.
+    Percentile is used once there are enough samples, `hedge_delay` before
+    that.  `hedge=False` argument of query method disables it for the call.
+    """
 
     DEFAULT_TIMEOUT = {
         'total': 5*60,
@@ -54,6 +165,17 @@ class Pool:
         'sock_connect': 10,
     }
 
+    # The same as default limit of `aiohttp.TCPConnector`
+    DEFAULT_MAX_SIZE = 100
+
+    DEFAULT_BALANCER = 'round_robin'
+
+    # Interval between pings of ejected hosts
+    DEFAULT_HEALTH_CHECK_INTERVAL = 5
+
+    # Interval between samples of replication delay
+    DEFAULT_REPLICA_DELAY_INTERVAL = 10
+
     def __init__(
         self, dsn, session_class=ClientSession,
         session_timeout: Optional[Union[float, int, dict]] = None,
@@ -64,48 +186,422 @@ class Pool:
             timeout_params.update(session_timeout)
         else:
             timeout_params['total'] = session_timeout  # type: ignore
-        self._session = session_class(
-            timeout=ClientTimeout(**timeout_params)
-        )
         params = dsn_to_params(dsn)
         params.update(kwargs)
-        self._client = client_class(self._session, **params)
+        urls = params.pop('urls', None)
+        url = params.pop('url', None)
+        if url is not None and (urls is None or 'url' in kwargs):
+            urls = [url]
+
+        # Might come from DSN as strings
+        self._min_size = int(params.pop('min_size', 0))
+        self._max_size = int(params.pop('max_size', self.DEFAULT_MAX_SIZE))
+        if self._max_size <= 0:
+            raise ValueError('max_size is expected to be greater than zero')
+        if not 0 <= self._min_size <= self._max_size:
+            raise ValueError(
+                'min_size is expected to be between zero and max_size'
+            )
+        connector_params: Dict[str, Any] = {
+            'limit': self._max_size,
+            'limit_per_host': int(params.pop('max_size_per_host', 0)),
+        }
+        keepalive_timeout = params.pop('keepalive_timeout', None)
+        if keepalive_timeout is not None:
+            connector_params['keepalive_timeout'] = float(keepalive_timeout)
+        balancer = params.pop('balancer', self.DEFAULT_BALANCER)
+        # Separate state (e.g. round robin counter) for each group
+        read_balancer = get_balancer(balancer)
+        write_balancer = get_balancer(balancer)
+        health_check_interval = float(params.pop(
+            'health_check_interval', self.DEFAULT_HEALTH_CHECK_INTERVAL,
+        ))
+        replica_delay_interval = float(params.pop(
+            'replica_delay_interval', self.DEFAULT_REPLICA_DELAY_INTERVAL,
+        ))
+        self._max_staleness: Optional[float] = None
+        max_staleness = params.pop('max_staleness', None)
+        if max_staleness is not None:
+            self._max_staleness = float(max_staleness)
+
+        self._hedge_delay: Optional[float] = None
+        hedge_delay = params.pop('hedge_delay', None)
+        if hedge_delay is not None:
+            self._hedge_delay = float(hedge_delay)
+        self._hedge_percentile: Optional[float] = None
+        hedge_percentile = params.pop('hedge_percentile', None)
+        if hedge_percentile is not None:
+            self._hedge_percentile = float(hedge_percentile)
+            if not 0 < self._hedge_percentile <= 100:
+                raise ValueError(
+                    'hedge_percentile is expected to be between 0 and 100'
+                )
+
+        write_urls = params.pop('write_urls', None)
+
+        self._session = session_class(
+            timeout=ClientTimeout(**timeout_params),
+            connector=TCPConnector(**connector_params),
+        )
+
+        def make_group(urls, balancer):
+            return HostGroup(
+                [
+                    Host(client_class(self._session, url=url, **params))
+                    for url in urls
+                ],
+                balancer, health_check_interval, replica_delay_interval,
+            )
+
+        self._hosts = make_group(urls, read_balancer)
+        self._groups: Dict[str, HostGroup] = {
+            READ: self._hosts,
+            WRITE: (
+                make_group(write_urls, write_balancer) if write_urls
+                else self._hosts
+            ),
+        }
+        self._host_by_client: Dict[Client, Tuple[Host, HostGroup]] = {}
+        for group in self._groups.values():
+            for host in group.hosts:
+                self._host_by_client[host.client] = (host, group)
+        # The client of the first host, e.g. to get parameters
+        self._client = self._hosts.hosts[0].client
+        self._semaphore = asyncio.BoundedSemaphore(self._max_size)
+        self._acquired = self._waiting = 0
+        self._read_latencies = LatencyWindow()
+        self._hedges_fired = self._hedges_won = 0
+        # Background `KILL QUERY` of cancelled queries
+        self._kill_tasks: Set[asyncio.Future] = set()
+        self._initialized = False
+
+    async def _init(self):
+        if self._initialized:
+            return
+        self._initialized = True
+        if not self._min_size:
+            return
+        hosts = self._hosts.hosts
+        try:
+            results = await asyncio.gather(
+                *[
+                    hosts[idx % len(hosts)].client.ping()
+                    for idx in range(self._min_size)
+                ],
+                return_exceptions=True,
+            )
+            errors = []
+            for idx, result in enumerate(results):
+                if isinstance(result, BaseException):
+                    errors.append(result)
+                    self._hosts.eject(hosts[idx % len(hosts)])
+            # Unavailable hosts are ejected, but the pool is useless when all
+            # of them failed
+            if errors and not self._hosts.has_available():
+                raise errors[0]
+        except BaseException:
+            await self.close()
+            raise
 
     async def close(self):
+        # Closing the same group twice is harmless
+        for group in self._groups.values():
+            await group.close()
+        if self._kill_tasks:
+            await asyncio.gather(*self._kill_tasks, return_exceptions=True)
         await self._session.close()
 
+    def get_min_size(self) -> int:
+        return self._min_size
+
+    def get_max_size(self) -> int:
+        return self._max_size
+
+    def pool_info(self) -> PoolInfo:
+        """ Returns current usage of connections """
+        return PoolInfo(self._max_size, self._acquired, self._waiting)
+
+    def hedge_info(self) -> HedgeInfo:
+        """ Returns counters of hedged reads """
+        return HedgeInfo(self._hedges_fired, self._hedges_won)
+
+    def _sum_info(self, method_name: str):
+        infos = [
+            getattr(client, method_name)() for client in self._host_by_client
+        ]
+        return type(infos[0])(*map(sum, zip(*infos)))
+
+    def decode_info(self):
+        return self._sum_info('decode_info')
+
+    def encode_info(self):
+        return self._sum_info('encode_info')
+
+    def request_compression_info(self):
+        return self._sum_info('request_compression_info')
+
+    def response_compression_info(self):
+        return self._sum_info('response_compression_info')
+
     def __await__(self):
         # For compartibility with asyncpg (`await create_pool(...)`)
-        yield from []
+        yield from self._init().__await__()
         return self
 
     async def __aenter__(self):
+        await self._init()
         return self
 
     async def __aexit__(self, exc_type, exc_val, exc_tb):
         await self.close()
 
-    def acquire(self, *, timeout=None):
-        return self._client
+    def _group(self, route: str) -> HostGroup:
+        try:
+            return self._groups[route]
+        except KeyError:
+            raise ValueError(f'Unsupported route {route!r}') from None
+
+    async def _acquire(
+        self, timeout: Optional[float], exclude: Collection[Host] = (),
+        max_staleness: Optional[float] = None, route: str = READ,
+    ) -> Client:
+        group = self._group(route)
+        if max_staleness is not None:
+            await group.track_delays()
+        self._waiting += 1
+        try:
+            # Raises `asyncio.TimeoutError` like asyncpg does
+            await asyncio.wait_for(self._semaphore.acquire(), timeout)
+        finally:
+            self._waiting -= 1
+        host = group.choose(exclude, max_staleness)
+        host.in_flight += 1
+        self._acquired += 1
+        return host.client
+
+    def acquire(
+        self, *, timeout=None, max_staleness: Optional[float] = None,
+        route: str = READ,
+    ) -> PoolAcquireContext:
+        """ Acquires connection to host of `route` group (for reads by
+        default)
+        """
+        return PoolAcquireContext(
+            self, timeout, max_staleness=max_staleness, route=route,
+        )
 
     async def release(self, conn, *, timeout=None):
-        pass
+        try:
+            host, _ = self._host_by_client[conn]
+        except KeyError:
+            raise ValueError(
+                'Connection is not acquired from this pool'
+            ) from None
+        # Fails when released more times than acquired
+        self._semaphore.release()
+        host.in_flight -= 1
+        self._acquired -= 1
+
+    def _pop_route(
+        self, method_name: str, args, kwargs,
+    ) -> Tuple[str, Optional[float]]:
+        """ Returns route and `max_staleness` for query """
+        route = kwargs.pop('route', None)
+        if route is None:
+            if method_name == 'insert_arrow':
+                route = WRITE
+            else:
+                route = statement_kind(
+                    args[0] if args else kwargs.get('statement'),
+                )
+        max_staleness = kwargs.pop(
+            'max_staleness', self._max_staleness if route == READ else None,
+        )
+        return route, max_staleness
+
+    def _get_hedge_delay(self) -> Optional[float]:
+        if self._hedge_percentile is not None:
+            delay = self._read_latencies.percentile(self._hedge_percentile)
+            if delay is not None:
+                return delay
+        return self._hedge_delay
+
+    def _kill_query(self, conn: Client, query_id: str):
+        async def kill():
+            try:
+                await conn.kill_query(query_id)
+            except Exception as exc:
+                logger.debug(
+                    f'Killing query {query_id} on {conn.url} failed: {exc}'
+                )
+
+        task = asyncio.ensure_future(kill())
+        self._kill_tasks.add(task)
+        task.add_done_callback(self._kill_tasks.discard)
+
+    async def _attempt(
+        self, method_name: str, args, kwargs, route: str,
+        max_staleness: Optional[float], tried: List[Host],
+        query_id: Optional[str] = None,
+    ):
+        """ Runs client method once on host not in `tried` and adds the host
+        to it
+        """
+        conn = await self._acquire(
+            None, exclude=tried, max_staleness=max_staleness, route=route,
+        )
+        host, group = self._host_by_client[conn]
+        tried.append(host)
+        if query_id is not None:
+            kwargs = {**kwargs, 'query_id': query_id}
+        start = time.perf_counter()
+        try:
+            result = await getattr(conn, method_name)(*args, **kwargs)
+        except ProtocolError as exc:
+            logger.debug(f'Query to {host.url} failed: {exc}')
+            if _is_host_failure(exc):
+                group.eject(host)
+            raise
+        except asyncio.CancelledError:
+            # Closing connection doesn't necessary stop query on server
+            if query_id is not None:
+                self._kill_query(conn, query_id)
+            raise
+        else:
+            elapsed = time.perf_counter() - start
+            host.observe_latency(elapsed)
+            if route == READ:
+                self._read_latencies.add(elapsed)
+            return result
+        finally:
+            await self.release(conn)
+
+    async def _hedged(
+        self, delay: float, method_name: str, args, kwargs, route: str,
+        max_staleness: Optional[float], tried: List[Host],
+    ):
+        """ Runs client method and the same one on another host when the
+        first doesn't complete within `delay` seconds, returns the first
+        result
+        """
+        def start():
+            task = asyncio.ensure_future(self._attempt(
+                method_name, args, kwargs, route, max_staleness, tried,
+                query_id=uuid4().hex,
+            ))
+            # Error of the loser is not interesting once the other one
+            # succeeded
+            task.add_done_callback(_retrieve_exception)
+            return task
+
+        first = start()
+        tasks = [first]
+        try:
+            done, _ = await asyncio.wait(tasks, timeout=delay)
+            if done or not self._group(route).has_available(tried):
+                return await first
+            self._hedges_fired += 1
+            hedge = start()
+            tasks.append(hedge)
+            pending = set(tasks)
+            while True:
+                done, pending = await asyncio.wait(
+                    pending, return_when=asyncio.FIRST_COMPLETED,
+                )
+                # In order of start, so that the first query wins when both
+                # completed at once
+                completed = [task for task in tasks if task in done]
+                succeeded = [
+                    task for task in completed if task.exception() is None
+                ]
+                if succeeded:
+                    if succeeded[0] is hedge:
+                        self._hedges_won += 1
+                    return succeeded[0].result()
+                for task in completed:
+                    # Failover is handled by caller when both failed
+                    if not (pending and isinstance(
+                        task.exception(), ProtocolError,
+                    )):
+                        return task.result()
+        finally:
+            for task in tasks:
+                if not task.done():
+                    task.cancel()
+
+    async def _call(self, method_name: str, *args, **kwargs):
+        """ Runs client method on chosen host with failover (and hedging
+        for reads)
+        """
+        route, max_staleness = self._pop_route(method_name, args, kwargs)
+        # Rows from iterator can't be sent twice
+        retriable = not is_row_stream(args[1:])
+        # Duplicate query must not modify data twice
+        hedge = (
+            kwargs.pop('hedge', True) and route == READ and retriable and
+            method_name in _HEDGED_METHODS and 'query_id' not in kwargs and
+            is_select(args[0] if args else kwargs.get('statement'))
+        )
+        group = self._group(route)
+        tried: List[Host] = []
+        while True:
+            delay = self._get_hedge_delay() if hedge else None
+            try:
+                if delay is not None and len(group.hosts) > 1:
+                    return await self._hedged(
+                        delay, method_name, args, kwargs, route,
+                        max_staleness, tried,
+                    )
+                return await self._attempt(
+                    method_name, args, kwargs, route, max_staleness, tried,
+                )
+            except ProtocolError as exc:
+                if not (
+                    retriable and _is_host_failure(exc) and
+                    group.has_available(tried)
+                ):
+                    raise
+                logger.debug('Retrying query on another host')
 
     async def iterate(self, *args, **kwargs):
-        async for row in self._client.iterate(*args, **kwargs):
-            yield row
+        route, max_staleness = self._pop_route('iterate', args, kwargs)
+        # Streamed rows are not hedged, accepted for uniform interface
+        kwargs.pop('hedge', None)
+        async with self.acquire(
+            max_staleness=max_staleness, route=route,
+        ) as conn:
+            try:
+                async for row in conn.iterate(*args, **kwargs):
+                    yield row
+            except ProtocolError as exc:
+                if _is_host_failure(exc):
+                    host, group = self._host_by_client[conn]
+                    group.eject(host)
+                raise
 
     async def execute(self, *args, **kwargs):
-        return await self._client.execute(*args, **kwargs)
+        return await self._call('execute', *args, **kwargs)
 
     async def fetch(self, *args, **kwargs):
-        return await self._client.fetch(*args, **kwargs)
+        return await self._call('fetch', *args, **kwargs)
+
+    async def fetch_columns(self, *args, **kwargs):
+        return await self._call('fetch_columns', *args, **kwargs)
+
+    async def fetch_numpy(self, *args, **kwargs):
+        return await self._call('fetch_numpy', *args, **kwargs)
+
+    async def fetch_arrow(self, *args, **kwargs):
+        return await self._call('fetch_arrow', *args, **kwargs)
+
+    async def insert_arrow(self, *args, **kwargs):
+        return await self._call('insert_arrow', *args, **kwargs)
 
     async def fetchrow(self, *args, **kwargs):
-        return await self._client.fetchrow(*args, **kwargs)
+        return await self._call('fetchrow', *args, **kwargs)
 
     async def fetchval(self, *args, **kwargs):
-        return await self._client.fetchval(*args, **kwargs)
+        return await self._call('fetchval', *args, **kwargs)
 
 
 def connect(dsn, **kwargs):
@@ -1,13 +1,37 @@
+from collections import namedtuple
 from collections.abc import Mapping
+from functools import lru_cache
+from keyword import iskeyword
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+
+# Called once per result with names of columns, returns function creating
+# row object from list of values.  Factories with true `lazy` attribute are
+# called with converters of columns too and get values before conversion.
+RowFactory = Callable[..., Callable[[list], Any]]
+
+
+def make_index(names: List[str]) -> Dict[str, int]:
+    """ Returns mapping of column names to positions to be shared by all
+    records of result
+    """
+    index: Dict[str, int] = {}
+    for pos, name in enumerate(names):
+        # The first one wins for duplicate names
+        index.setdefault(name, pos)
+    return index
 
 
 class Record(Mapping):
 
-    __slots__ = ('_names', '_values')
+    __slots__ = ('_names', '_values', '_index')
 
-    def __init__(self, names, values):
+    def __init__(self, names, values, index=None):
         self._names = names
         self._values = values
+        if index is None:
+            index = make_index(names)
+        self._index = index
 
     def __len__(self):
         return len(self._values)
@@ -17,12 +41,14 @@ class Record(Mapping):
 
     def __getitem__(self, item):
         if isinstance(item, str):
-            try:
-                item = self._names.index(item)
-            except ValueError:
-                raise KeyError(item)
+            item = self._index[item]
         return self._values[item]
 
+    def __contains__(self, item):
+        if isinstance(item, str):
+            return item in self._index
+        return super().__contains__(item)
+
     def get(self, item, default=None):
         try:
             return self[item]
@@ -51,3 +77,157 @@ class Record(Mapping):
                 for name, value in self.items()
             )
         )
+
+
+class LazyRecord(Record):
+    """ Record converting each value on first access """
+
+    __slots__ = ('_converters', '_converted')
+
+    def __init__(self, names, values, index=None, converters=None):
+        super().__init__(names, values, index)
+        self._converters = converters
+        # Flags of converted values, `None` when all of them are converted
+        self._converted = None
+        if converters is not None:
+            self._converted = bytearray(len(values))
+
+    def _convert(self, pos):
+        converted = self._converted
+        if converted is not None and not converted[pos]:
+            self._values[pos] = self._converters[pos](self._values[pos])
+            converted[pos] = 1
+        return self._values[pos]
+
+    def _convert_all(self):
+        converted = self._converted
+        if converted is None:
+            return
+        values = self._values
+        for pos, convert in enumerate(self._converters):
+            if not converted[pos]:
+                values[pos] = convert(values[pos])
+        self._converted = None
+
+    def __iter__(self):
+        self._convert_all()
+        return iter(self._values)
+
+    def __getitem__(self, item):
+        if isinstance(item, str):
+            item = self._index[item]
+        elif isinstance(item, slice):
+            self._convert_all()
+            return self._values[item]
+        return self._convert(item)
+
+    def values(self):
+        self._convert_all()
+        return self._values
+
+    def items(self):
+        self._convert_all()
+        return zip(self._names, self._values)
+
+    def __eq__(self, other):
+        self._convert_all()
+        return super().__eq__(other)
+
+
+def record_factory(names: List[str]) -> Callable[[list], Record]:
+    """ Creates `Record` objects (default) """
+    index = make_index(names)
+    return lambda values: Record(names, values, index)
+
+
+def lazy_record_factory(
+    names: List[str], converters: Optional[List[Callable]],
+) -> Callable[[list], LazyRecord]:
+    """ Creates `LazyRecord` objects, values are converted on first access
+    (for JSON formats only, RowBinary values are converted while reading)
+    """
+    index = make_index(names)
+    return lambda values: LazyRecord(names, values, index, converters)
+
+lazy_record_factory.lazy = True  # type: ignore
+
+
+def tuple_factory(names: List[str]) -> Callable[[list], tuple]:
+    """ Creates plain tuples """
+    return tuple
+
+
+def namedtuple_factory(names: List[str]) -> Callable[[list], Any]:
+    """ Creates named tuples, invalid identifiers are replaced with
+    positional names (`_0`, `_1`, ...)
+    """
+    return _namedtuple_class(tuple(names))._make
+
+
+@lru_cache(maxsize=256)
+def _namedtuple_class(names: Tuple[str, ...]) -> Any:
+    return namedtuple('Row', names, rename=True)
+
+
+def dataclass_factory(cls: type) -> RowFactory:
+    """ Returns factory creating instances of `cls` with values passed as
+    keyword arguments named after columns
+    """
+    def factory(names):
+        return lambda values: cls(**dict(zip(names, values)))
+    return factory
+
+
+def _attribute_names(names: List[str]) -> List[str]:
+    # The same rules as for `namedtuple(..., rename=True)`
+    attrs: List[str] = []
+    for pos, name in enumerate(names):
+        if (
+            not name.isidentifier() or iskeyword(name) or
+            name.startswith('_') or name in attrs
+        ):
+            name = f'_{pos}'
+        attrs.append(name)
+    return attrs
+
+
+@lru_cache(maxsize=256)
+def _slots_class(names: Tuple[str, ...]) -> type:
+    attrs = _attribute_names(list(names))
+    targets = ''.join(f'self.{attr}, ' for attr in attrs)
+    other_values = ''.join(f'other.{attr}, ' for attr in attrs)
+    fields = ''.join(f' {attr}={{self.{attr}!r}}' for attr in attrs)
+    # Compiled once per schema, so that creating row is a single unpacking.
+    # Rows behave like tuples for unpacking and comparison.
+    source = (
+        f'def __init__(self, values):\n'
+        f'    [{targets}] = values\n'
+        f'def __repr__(self):\n'
+        f'    return f"<Row{fields}>"\n'
+        f'def __iter__(self):\n'
+        f'    return iter(({targets}))\n'
+        f'def __len__(self):\n'
+        f'    return {len(attrs)}\n'
+        f'def __getitem__(self, index):\n'
+        f'    return ({targets})[index]\n'
+        f'def __eq__(self, other):\n'
+        f'    if type(other) is not type(self):\n'
+        f'        return NotImplemented\n'
+        f'    return ({targets}) == ({other_values})\n'
+    )
+    namespace: Dict[str, Any] = {}
+    exec(source, {}, namespace)
+    return type('Row', (), {
+        '__slots__': tuple(attrs),
+        '_fields': tuple(attrs),
+        '__hash__': None,
+        **namespace,
+    })
+
+
+def slots_factory(names: List[str]) -> Callable[[list], Any]:
+    """ Creates instances of class with `__slots__` generated for result
+    schema, invalid identifiers are replaced with positional names (`_0`,
+    `_1`, ...).  Rows can be unpacked, indexed and compared like tuples.
+    """
+    return _slots_class(tuple(names))
@@ -1,4 +1,4 @@
-from datetime import date, datetime, timezone
+from datetime import date, datetime, timedelta, timezone
 from decimal import Decimal
 from ipaddress import IPv4Address, IPv6Address
 from typing import (
@@ -7,6 +7,8 @@ from typing import (
 )
 from uuid import UUID
 
+from .cache import CacheInfo, LRUCache
+
 try:
     import zoneinfo
 except ImportError:
@@ -17,11 +19,19 @@ PyType = TypeVar('PyType')
 JsonType = TypeVar('JsonType', None, int, float, Decimal, str, list)
 
 
+EPOCH_DATE = date(1970, 1, 1)
+EPOCH_DATETIME = datetime(1970, 1, 1)
+
+
 class BaseType(Generic[PyType, JsonType]):
     __slots__: Tuple[str, ...] = ()
 
     py_type: Type[PyType]
 
+    # Set for types with few distinct values, so that equal values of column
+    # are converted once per result and share the same object
+    intern = False
+
     @classmethod
     def escape(cls, value: PyType, escape: Callable) -> str:
         return str(value)
@@ -29,10 +39,23 @@ class BaseType(Generic[PyType, JsonType]):
     def from_json(self, value: JsonType) -> Optional[PyType]:
         raise NotImplementedError()
 
+    def from_binary(self, value: Any) -> Optional[PyType]:
+        # Value is already unpacked from RowBinary by `aiochsa.binary`:
+        # `bytes` for strings, UUID and IPv6, `int` for other integer-based
+        # types (including Date and DateTime), `Decimal`, `float`, `list` for
+        # arrays and tuples
+        raise NotImplementedError()
+
     @classmethod
     def to_json(cls, value: PyType, to_json: Callable) -> JsonType:
         raise NotImplementedError()
 
+    @classmethod
+    def to_binary(cls, value: PyType, to_binary: Callable) -> Any:
+        # Result is packed into RowBinary by `aiochsa.binary` according to
+        # column type, so it's enough to normalize value here
+        raise NotImplementedError()
+
     def __eq__(self, other):
         return (
             type(self) == type(other) and
@@ -63,16 +86,33 @@ class StrType(BaseType[str, str]):
     def from_json(self, value: str) -> str:
         return str(value)
 
+    def from_binary(self, value: Union[bytes, str]) -> str:
+        # Enum labels are already decoded
+        if isinstance(value, bytes):
+            return value.decode(errors='replace')
+        return value
+
     @classmethod
     def to_json(cls, value: str, to_json: Callable) -> str:
         return value
 
+    @classmethod
+    def to_binary(cls, value: str, to_binary: Callable) -> str:
+        return value
+
+
+class EnumType(StrType):
+    intern = True
+
 
 class StrStripZerosType(StrType):
 
     def from_json(self, value: str) -> str:
         return value.rstrip('\0')
 
+    def from_binary(self, value: Union[bytes, str]) -> str:
+        return super().from_binary(value).rstrip('\0')
+
 
 class IntType(BaseType[int, int]):
     py_type = int
@@ -80,10 +120,28 @@ class IntType(BaseType[int, int]):
     def from_json(self, value: int) -> int:
         return int(value)
 
+    def from_binary(self, value: int) -> int:
+        return value
+
     @classmethod
     def to_json(cls, value: int, to_json: Callable) -> int:
         return value
 
+    @classmethod
+    def to_binary(cls, value: int, to_binary: Callable) -> int:
+        return value
+
+
+class UnquotedIntType(IntType):
+    """ Integers received as JSON numbers
+
+    Requires `output_format_json_quote_64bit_integers=0` setting, otherwise
+    64-bit integers come as strings.
+    """
+
+    def from_json(self, value: int) -> int:
+        return value
+
 
 class FloatType(BaseType[float, float]):
     py_type = float
@@ -91,10 +149,17 @@ class FloatType(BaseType[float, float]):
     def from_json(self, value: float) -> float:
         return float(value)
 
+    def from_binary(self, value: float) -> float:
+        return value
+
     @classmethod
     def to_json(cls, value: float, to_json: Callable) -> float:
         return value
 
+    @classmethod
+    def to_binary(cls, value: float, to_binary: Callable) -> float:
+        return value
+
 
 class DecimalType(BaseType[Decimal, Decimal]):
     py_type = Decimal
@@ -109,15 +174,23 @@ class DecimalType(BaseType[Decimal, Decimal]):
     def from_json(self, value: Decimal) -> Decimal:
         return Decimal(value)
 
+    def from_binary(self, value: Decimal) -> Decimal:
+        return value
+
     @classmethod
     def to_json(cls, value: Decimal, to_json: Callable) -> Decimal:
-        # Clickhouse requires serializing it without quotes, so we use
-        # `simplejson.dumps(..., use_decimal=True)`
+        # Clickhouse requires serializing it without quotes, which is done
+        # by JSON codec (see `aiochsa.json_codec`)
+        return value
+
+    @classmethod
+    def to_binary(cls, value: Decimal, to_binary: Callable) -> Decimal:
         return value
 
 
 class DateType(BaseType[date, str]):
     py_type = Optional[date]
+    intern = True
 
     @classmethod
     def escape(cls, value: date, escape=None) -> str:
@@ -129,11 +202,19 @@ class DateType(BaseType[date, str]):
     def to_json(cls, value: date, to_json: Callable) -> str:
         return value.isoformat()
 
+    @classmethod
+    def to_binary(cls, value: date, to_binary: Callable) -> date:
+        return value
+
     def from_json(self, value: str) -> Optional[date]:
         if value == '0000-00-00':
             return None
         return date.fromisoformat(value)
 
+    def from_binary(self, value: int) -> date:
+        # Number of days since the epoch
+        return EPOCH_DATE + timedelta(days=value)
+
 
 class DateTimeType(BaseType[datetime, str]):
     py_type = datetime
@@ -156,6 +237,12 @@ class DateTimeType(BaseType[datetime, str]):
         value = value.replace(tzinfo=None, microsecond=0)
         return value.isoformat()
 
+    @classmethod
+    def to_binary(cls, value: datetime, to_binary: Callable) -> datetime:
+        # Wall clock time like in `to_json()`, it's packed in timezone of
+        # column or server
+        return value.replace(tzinfo=None, microsecond=0)
+
     def from_json(self, value: str) -> Optional[datetime]:
         if value == '0000-00-00 00:00:00':
             return None
@@ -164,6 +251,13 @@ class DateTimeType(BaseType[datetime, str]):
             result = result.replace(tzinfo=self._tzinfo)
         return result
 
+    def from_binary(self, value: int) -> datetime:
+        # Unix timestamp.  There is no information about server timezone in
+        # binary format, so naive datetime is returned in UTC.
+        if self._tzinfo is None:
+            return EPOCH_DATETIME + timedelta(seconds=value)
+        return datetime.fromtimestamp(value, self._tzinfo)
+
 
 class DateTimeUTCType(DateTimeType):
 
@@ -191,6 +285,17 @@ class DateTimeUTCType(DateTimeType):
         )
         return value.isoformat()
 
+    @classmethod
+    def to_binary(cls, value: datetime, to_binary: Callable) -> datetime:
+        if value.utcoffset() is None:
+            raise ValueError(
+                'Got naive datetime while timezone-aware is expected'
+            )
+        return (
+            value.astimezone(timezone.utc)
+                .replace(tzinfo=None, microsecond=0)
+        )
+
     def from_json(self, value: str) -> datetime:
         result = datetime.fromisoformat(value)
         if self._tzinfo is None:
@@ -198,6 +303,32 @@ class DateTimeUTCType(DateTimeType):
         else:
             return result.replace(tzinfo=self._tzinfo).astimezone(timezone.utc)
 
+    def from_binary(self, value: int) -> datetime:
+        return datetime.fromtimestamp(value, timezone.utc)
+
+
+class UnixDateTimeType(DateTimeType):
+    """ `DateTime` received as Unix timestamp
+
+    Requires `date_time_output_format=unix_timestamp` setting.  Values are
+    converted the same way as from binary format, i.e. naive datetime is
+    returned in UTC.  Zero value is returned as `None` like in
+    `DateTimeType`.
+    """
+
+    def from_json(self, value: str) -> Optional[datetime]:
+        timestamp = int(value)
+        if not timestamp:
+            return None
+        return self.from_binary(timestamp)
+
+
+class UnixDateTimeUTCType(DateTimeUTCType):
+    """ `DateTimeUTCType` counterpart of `UnixDateTimeType` """
+
+    def from_json(self, value: str) -> datetime:
+        return datetime.fromtimestamp(int(value), timezone.utc)
+
 
 class UUIDType(BaseType[UUID, str]):
     py_type = UUID
@@ -210,9 +341,17 @@ class UUIDType(BaseType[UUID, str]):
     def to_json(cls, value: UUID, to_json: Callable) -> str:
         return str(value)
 
+    @classmethod
+    def to_binary(cls, value: UUID, to_binary: Callable) -> UUID:
+        return value
+
     def from_json(self, value: str) -> UUID:
         return self.py_type(value)
 
+    def from_binary(self, value: bytes) -> UUID:
+        # Two little-endian 64-bit halves, high one first
+        return self.py_type(bytes=value[7::-1] + value[:7:-1])
+
 
 class IPv4Type(BaseType[IPv4Address, str]):
     py_type = IPv4Address
@@ -221,9 +360,16 @@ class IPv4Type(BaseType[IPv4Address, str]):
     def to_json(cls, value: IPv4Address, to_json: Callable) -> str:
         return str(value)
 
+    @classmethod
+    def to_binary(cls, value: IPv4Address, to_binary: Callable) -> IPv4Address:
+        return value
+
     def from_json(self, value: str) -> IPv4Address:
         return self.py_type(value)
 
+    def from_binary(self, value: int) -> IPv4Address:
+        return self.py_type(value)
+
 
 class IPv6Type(BaseType[IPv6Address, str]):
     py_type = IPv6Address
@@ -232,9 +378,16 @@ class IPv6Type(BaseType[IPv6Address, str]):
     def to_json(cls, value: IPv6Address, to_json: Callable) -> str:
         return str(value)
 
+    @classmethod
+    def to_binary(cls, value: IPv6Address, to_binary: Callable) -> IPv6Address:
+        return value
+
     def from_json(self, value: str) -> IPv6Address:
         return self.py_type(value)
 
+    def from_binary(self, value: bytes) -> IPv6Address:
+        return self.py_type(value)
+
 
 class NothingType(BaseType[None, None]):
     py_type = Type[None]
@@ -247,6 +400,10 @@ class NothingType(BaseType[None, None]):
     def to_json(cls, value: None, to_json: Callable) -> None:
         return None
 
+    @classmethod
+    def to_binary(cls, value: None, to_binary: Callable) -> None:
+        return None
+
     def from_json(self, value: None) -> None:
         # Actually it's never called
         return None # pragma: nocover
@@ -270,12 +427,20 @@ class TupleType(BaseType[tuple, list]):
     def to_json(cls, value: tuple, to_json: Callable) -> List[JsonType]:
         return [to_json(v) for v in value]
 
+    @classmethod
+    def to_binary(cls, value: tuple, to_binary: Callable) -> tuple:
+        return tuple(to_binary(v) for v in value)
+
     def from_json(self, value: List[JsonType]) -> tuple:
         assert len(self._item_types) == len(value)
         return tuple(
             t.from_json(v) for t, v in zip(self._item_types, value)
         )
 
+    def from_binary(self, value: list) -> tuple:
+        # Items are already converted
+        return tuple(value)
+
 
 class ArrayType(BaseType[list, list]):
     __slots__ = ('_item_type',)
@@ -295,9 +460,17 @@ class ArrayType(BaseType[list, list]):
     def to_json(cls, value: list, to_json: Callable) -> List[JsonType]:
         return [to_json(v) for v in value]
 
+    @classmethod
+    def to_binary(cls, value: list, to_binary: Callable) -> list:
+        return [to_binary(v) for v in value]
+
     def from_json(self, value: List[JsonType]) -> list:
         return [self._item_type.from_json(v) for v in value]
 
+    def from_binary(self, value: list) -> list:
+        # Items are already converted
+        return value
+
 
 class ProxyType(BaseType):
 
@@ -312,6 +485,14 @@ class ProxyType(BaseType):
     def to_json(cls, value: PyType, to_json: Callable) -> JsonType:
         raise RuntimeError('Must be never called')  # pragma: nocover
 
+    @classmethod
+    def to_binary(cls, value: PyType, to_binary: Callable) -> Any:
+        raise RuntimeError('Must be never called')  # pragma: nocover
+
+
+class LowCardinalityType(ProxyType):
+    intern = True
+
 
 class NullableType(BaseType):
     __slots__ = ('_item_type',)
@@ -327,11 +508,19 @@ class NullableType(BaseType):
     def to_json(cls, value: PyType, to_json: Callable) -> JsonType:
         raise RuntimeError('Must be never called')  # pragma: nocover
 
+    @classmethod
+    def to_binary(cls, value: PyType, to_binary: Callable) -> Any:
+        raise RuntimeError('Must be never called')  # pragma: nocover
+
     def from_json(self, value: JsonType) -> Any:
         if value is None:
             return
         return self._item_type.from_json(value)
 
+    def from_binary(self, value: Any) -> Any:
+        # NULL flag is handled by reader and item is already converted
+        return value
+
 
 class AggregateFunction:
 
@@ -352,12 +541,17 @@ class AggregateFunctionType(BaseType):
     def to_json(cls, value: PyType, to_json: Callable) -> JsonType:
         raise RuntimeError('Must be never called')  # pragma: nocover
 
+    @classmethod
+    def to_binary(cls, value: PyType, to_binary: Callable) -> Any:
+        raise RuntimeError('Must be never called')  # pragma: nocover
+
     def from_json(self, value: JsonType) -> AggregateFunction:
         return AggregateFunction(value)
 
 
 DEFAULT_CONVERTES = [
-    (StrType, ['String', 'Enum8', 'Enum16'], str),
+    (StrType, ['String'], str),
+    (EnumType, ['Enum8', 'Enum16']),
     (StrStripZerosType, ['FixedString']),
     (
         IntType,
@@ -380,26 +574,65 @@ DEFAULT_CONVERTES = [
     (TupleType, ['Tuple'], tuple),
     (ArrayType, ['Array'], list),
     (NullableType, ['Nullable']),
-    (ProxyType, ['LowCardinality', 'SimpleAggregateFunction']),
+    (LowCardinalityType, ['LowCardinality']),
+    (ProxyType, ['SimpleAggregateFunction']),
     (AggregateFunctionType, ['AggregateFunction']),
 ]
 
 
+# Settings making ClickHouse output values in JSON formats in the form
+# requiring less conversion, to be used with `FAST_WIRE_CONVERTERS`
+FAST_WIRE_SETTINGS = {
+    'output_format_json_quote_64bit_integers': 0,
+    'date_time_output_format': 'unix_timestamp',
+}
+
+FAST_WIRE_CONVERTERS = [
+    *DEFAULT_CONVERTES,
+    (
+        UnquotedIntType,
+        [
+            'UInt8', 'UInt16', 'UInt32', 'UInt64',
+            'Int8', 'Int16', 'Int32', 'Int64',
+        ],
+        [int, bool],
+    ),
+    (UnixDateTimeType, ['DateTime'], datetime),
+]
+
+
 class TypeRegistry:
 
-    def __init__(self, converters=DEFAULT_CONVERTES):
+    def __init__(self, converters=DEFAULT_CONVERTES, *, cache_size=1024):
         self._types = {}
         self._escapers = {}
         self._to_json = {}
+        self._to_binary = {}
+        # Objects built from type strings of result columns.  They depend on
+        # registered converters, so the cache is cleared on each change.
+        self._cache = LRUCache(cache_size)
         for args in converters:
             self.register(*args)
 
+    def cached(self, key, factory):
+        """ Returns object built with `factory` for type string `key` (or
+        tuple with it), memoizing it until the next `register()` call
+        """
+        return self._cache.get(key, factory)
+
+    def cache_info(self) -> CacheInfo:
+        return self._cache.info()
+
+    def cache_clear(self):
+        self._cache.clear()
+
     def register(
         self,
         conv_class: Type[BaseType],
         ch_types: Iterable[str],
         py_types: Union[type, Iterable[type]] = (),
     ):
+        self._cache.clear()
         for ch_type in ch_types:
             self._types[ch_type] = conv_class
         if isinstance(py_types, type):
@@ -408,6 +641,7 @@ class TypeRegistry:
             assert isinstance(py_type, type)
             self._escapers[py_type] = conv_class.escape
             self._to_json[py_type] = conv_class.to_json
+            self._to_binary[py_type] = conv_class.to_binary
 
     def __getitem__(self, ch_type_name):
         return self._types[ch_type_name]
@@ -441,3 +675,18 @@ class TypeRegistry:
                     return to_json(value, self.to_json)
             else:
                 raise TypeError(f'Unsupported type {py_type}')
+
+    def to_binary(self, value):
+        py_type = type(value)
+        try:
+            return self._to_binary[py_type](value, self.to_binary)
+        except KeyError:
+            # Fallback to slower method
+            for subclass in py_type.mro()[1:]:
+                if subclass in self._to_binary:
+                    to_binary = self._to_binary[subclass]
+                    # Cache to speed up further look-ups
+                    self._to_binary[py_type] = to_binary
+                    return to_binary(value, self.to_binary)
+            else:
+                raise TypeError(f'Unsupported type {py_type}')
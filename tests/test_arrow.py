@@ -0,0 +1,29 @@
+import pytest
+
+from aiochsa.types import TypeRegistry
+
+
+pa = pytest.importorskip('pyarrow')
+from aiochsa.arrow import (  # noqa: E402
+    ArrowDecodeError, encode_arrow_stream, parse_arrow_stream,
+)
+
+
+def test_encode_parse_round():
+    table = pa.table({'id': [1, 2, 3], 'name': ['a', 'b', None]})
+    result = parse_arrow_stream(TypeRegistry(), encode_arrow_stream(table))
+    assert result.equals(table)
+
+
+def test_encode_record_batch():
+    batch = pa.record_batch([pa.array([1, 2])], names=['id'])
+    result = parse_arrow_stream(TypeRegistry(), encode_arrow_stream(batch))
+    assert result.to_pydict() == {'id': [1, 2]}
+
+
+def test_parse_exception_appended():
+    content = encode_arrow_stream(pa.table({'id': [1]}))
+    # No end-of-stream marker when exception occurs in the middle
+    content = content[:-8] + b'Code: 395. DB::Exception: Value passed to throwIf'
+    with pytest.raises(ArrowDecodeError):
+        parse_arrow_stream(TypeRegistry(), content)
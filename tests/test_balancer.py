@@ -0,0 +1,193 @@
+import asyncio
+
+import pytest
+
+from aiochsa.balancer import (
+    BALANCERS, Host, HostGroup, LatencyEWMABalancer, LatencyWindow,
+    LeastInFlightBalancer, RoundRobinBalancer, get_balancer,
+)
+from aiochsa.exc import ProtocolError
+
+
+class FakeClient:
+
+    def __init__(self, url, available=True, delay=0):
+        self.url = url
+        self.available = available
+        self.delay = delay
+        self.pings = 0
+        self.queries = 0
+
+    async def ping(self):
+        self.pings += 1
+        if not self.available:
+            raise ProtocolError('Connection refused')
+
+    async def fetchval(self, query):
+        assert query == HostGroup.DELAY_QUERY
+        self.queries += 1
+        await asyncio.sleep(0)
+        if not self.available:
+            raise ProtocolError('Connection refused')
+        return self.delay
+
+
+def _hosts(count):
+    return [Host(FakeClient(f'http://h{idx}:8123')) for idx in range(count)]
+
+
+def test_get_balancer():
+    for name, balancer_class in BALANCERS.items():
+        assert isinstance(get_balancer(name), balancer_class)
+    balancer = RoundRobinBalancer()
+    assert get_balancer(balancer) is balancer
+    with pytest.raises(ValueError):
+        get_balancer('unknown')
+
+
+@pytest.mark.parametrize('name', list(BALANCERS))
+def test_balancer_choose(name):
+    hosts = _hosts(3)
+    balancer = get_balancer(name)
+    for _ in range(10):
+        assert balancer.choose(hosts) in hosts
+    assert balancer.choose(hosts[:1]) is hosts[0]
+
+
+def test_round_robin():
+    hosts = _hosts(3)
+    balancer = RoundRobinBalancer()
+    assert [balancer.choose(hosts) for _ in range(6)] == hosts * 2
+
+
+def test_least_in_flight():
+    hosts = _hosts(3)
+    hosts[0].in_flight = 2
+    hosts[1].in_flight = 1
+    hosts[2].in_flight = 3
+    assert LeastInFlightBalancer().choose(hosts) is hosts[1]
+
+
+def test_latency_ewma():
+    hosts = _hosts(3)
+    balancer = LatencyEWMABalancer()
+    hosts[0].observe_latency(0.1)
+    hosts[1].observe_latency(0.2)
+    # Not tried yet
+    assert balancer.choose(hosts) is hosts[2]
+    hosts[2].observe_latency(1.)
+    hosts[2].observe_latency(0.)
+    assert hosts[2].latency == pytest.approx(0.7)
+    assert balancer.choose(hosts) is hosts[0]
+    hosts[0].in_flight = 2
+    assert balancer.choose(hosts) is hosts[1]
+
+
+def test_host_group_choose():
+    hosts = _hosts(3)
+    group = HostGroup(hosts, RoundRobinBalancer(), 1)
+    assert group.choose(exclude=hosts[:2]) is hosts[2]
+    hosts[2].ejected = True
+    assert group.has_available()
+    assert not group.has_available(exclude=hosts[:2])
+    assert group.choose(exclude=hosts[:2]) is hosts[2]
+    assert group.choose(exclude=hosts) in hosts
+
+
+async def test_host_group_eject():
+    hosts = _hosts(2)
+    group = HostGroup(hosts, RoundRobinBalancer(), 0.01)
+    hosts[0].client.available = False
+    group.eject(hosts[0])
+    assert hosts[0].ejected
+    assert [group.choose() for _ in range(3)] == [hosts[1]] * 3
+
+    await asyncio.sleep(0.05)
+    assert hosts[0].ejected
+    assert hosts[0].client.pings > 0
+    hosts[0].client.available = True
+    await asyncio.sleep(0.05)
+    assert not hosts[0].ejected
+    # Stops when there is no ejected host
+    await asyncio.sleep(0)
+    task = group._health_check_task
+    assert task is not None and task.done()
+    await group.close()
+    assert hosts[1].client.pings == 0
+
+
+async def test_host_group_single_host():
+    [host] = hosts = _hosts(1)
+    group = HostGroup(hosts, RoundRobinBalancer(), 0.01)
+    group.eject(host)
+    assert not host.ejected
+    await group.close()
+
+
+async def test_host_group_close():
+    hosts = _hosts(2)
+    group = HostGroup(hosts, RoundRobinBalancer(), 10)
+    group.eject(hosts[0])
+    task = group._health_check_task
+    assert task is not None
+    await group.close()
+    assert task.cancelled()
+
+
+async def test_host_group_track_delays_concurrent():
+    hosts = _hosts(2)
+    group = HostGroup(hosts, RoundRobinBalancer(), 1, delay_interval=60)
+    # Concurrent callers await the same first sample
+    await asyncio.gather(*[group.track_delays() for _ in range(5)])
+    assert [host.client.queries for host in hosts] == [1, 1]
+    assert [host.delay for host in hosts] == [0., 0.]
+    assert group._delay_task is not None
+    await group.close()
+
+
+def test_host_group_choose_max_staleness():
+    hosts = _hosts(4)
+    group = HostGroup(hosts, RoundRobinBalancer(), 1)
+    for host, delay in zip(hosts, [30., 2., 0., None]):
+        host.delay = delay
+    assert {group.choose(max_staleness=5) for _ in range(4)} == set(hosts[1:3])
+    assert group.choose(max_staleness=1) is hosts[2]
+    # The freshest one
+    assert group.choose(exclude=hosts[1:3], max_staleness=1) is hosts[0]
+    hosts[0].delay = None
+    assert group.choose(exclude=hosts[1:3], max_staleness=1) in hosts[::3]
+    # Ignored for single candidate
+    assert group.choose(exclude=hosts[1:], max_staleness=1) is hosts[0]
+
+
+async def test_host_group_track_delays():
+    hosts = _hosts(3)
+    hosts[0].client.delay = 30
+    hosts[2].client.available = False
+    group = HostGroup(hosts, RoundRobinBalancer(), 1, delay_interval=0.01)
+    await group.track_delays()
+    assert [host.delay for host in hosts] == [30., 0., None]
+    task = group._delay_task
+    assert task is not None
+    await group.track_delays()
+    assert group._delay_task is task
+
+    hosts[0].client.delay = 1
+    await asyncio.sleep(0.05)
+    assert hosts[0].delay == 1.
+    await group.close()
+    assert task.cancelled()
+
+
+def test_latency_window():
+    window = LatencyWindow(maxsize=100)
+    for idx in range(LatencyWindow.MIN_SAMPLES - 1):
+        window.add(idx)
+    assert window.percentile(50) is None
+    for idx in range(LatencyWindow.MIN_SAMPLES - 1, 200):
+        window.add(idx)
+    # Only the last 100 samples are kept
+    assert window.percentile(0) == 100
+    assert window.percentile(50) == 149
+    assert window.percentile(99) == 198
+    assert window.percentile(100) == 199
@@ -0,0 +1,346 @@
+from array import array
+from datetime import date, datetime, timezone
+from decimal import Decimal
+import enum
+from ipaddress import IPv4Address, IPv6Address
+import struct
+import uuid
+
+import pytest
+import sqlalchemy as sa
+
+from aiochsa.binary import (
+    RowBinaryDecodeError, RowBinaryParser, encode_row_binary,
+    parse_row_binary, parse_row_binary_columns, set_datetime_timezone,
+    unescape,
+)
+from aiochsa.compiler import Compiler
+from aiochsa.dialect import ClickhouseSaDialect
+from aiochsa.types import DateTimeUTCType, TypeRegistry, zoneinfo
+
+
+def _varint(value):
+    result = bytearray()
+    while value >= 0x80:
+        result.append(value & 0x7f | 0x80)
+        value >>= 7
+    result.append(value)
+    return bytes(result)
+
+
+def _string(value):
+    if isinstance(value, str):
+        value = value.encode()
+    return _varint(len(value)) + value
+
+
+def _header(columns):
+    return (
+        _varint(len(columns)) +
+        b''.join(_string(name) for name, _ in columns) +
+        b''.join(_string(type_str) for _, type_str in columns)
+    )
+
+
+def _uuid(value):
+    return (
+        struct.pack('<Q', value.int >> 64) +
+        struct.pack('<Q', value.int & 0xFFFFFFFFFFFFFFFF)
+    )
+
+
+SAMPLE_UUID = uuid.UUID('12345678-9abc-def0-1234-56789abcdef0')
+
+
+class PyEnum(str, enum.Enum):
+    FOO = 'FOO'
+
+
+@pytest.mark.parametrize(
+    'type_str,data,value',
+    [
+        ('UInt8', b'\xff', 255),
+        ('Int8', b'\x80', -128),
+        ('UInt64', struct.pack('<Q', 2**64 - 1), 2**64 - 1),
+        ('Int64', struct.pack('<q', -2**63), -2**63),
+        ('Float32', struct.pack('<f', 0.5), 0.5),
+        ('Float64', struct.pack('<d', -1e308), -1e308),
+        ('String', _string('зразок'), 'зразок'),
+        ('FixedString(4)', b'ab\0\0', 'ab'),
+        ("Enum8('a' = -1, 'b\\'c' = 2)", b'\x02', "b'c"),
+        ("Enum16('a' = 1000)", struct.pack('<h', 1000), 'a'),
+        ('Decimal(9, 4)', struct.pack('<i', -12345), Decimal('-1.2345')),
+        (
+            'Decimal(18, 9)',
+            struct.pack('<q', 1234567891), Decimal('1.234567891'),
+        ),
+        (
+            'Decimal(38, 19)',
+            (10**37 + 1).to_bytes(16, 'little', signed=True),
+            Decimal('1000000000000000000.0000000000000000001'),
+        ),
+        (
+            'Decimal(50, 10)',
+            (-10**49 + 1).to_bytes(32, 'little', signed=True),
+            Decimal('-' + '9' * 39 + '.' + '9' * 10),
+        ),
+        ('Decimal64(2)', struct.pack('<q', 123), Decimal('1.23')),
+        ('Date', struct.pack('<H', 1), date(1970, 1, 2)),
+        ('DateTime', struct.pack('<I', 1), datetime(1970, 1, 1, 0, 0, 1)),
+        ('UUID', _uuid(SAMPLE_UUID), SAMPLE_UUID),
+        ('IPv4', struct.pack('<I', 0x7f000001), IPv4Address('127.0.0.1')),
+        ('IPv6', IPv6Address('::1').packed, IPv6Address('::1')),
+        ('Nullable(String)', b'\x01', None),
+        ('Nullable(String)', b'\x00' + _string('a'), 'a'),
+        ('Nullable(Nothing)', b'\x01', None),
+        ('LowCardinality(Nullable(String))', b'\x00' + _string(''), ''),
+        ('SimpleAggregateFunction(max, UInt32)', b'\x01\0\0\0', 1),
+        ('Array(UInt16)', _varint(3) + struct.pack('<3H', 1, 2, 3), [1, 2, 3]),
+        ('Array(Date)', _varint(1) + b'\0\0', [date(1970, 1, 1)]),
+        (
+            'Array(String)',
+            _varint(2) + _string('a') + _string('b'), ['a', 'b'],
+        ),
+        ('Array(Nullable(Int8))', _varint(2) + b'\x01\x00\x07', [None, 7]),
+        ('Tuple(Int8, String)', b'\x01' + _string('a'), (1, 'a')),
+    ],
+)
+def test_parse_row_binary(type_str, data, value):
+    content = _header([('value', type_str)]) + data
+    [[result]] = parse_row_binary(TypeRegistry(), content)
+    assert result == value
+    assert type(result) is type(value)
+
+
+def test_parse_row_binary_struct_groups():
+    content = _header([
+        ('a', 'UInt8'), ('b', 'Float64'), ('c', 'String'),
+        ('d', 'Int32'), ('e', 'Nullable(UInt8)'), ('f', 'Date'),
+    ])
+    rows = [
+        (1, 0.5, 'x', -1, None, 0),
+        (2, 1.5, 'yz', 7, 3, 1),
+    ]
+    for a, b, c, d, e, f in rows:
+        content += struct.pack('<Bd', a, b) + _string(c)
+        content += struct.pack('<i', d)
+        content += b'\x01' if e is None else b'\x00' + bytes([e])
+        content += struct.pack('<H', f)
+    records = parse_row_binary(TypeRegistry(), content)
+    assert records == [
+        {'a': 1, 'b': 0.5, 'c': 'x', 'd': -1, 'e': None,
+         'f': date(1970, 1, 1)},
+        {'a': 2, 'b': 1.5, 'c': 'yz', 'd': 7, 'e': 3,
+         'f': date(1970, 1, 2)},
+    ]
+
+
+def test_parse_row_binary_custom_type():
+    types = TypeRegistry()
+    types.register(DateTimeUTCType, ['DateTime'], datetime)
+    content = _header([('value', 'DateTime')]) + struct.pack('<I', 1)
+    [[result]] = parse_row_binary(types, content)
+    assert result == datetime(1970, 1, 1, 0, 0, 1, tzinfo=timezone.utc)
+
+
+def test_parser_chunks():
+    content = _header([('a', 'UInt32'), ('b', 'String')])
+    for i in range(10):
+        content += struct.pack('<I', i) + _string(str(i) * i)
+
+    parser = RowBinaryParser(TypeRegistry())
+    records = []
+    for pos in range(0, len(content), 3):
+        records.extend(parser.feed(content[pos:pos + 3]))
+    parser.close()
+    assert records == [(i, str(i) * i) for i in range(10)]
+
+
+def test_parser_incomplete():
+    content = _header([('a', 'UInt32')]) + b'\0\0\0\0\0\0'
+    with pytest.raises(RowBinaryDecodeError):
+        parse_row_binary(TypeRegistry(), content)
+
+
+def test_parse_row_binary_columns_fixed():
+    content = _header([('a', 'UInt8'), ('b', 'Float64'), ('c', 'Date')])
+    for i in range(3):
+        content += struct.pack('<BdH', i, i / 2, i)
+    columns = parse_row_binary_columns(TypeRegistry(), content)
+    assert list(columns) == ['a', 'b', 'c']
+    assert columns['a'] == array('B', [0, 1, 2])
+    assert columns['b'] == array('d', [0., .5, 1.])
+    assert columns['c'] == [
+        date(1970, 1, 1), date(1970, 1, 2), date(1970, 1, 3),
+    ]
+
+
+def test_parse_row_binary_columns_variable():
+    content = _header([('a', 'UInt32'), ('b', 'String')])
+    for i in range(3):
+        content += struct.pack('<I', i) + _string(str(i))
+    columns = parse_row_binary_columns(TypeRegistry(), content)
+    assert columns == {'a': [0, 1, 2], 'b': ['0', '1', '2']}
+
+
+def test_parse_row_binary_columns_empty():
+    content = _header([('a', 'UInt32'), ('b', 'Date')])
+    columns = parse_row_binary_columns(TypeRegistry(), content)
+    assert columns == {'a': array('I'), 'b': []}
+
+
+def test_parse_row_binary_columns_incomplete():
+    content = _header([('a', 'UInt32')]) + b'\0\0\0\0\0\0'
+    with pytest.raises(RowBinaryDecodeError):
+        parse_row_binary_columns(TypeRegistry(), content)
+
+
+def test_parse_row_binary_exception_text_value():
+    # Data looking like exception message is not mistaken for error
+    message = 'Code: 60. DB::Exception: Table default.x does not exist.'
+    content = _header([('a', 'String')]) + _string(message)
+    assert [tuple(row) for row in parse_row_binary(TypeRegistry(), content)] \
+        == [(message,)]
+    assert parse_row_binary_columns(TypeRegistry(), content) == {
+        'a': [message],
+    }
+
+
+def test_parse_row_binary_exception_appended():
+    # Exception message after some rows breaks decoding
+    content = (
+        _header([('a', 'String')]) + _string('a') +
+        b'Code: 241. DB::Exception: Memory limit (total) exceeded\n'
+    )
+    with pytest.raises(RowBinaryDecodeError):
+        parse_row_binary(TypeRegistry(), content)
+
+
+def test_unsupported_type():
+    content = _header([('a', 'AggregateFunction(sum, UInt8)')])
+    with pytest.raises(TypeError):
+        parse_row_binary(TypeRegistry(), content)
+
+
+@pytest.mark.parametrize(
+    'escaped,unescaped',
+    [
+        ('abc', 'abc'),
+        ("\\'", "'"),
+        ('\\\\', '\\'),
+        ('\\t\\n\\0', '\t\n\0'),
+        ('\\x41', 'A'),
+    ],
+)
+def test_unescape(escaped, unescaped):
+    assert unescape(escaped) == unescaped
+
+
+@pytest.mark.parametrize(
+    'type_str,value',
+    [
+        ('UInt8', 255),
+        ('Int64', -2**63),
+        ('UInt64', 2**64 - 1),
+        ('Float64', 1e308),
+        ('String', 'зразок'),
+        ('String', PyEnum.FOO),
+        ('FixedString(4)', 'ab'),
+        ("Enum8('a' = -1, 'b\\'c' = 2)", "b'c"),
+        ("Enum16('FOO' = 1000)", PyEnum.FOO),
+        ('Decimal(9, 4)', Decimal('-1.2345')),
+        (
+            'Decimal(38, 19)',
+            Decimal('1000000000000000000.0000000000000000001'),
+        ),
+        ('Decimal(76, 30)', Decimal('-' + '1234567890' * 4 + '.' + '1' * 30)),
+        ('Date', date(2000, 1, 1)),
+        ('DateTime', datetime(2000, 1, 1, 12, 34, 56)),
+        (
+            "DateTime('Europe/Moscow')",
+            datetime(2020, 1, 1, 12, tzinfo=zoneinfo.ZoneInfo('Europe/Moscow')),
+        ),
+        ('UUID', SAMPLE_UUID),
+        ('IPv4', IPv4Address('127.0.0.1')),
+        ('IPv6', IPv6Address('::1')),
+        ('Nullable(String)', None),
+        ('Nullable(String)', 'a'),
+        ('LowCardinality(Nullable(String))', ''),
+        ('Array(UInt16)', [1, 2, 3]),
+        ('Array(Date)', [date(1970, 1, 1)]),
+        ('Array(Nullable(Int8))', [None, 7]),
+        ('Tuple(Int8, Array(String))', (1, ['a', 'b'])),
+    ],
+)
+def test_encode_decode_round(type_str, value):
+    types = TypeRegistry()
+    data = encode_row_binary(types, ['value'], [type_str], [{'value': value}])
+    content = _header([('value', type_str)]) + data
+    [[result]] = parse_row_binary(types, content)
+    assert result == value
+
+
+@pytest.mark.parametrize(
+    'type_str,timestamp',
+    [
+        # Plain `DateTime` is packed as UTC
+        ('DateTime', 1577880000),
+        ("DateTime('Europe/Moscow')", 1577869200),
+    ],
+)
+@pytest.mark.parametrize('tzinfo', [None, zoneinfo.ZoneInfo('Asia/Tokyo')])
+def test_encode_datetime_wall_clock(type_str, timestamp, tzinfo):
+    # Wall clock time like in JSON, timezone of value is ignored
+    value = datetime(2020, 1, 1, 12, tzinfo=tzinfo)
+    data = encode_row_binary(
+        TypeRegistry(), ['value'], [type_str], [{'value': value}],
+    )
+    assert data == struct.pack('<I', timestamp)
+
+
+@pytest.mark.parametrize(
+    'type_str,expected',
+    [
+        ('DateTime', "DateTime('Europe/Moscow')"),
+        (
+            'Array(Nullable(DateTime))',
+            "Array(Nullable(DateTime('Europe/Moscow')))",
+        ),
+        ("DateTime('UTC')", "DateTime('UTC')"),
+        ('DateTime64(3)', 'DateTime64(3)'),
+    ],
+)
+def test_set_datetime_timezone(type_str, expected):
+    assert set_datetime_timezone(type_str, 'Europe/Moscow') == expected
+
+
+def test_encode_decimal_out_of_range():
+    with pytest.raises(ValueError):
+        encode_row_binary(
+            TypeRegistry(), ['value'], ['Decimal(9, 4)'],
+            [{'value': Decimal('123456.7')}],
+        )
+
+
+def test_encode_different_columns():
+    with pytest.raises(ValueError):
+        encode_row_binary(
+            TypeRegistry(), ['a'], ['UInt8'], [{'a': 1}, {'b': 2}],
+        )
+
+
+def test_compile_insert_row_binary():
+    table = sa.Table(
+        'test', sa.MetaData(),
+        sa.Column('id', sa.Integer),
+        sa.Column('name', sa.String),
+    )
+    types = TypeRegistry()
+    compiler = Compiler(dialect=ClickhouseSaDialect(), escape=types.escape)
+    rows = [{'name': 'a', 'id': 1}, {'name': 'b', 'id': 2}]
+    sql, parameters, insert_format = compiler.compile_statement(
+        table.insert(), (rows,), insert_format='RowBinary',
+    )
+    assert sql == 'INSERT INTO test (name, id) FORMAT RowBinary'
+    assert parameters == rows
+    assert insert_format == 'RowBinary'
@@ -0,0 +1,33 @@
+import pickle
+
+from aiochsa.cache import CacheInfo, LRUCache
+
+
+def test_lru_cache():
+    cache = LRUCache(2)
+    assert cache.get('a', lambda: 1) == 1
+    assert cache.get('b', lambda: 2) == 2
+    # Cached value is returned
+    assert cache.get('a', lambda: 3) == 1
+    # Least recently used "b" is discarded
+    assert cache.get('c', lambda: 4) == 4
+    assert cache.get('b', lambda: 5) == 5
+    assert cache.get('a', lambda: 6) == 6
+    assert cache.info() == (1, 5, 2, 2)
+
+    cache.clear()
+    assert cache.info() == (0, 0, 2, 0)
+
+
+def test_lru_cache_disabled():
+    cache = LRUCache(0)
+    assert cache.get('a', lambda: 1) == 1
+    assert cache.get('a', lambda: 2) == 2
+    assert cache.info() == (0, 2, 0, 0)
+
+
+def test_pickle():
+    cache = LRUCache(2)
+    cache.get('a', lambda: lambda: None)
+    restored = pickle.loads(pickle.dumps(cache))
+    assert restored.info() == CacheInfo(0, 0, 2, 0)
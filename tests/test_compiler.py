@@ -0,0 +1,127 @@
+import gc
+import weakref
+
+import pytest
+import sqlalchemy as sa
+
+from aiochsa.compiler import (
+    READ, WRITE, Compiler, is_select, statement_kind,
+)
+from aiochsa.dialect import ClickhouseSaDialect
+from aiochsa.types import TypeRegistry
+
+
+table = sa.Table(
+    'test', sa.MetaData(),
+    sa.Column('id', sa.Integer),
+    sa.Column('name', sa.String),
+)
+
+
+def _compiler(cache_size):
+    return Compiler(
+        dialect=ClickhouseSaDialect(), escape=TypeRegistry().escape,
+        cache_size=cache_size,
+    )
+
+
+def test_statement_cache():
+    compiler = _compiler(10)
+    statement = (
+        sa.select([table.c.id])
+            .where(table.c.name == sa.bindparam('name'))
+    )
+    for name in ['a', "b'c"]:
+        sql, _, _ = compiler.compile_statement(statement, ({'name': name},))
+        assert sql.endswith(f'WHERE test.name = {compiler._escape(name)}')
+    assert compiler.cache_info() == (1, 1, 10, 1)
+
+
+def test_statement_cache_identity():
+    compiler = _compiler(10)
+    for _ in range(2):
+        # Equal, but not the same statements
+        compiler.compile_statement(sa.select([table.c.id]), ())
+    assert compiler.cache_info() == (0, 2, 10, 2)
+
+    statement = sa.select([table.c.id])
+    statement_ref = weakref.ref(statement)
+    compiler.compile_statement(statement, ())
+    del statement
+    # Kept while cached, so its id can't be reused by other statement
+    assert statement_ref() is not None
+    compiler.cache_clear()
+    gc.collect()
+    assert statement_ref() is None
+
+
+def test_statement_cache_insert_columns():
+    compiler = _compiler(10)
+    statement = table.insert()
+    for columns in [['id'], ['id', 'name'], ['id']]:
+        sql, _, _ = compiler.compile_statement(
+            statement, ({name: None for name in columns},), 'RowBinary',
+        )
+        assert sql == (
+            f'INSERT INTO test ({", ".join(columns)}) FORMAT RowBinary'
+        )
+    assert compiler.cache_info() == (1, 2, 10, 2)
+
+
+def test_statement_cache_function():
+    compiler = _compiler(10)
+    statement = sa.func.now()
+    for _ in range(2):
+        sql, _, _ = compiler.compile_statement(statement, ())
+        assert sql == 'SELECT now() AS now_1'
+    assert compiler.cache_info() == (1, 1, 10, 1)
+
+
+def test_statement_cache_disabled():
+    compiler = _compiler(0)
+    statement = sa.select([table.c.id])
+    for _ in range(2):
+        compiler.compile_statement(statement, ())
+    assert compiler.cache_info().currsize == 0
+
+
+@pytest.mark.parametrize(
+    'statement,kind',
+    [
+        ('SELECT 1', READ),
+        ('  (select 1) UNION ALL (SELECT 2)', READ),
+        ('-- comment\n/* multi\nline */ WITH 1 AS a SELECT a', READ),
+        ('DESCRIBE TABLE test', READ),
+        ('SHOW TABLES', READ),
+        ('INSERT INTO test VALUES (1, \'a\')', WRITE),
+        ('ALTER TABLE test DELETE WHERE 1', WRITE),
+        ('OPTIMIZE TABLE test FINAL', WRITE),
+        (sa.text('SELECT 1'), READ),
+        (sa.text('INSERT INTO test VALUES (1, \'a\')'), WRITE),
+        (sa.text('ALTER TABLE test DELETE WHERE 1'), WRITE),
+        (table.select(), READ),
+        (sa.func.now(), READ),
+        (table.insert(), WRITE),
+        (table.delete(), WRITE),
+        (sa.schema.DropTable(table), WRITE),
+    ],
+)
+def test_statement_kind(statement, kind):
+    assert statement_kind(statement) == kind
+
+
+@pytest.mark.parametrize(
+    'statement,expected',
+    [
+        ('SELECT 1', True),
+        (sa.text('WITH 1 AS a SELECT a'), True),
+        (sa.text('INSERT INTO test VALUES (1, \'a\')'), False),
+        ('OPTIMIZE TABLE test FINAL', False),
+        (table.select(), True),
+        (sa.func.now(), True),
+        (table.insert(), False),
+        (sa.schema.DropTable(table), False),
+    ],
+)
+def test_is_select(statement, expected):
+    assert is_select(statement) == expected
@@ -0,0 +1,138 @@
+import gzip
+import struct
+import zlib
+
+import pytest
+
+from aiochsa.compression import (
+    BodyCompressor, BodyDecompressor, CompressionInfo, DecompressionError,
+    NativeBlockDecompressor, make_compressor, make_decompressor,
+)
+
+
+def _decompress(method, data):
+    if method == 'gzip':
+        return gzip.decompress(data)
+    elif method == 'deflate':
+        return zlib.decompress(data)
+    elif method == 'zstd':
+        zstandard = pytest.importorskip('zstandard')
+        return zstandard.ZstdDecompressor().decompressobj().decompress(data)
+    elif method == 'lz4':
+        lz4_frame = pytest.importorskip('lz4.frame')
+        return lz4_frame.decompress(data)
+    elif method == 'br':
+        brotli = pytest.importorskip('brotli')
+        return brotli.decompress(data)
+    raise AssertionError(method)  # pragma: nocover
+
+
+@pytest.fixture(params=['gzip', 'deflate', 'zstd', 'lz4', 'br'])
+def method(request):
+    module = {'zstd': 'zstandard', 'lz4': 'lz4.frame', 'br': 'brotli'}
+    if request.param in module:
+        pytest.importorskip(module[request.param])
+    return request.param
+
+
+@pytest.mark.parametrize('threshold', [0, 1024 * 1024])
+async def test_compress(method, threshold):
+    compressor = BodyCompressor(method, threshold=threshold)
+    data = b'INSERT INTO t FORMAT JSONEachRow\n' + b'{"a": 1}\n' * 1000
+    compressed = await compressor.compress(data)
+    assert _decompress(method, compressed) == data
+    assert compressor.info() == CompressionInfo(len(data), len(compressed))
+    assert len(compressed) < len(data)
+
+
+async def test_compress_stream(method):
+    compressor = BodyCompressor(method, level=1, threshold=100)
+
+    async def chunks():
+        for idx in range(10):
+            yield f'{idx}'.encode() * (idx * 20)
+
+    compressed = [chunk async for chunk in compressor.compress_stream(chunks())]
+    expected = b''.join([f'{idx}'.encode() * (idx * 20) for idx in range(10)])
+    assert _decompress(method, b''.join(compressed)) == expected
+    assert compressor.info() == CompressionInfo(
+        len(expected), sum(map(len, compressed)),
+    )
+
+
+def test_unknown_method():
+    with pytest.raises(ValueError):
+        make_compressor('unknown')
+    with pytest.raises(ValueError):
+        BodyCompressor('unknown')
+    with pytest.raises(ValueError):
+        make_decompressor('unknown')
+    with pytest.raises(ValueError):
+        BodyDecompressor('unknown')
+
+
+async def _chunks(data, size):
+    for start in range(0, len(data), size):
+        yield data[start:start + size]
+
+
+async def test_decompress_stream(method):
+    data = b'[1, "a"]\n' * 1000
+    compressed = await BodyCompressor(method).compress(data)
+    decompressor = BodyDecompressor(method)
+    result = [
+        chunk async for chunk in
+        decompressor.decompress_stream(_chunks(compressed, 100))
+    ]
+    assert b''.join(result) == data
+    assert decompressor.info() == CompressionInfo(len(data), len(compressed))
+
+
+@pytest.mark.parametrize(
+    'method,compress', [('gzip', zlib.compress), ('deflate', gzip.compress)],
+)
+def test_decompress_zlib_headers(method, compress):
+    # Both kinds of header are accepted for either method
+    decompressor = make_decompressor(method)
+    assert decompressor.decompress(compress(b'abc')) == b'abc'
+    assert decompressor.flush() == b''
+
+
+def test_decompress_incomplete(method):
+    compressor = make_compressor(method)
+    compressed = compressor.compress(b'abc' * 100) + compressor.flush()
+    decompressor = make_decompressor(method)
+    decompressor.decompress(compressed[:-1])
+    with pytest.raises(DecompressionError):
+        decompressor.flush()
+
+
+def test_decompress_malformed():
+    with pytest.raises(DecompressionError):
+        make_decompressor('gzip').decompress(b'not compressed')
+
+
+def _native_block(data, method=NativeBlockDecompressor.METHOD_NONE):
+    header = struct.pack('<BII', method, len(data) + 9, len(data))
+    return bytes(16) + header + data
+
+
+def test_native_block_decompressor():
+    compressed = _native_block(b'abc') + _native_block(b'') + _native_block(
+        b'defgh',
+    )
+    decompressor = NativeBlockDecompressor()
+    # Blocks split at arbitrary positions
+    result = [
+        decompressor.decompress(compressed[start:start + 7])
+        for start in range(0, len(compressed), 7)
+    ]
+    assert b''.join(result) == b'abcdefgh'
+    assert decompressor.flush() == b''
+
+    decompressor.decompress(compressed[:-1])
+    with pytest.raises(DecompressionError):
+        decompressor.flush()
+
+    with pytest.raises(DecompressionError):
+        NativeBlockDecompressor().decompress(_native_block(b'abc', 0xff))
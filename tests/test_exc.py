@@ -1,9 +1,11 @@
 from decimal import Decimal
 
 import pytest
+import simplejson as json
 
 import aiochsa
 from aiochsa import error_codes
+from aiochsa.exc import RecentRows
 
 
 async def test_exc(conn):
@@ -45,4 +47,48 @@ async def test_exc_row(conn, table_test, clickhouse_version):
         )
     assert exc_info.value.code == error_codes.ARGUMENT_OUT_OF_BOUND
     if clickhouse_version >= (20, 3, 9, 70):
-        assert exc_info.value.row == (1, '{"amount": 1234567890.1234567890}')
+        num, content = exc_info.value.row
+        assert num == 1
+        # Formatting depends on JSON codec
+        assert json.loads(content, use_decimal=True) == {
+            'amount': Decimal('1234567890.1234567890'),
+        }
+
+
+async def test_exc_row_iterator(conn, table_test, clickhouse_version):
+    rows = (
+        {'amount': Decimal(idx if idx < 2500 else '1234567890.1234567890')}
+        for idx in range(3000)
+    )
+    with pytest.raises(aiochsa.DBException) as exc_info:
+        await conn.execute(table_test.insert(), rows)
+    assert exc_info.value.code == error_codes.ARGUMENT_OUT_OF_BOUND
+    if clickhouse_version >= (20, 3, 9, 70):
+        num, content = exc_info.value.row
+        assert num == 2501
+        assert json.loads(content, use_decimal=True) == {
+            'amount': Decimal('1234567890.1234567890'),
+        }
+
+
+def test_recent_rows():
+    rows = RecentRows(2)
+    assert len(rows) == 0
+    rows.extend(['a', 'b', 'c'])
+    assert len(rows) == 3
+    assert rows[1] == 'b'
+    assert rows[2] == 'c'
+    with pytest.raises(IndexError):
+        rows[0]
+    with pytest.raises(IndexError):
+        rows[3]
+
+
+def test_from_message_recent_rows():
+    rows = RecentRows(1)
+    rows.extend(['a', 'b'])
+    message = 'Code: 27. DB::Exception: Cannot parse input (at row {}).'
+    exc = aiochsa.DBException.from_message(message.format(2), rows=rows)
+    assert exc.row == (2, 'b')
+    exc = aiochsa.DBException.from_message(message.format(1), rows=rows)
+    assert exc.row is None
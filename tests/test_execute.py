@@ -1,3 +1,5 @@
+from array import array
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 from datetime import date, datetime
 from decimal import Decimal
 from enum import Enum
@@ -6,6 +8,8 @@ import pytest
 import sqlalchemy as sa
 
 import aiochsa
+from aiochsa import error_codes
+from aiochsa.record import namedtuple_factory, slots_factory, tuple_factory
 
 async def test_ddl(conn, table_test):
     await conn.execute(sa.DDL(f'DROP TABLE {table_test.name}'))
@@ -164,6 +168,38 @@ async def test_insert_multiple_args(conn, table_test, any_select):
     assert rows == values
 
 
+async def test_insert_binary(dsn, table_test, any_select):
+    values = [
+        {'id': i + 1, 'name': f'test{i + 1}', 'enum': 'ONE'}
+        for i in range(3)
+    ]
+    async with aiochsa.connect(dsn, insert_format='RowBinary') as conn:
+        await conn.execute(
+            table_test.insert(), *values,
+        )
+
+        rows = await conn.fetch(
+            any_select([table_test.c.id, table_test.c.name, table_test.c.enum])
+        )
+    assert rows == values
+
+
+async def test_insert_binary_datetime(dsn, table_for_type):
+    # Naive value is stored the same way as from JSON (in server timezone)
+    table = await table_for_type(sa.DateTime)
+    value = datetime(2020, 1, 1, 12, 34, 56)
+    async with aiochsa.connect(dsn) as conn:
+        for insert_format in ['JSONEachRow', 'RowBinary']:
+            await conn.execute(
+                table.insert(), {'value': value}, insert_format=insert_format,
+            )
+        # Text format returns wall clock time in server timezone
+        rows = await conn.fetch(
+            sa.select([table.c.value]), result_format='JSONCompact',
+        )
+    assert [row[0] for row in rows] == [value, value]
+
+
 async def test_insert_select(conn, table_test, table_mt, any_select):
     values = [
         {'id': i + 1, 'name': f'test{i + 1}'}
@@ -248,6 +284,119 @@ async def test_iterate(conn, table_test, any_select):
     assert [item_id async for (item_id,) in rows_agen] == [1, 2, 3]
 
 
+async def test_iterate_binary(conn, table_test, any_select):
+    await conn.execute(
+        table_test.insert(),
+        *[
+            {'id': i + 1, 'name': f'test{i + 1}'}
+            for i in range(3)
+        ],
+    )
+
+    rows_agen = conn.iterate(
+        any_select([table_test.c.id, table_test.c.name]),
+        result_format='RowBinaryWithNamesAndTypes',
+    )
+    assert [tuple(row) async for row in rows_agen] == [
+        (1, 'test1'), (2, 'test2'), (3, 'test3'),
+    ]
+
+
+async def test_fetch_binary(conn):
+    rows = await conn.fetch(
+        'SELECT number, toString(number) FROM numbers(3)',
+        result_format='RowBinaryWithNamesAndTypes',
+    )
+    assert rows == [(0, '0'), (1, '1'), (2, '2')]
+
+
+@pytest.mark.parametrize(
+    'result_format', ['JSONCompact', 'RowBinaryWithNamesAndTypes'],
+)
+async def test_fetch_columns(conn, result_format):
+    columns = await conn.fetch_columns(
+        'SELECT number, toString(number) AS str FROM numbers(3)',
+        result_format=result_format,
+    )
+    assert list(columns) == ['number', 'str']
+    assert columns['number'] == array('Q', [0, 1, 2])
+    assert columns['str'] == ['0', '1', '2']
+
+
+async def test_fetch_numpy(conn):
+    np = pytest.importorskip('numpy')
+    arrays = await conn.fetch_numpy(
+        'SELECT number, toDate(number) AS date FROM numbers(3)',
+    )
+    assert arrays['number'].dtype == np.uint64
+    assert arrays['number'].tolist() == [0, 1, 2]
+    assert arrays['date'].dtype == np.dtype('datetime64[D]')
+    assert arrays['date'][1] == np.datetime64('1970-01-02')
+
+
+async def test_fetch_arrow(conn):
+    pytest.importorskip('pyarrow')
+    table = await conn.fetch_arrow(
+        'SELECT number, toString(number) AS str FROM numbers(3)',
+    )
+    assert table.column_names == ['number', 'str']
+    assert table.column('number').to_pylist() == [0, 1, 2]
+
+
+async def test_insert_arrow(conn, table_test):
+    pa = pytest.importorskip('pyarrow')
+    await conn.insert_arrow(
+        table_test,
+        pa.table({
+            'id': pa.array([1, 2], pa.uint32()),
+            'name': ['test1', 'test2'],
+        }),
+    )
+    rows = await conn.fetch(
+        sa.select([table_test.c.id, table_test.c.name])
+            .order_by(table_test.c.id)
+    )
+    assert rows == [(1, 'test1'), (2, 'test2')]
+
+
+@pytest.mark.parametrize(
+    'result_format', ['JSONCompact', 'RowBinaryWithNamesAndTypes'],
+)
+async def test_row_factory(conn, result_format):
+    query = 'SELECT number, toString(number) AS str FROM numbers(2)'
+    rows = await conn.fetch(
+        query, result_format=result_format, row_factory=namedtuple_factory,
+    )
+    assert [(row.number, row.str) for row in rows] == [(0, '0'), (1, '1')]
+    rows_agen = conn.iterate(
+        query, result_format=result_format, row_factory=tuple_factory,
+    )
+    assert [row async for row in rows_agen] == [(0, '0'), (1, '1')]
+
+
+async def test_row_factory_fetchval(dsn):
+    async with aiochsa.connect(dsn, row_factory=slots_factory) as conn:
+        row = await conn.fetchrow('SELECT 1 AS value')
+        assert row.value == 1
+        assert await conn.fetchval('SELECT 1 AS value') == 1
+
+
+@pytest.mark.parametrize(
+    'result_format', ['JSONCompact', 'RowBinaryWithNamesAndTypes'],
+)
+async def test_iterate_exception(conn, result_format):
+    # Exception is raised after some blocks are already sent
+    rows_agen = conn.iterate(
+        'SELECT throwIf(number = 100000) FROM numbers(200000) '
+        'SETTINGS max_block_size=1000',
+        result_format=result_format,
+    )
+    with pytest.raises(aiochsa.DBException) as exc_info:
+        async for _ in rows_agen:
+            pass
+    assert exc_info.value.code == error_codes.FUNCTION_THROW_IF_VALUE_IS_NON_ZERO
+
+
 async def test_fetchval_empty(conn, table_test, any_select):
     value = await conn.fetchval(
         any_select([table_test.c.id])
@@ -403,3 +552,122 @@ async def test_limit_by_without_order_by(conn, table_smt):
             .limit_by([table_smt.c.key], limit=1)
     )
     assert {value for (value,) in rows} == {1, 2}
+
+
+@pytest.mark.parametrize('executor_class', [
+    ThreadPoolExecutor, ProcessPoolExecutor,
+])
+@pytest.mark.parametrize(
+    'result_format', ['JSONCompact', 'RowBinaryWithNamesAndTypes'],
+)
+async def test_decode_executor(dsn, executor_class, result_format):
+    query = 'SELECT number, toString(number) AS str FROM numbers(3)'
+    with executor_class(max_workers=1) as executor:
+        async with aiochsa.connect(
+            dsn, decode_executor=executor, decode_threshold=0,
+            result_format=result_format,
+        ) as conn:
+            rows = await conn.fetch(query)
+            assert [tuple(row) for row in rows] == [
+                (0, '0'), (1, '1'), (2, '2'),
+            ]
+            columns = await conn.fetch_columns(query)
+            assert list(columns['str']) == ['0', '1', '2']
+            info = conn.decode_info()
+            assert info.calls == 2
+            assert info.size > 0
+
+            with pytest.raises(aiochsa.DBException) as exc_info:
+                await conn.fetch(
+                    'SELECT throwIf(number = 100000) FROM numbers(200000) '
+                    'SETTINGS max_block_size=1000'
+                )
+            assert exc_info.value.code == (
+                error_codes.FUNCTION_THROW_IF_VALUE_IS_NON_ZERO
+            )
+
+
+@pytest.mark.parametrize('insert_format', ['JSONEachRow', 'RowBinary'])
+async def test_encode_executor(dsn, table_for_type, insert_format):
+    table = await table_for_type(sa.Integer)
+    with ProcessPoolExecutor(max_workers=2) as executor:
+        async with aiochsa.connect(
+            dsn, encode_executor=executor, encode_chunk_size=3,
+        ) as conn:
+            await conn.execute(
+                table.insert(),
+                *[{'value': value} for value in range(10)],
+                insert_format=insert_format,
+            )
+            rows = await conn.fetch(
+                sa.select([table.c.value]).order_by(table.c.value)
+            )
+            assert [row[0] for row in rows] == list(range(10))
+            info = conn.encode_info()
+            assert (info.calls, info.size) == (4, 10)
+
+
+async def _arange(stop):
+    for value in range(stop):
+        yield {'value': value}
+
+
+@pytest.mark.parametrize('insert_format', ['JSONEachRow', 'RowBinary'])
+@pytest.mark.parametrize('rows_factory', [
+    lambda stop: ({'value': value} for value in range(stop)),
+    _arange,
+])
+async def test_insert_iterator(
+    dsn, table_for_type, insert_format, rows_factory,
+):
+    table = await table_for_type(sa.Integer)
+    async with aiochsa.connect(dsn, insert_chunk_size=3) as conn:
+        await conn.execute(
+            table.insert(), rows_factory(10), insert_format=insert_format,
+        )
+        # Nothing is inserted for empty iterator
+        await conn.execute(
+            table.insert(), rows_factory(0), insert_format=insert_format,
+        )
+        rows = await conn.fetch(
+            sa.select([table.c.value]).order_by(table.c.value)
+        )
+        assert [row[0] for row in rows] == list(range(10))
+
+
+@pytest.mark.parametrize('compress_request', ['gzip', 'deflate'])
+async def test_compress_request(dsn, table_for_type, compress_request):
+    table = await table_for_type(sa.Integer)
+    async with aiochsa.connect(
+        dsn, compress_request=compress_request, compress_request_level=1,
+    ) as conn:
+        await conn.execute(table.insert(), *[{'value': v} for v in range(100)])
+        await conn.execute(table.insert(), ({'value': v} for v in range(100)))
+        assert await conn.fetchval(sa.func.count(table.c.value)) == 200
+        info = conn.request_compression_info()
+        assert 0 < info.compressed < info.uncompressed
+
+
+@pytest.mark.parametrize(
+    'compress_response', ['1', 'gzip', 'deflate', 'native'],
+)
+@pytest.mark.parametrize(
+    'result_format', ['JSONCompact', 'RowBinaryWithNamesAndTypes'],
+)
+async def test_compress_response(dsn, compress_response, result_format):
+    async with aiochsa.connect(
+        dsn, compress_response=compress_response, result_format=result_format,
+    ) as conn:
+        rows = await conn.fetch('SELECT number FROM system.numbers LIMIT 1000')
+        assert [row[0] for row in rows] == list(range(1000))
+        rows = [row async for row in conn.iterate(
+            'SELECT number FROM system.numbers LIMIT 1000'
+        )]
+        assert [row[0] for row in rows] == list(range(1000))
+        with pytest.raises(aiochsa.DBException):
+            await conn.fetch('SELECT unknown_column')
+        info = conn.response_compression_info()
+        if compress_response == '1':
+            assert info == (0, 0)
+        else:
+            assert 0 < info.compressed < info.uncompressed
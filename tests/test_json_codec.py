@@ -0,0 +1,106 @@
+from decimal import Decimal
+
+import pytest
+
+from aiochsa.json_codec import (
+    JSON_CODECS, JSONDecodeError, OrjsonCodec, SimplejsonCodec,
+    get_json_codec,
+)
+from aiochsa.parser import JSONCompactEachRowParser, parse_json_compact
+from aiochsa.types import TypeRegistry
+
+
+def _codec(name):
+    if name == 'orjson':
+        pytest.importorskip('orjson')
+    return get_json_codec(name)
+
+
+@pytest.fixture(params=list(JSON_CODECS))
+def codec(request):
+    return _codec(request.param)
+
+
+def test_loads(codec):
+    data = codec.loads(b'{"a": [1, 18446744073709551615, "x", null, 0.5]}')
+    a = data['a']
+    assert a[:4] == [1, 18446744073709551615, 'x', None]
+    if codec.exact_floats:
+        assert a[4] == '0.5'
+    else:
+        assert a[4] == .5
+
+
+def test_loads_error(codec):
+    with pytest.raises(JSONDecodeError):
+        codec.loads(b'{"a": ')
+
+
+@pytest.mark.parametrize(
+    'obj',
+    [
+        {'a': Decimal('1.2345678912345678912')},
+        {'a': [Decimal('-0.1'), Decimal('1E+2')]},
+    ],
+)
+def test_dumps_decimal(codec, obj):
+    result = codec.dumps(obj)
+    assert isinstance(result, str)
+    # Decimals are passed as raw numbers
+    assert SimplejsonCodec().loads(result) == {
+        'a': (
+            [str(value) for value in obj['a']] if isinstance(obj['a'], list)
+            else str(obj['a'])
+        ),
+    }
+
+
+def test_dumps(codec):
+    obj = {'a': 'зразок', 'b': [1, None, 0.5]}
+    assert SimplejsonCodec().loads(codec.dumps(obj)) == {
+        'a': 'зразок', 'b': [1, None, '0.5'],
+    }
+
+
+def test_get_json_codec():
+    default = get_json_codec()
+    assert get_json_codec() is default
+    try:
+        import orjson  # noqa: F401
+    except ImportError:
+        assert isinstance(default, SimplejsonCodec)
+    else:
+        assert isinstance(default, OrjsonCodec)
+
+    assert get_json_codec(default) is default
+
+    with pytest.raises(ValueError):
+        get_json_codec('unknown')
+
+
+def test_parse_json_compact_decimal_inexact():
+    codec = _codec('orjson')
+    content = b'''\
+        {
+            "meta": [
+                {"name": "amount", "type": "Nullable(Decimal(38, 19))"},
+                {"name": "ratio", "type": "Float64"}
+            ],
+            "data": [[1.2345678912345678912, 0.5]]
+        }
+    '''
+    [row] = parse_json_compact(TypeRegistry(), content, codec=codec)
+    assert row['amount'] == Decimal('1.2345678912345678912')
+    assert row['ratio'] == .5
+
+
+def test_json_compact_each_row_parser_decimal_inexact():
+    codec = _codec('orjson')
+    parser = JSONCompactEachRowParser(TypeRegistry(), codec=codec)
+    lines = [
+        b'["amount"]',
+        b'["Array(Decimal(38, 19))"]',
+        b'[[1.2345678912345678912]]',
+    ]
+    [record] = filter(None, map(parser.feed, lines))
+    assert record['amount'] == [Decimal('1.2345678912345678912')]
@@ -0,0 +1,88 @@
+import struct
+
+import pytest
+
+from aiochsa.binary import RowBinaryDecodeError
+from aiochsa.types import TypeRegistry
+
+from .test_binary import _header, _string
+
+
+np = pytest.importorskip('numpy')
+from aiochsa.ndarray import parse_row_binary_numpy  # noqa: E402
+
+
+def test_fixed_columns():
+    content = _header([
+        ('a', 'UInt64'), ('b', 'Float32'), ('c', 'Date'), ('d', 'DateTime'),
+        ('e', 'LowCardinality(Int8)'),
+    ])
+    for i in range(3):
+        content += struct.pack('<QfHIb', i, i / 2, i, i * 86400, -i)
+    arrays = parse_row_binary_numpy(TypeRegistry(), content)
+    assert list(arrays) == ['a', 'b', 'c', 'd', 'e']
+    assert arrays['a'].dtype == np.uint64
+    assert arrays['a'].tolist() == [0, 1, 2]
+    # Refers to response data
+    assert arrays['a'].base is not None
+    assert not arrays['a'].flags.writeable
+    assert arrays['b'].dtype == np.float32
+    assert arrays['b'].tolist() == [0., .5, 1.]
+    assert arrays['c'].dtype == np.dtype('datetime64[D]')
+    assert (
+        arrays['c'] == np.array(
+            ['1970-01-01', '1970-01-02', '1970-01-03'], dtype='datetime64[D]',
+        )
+    ).all()
+    assert arrays['d'].dtype == np.dtype('datetime64[s]')
+    assert (arrays['d'].astype('datetime64[D]') == arrays['c']).all()
+    assert arrays['e'].tolist() == [0, -1, -2]
+
+
+def test_mixed_columns():
+    content = _header([
+        ('a', 'UInt32'), ('b', 'String'), ('c', 'Nullable(Date)'),
+        ('d', 'Array(UInt8)'),
+    ])
+    for i in range(3):
+        content += struct.pack('<I', i) + _string(str(i))
+        content += b'\x01' if i == 1 else b'\x00' + struct.pack('<H', i)
+        content += bytes([i]) + bytes(range(i))
+    arrays = parse_row_binary_numpy(TypeRegistry(), content)
+    assert arrays['a'].dtype == np.uint32
+    assert arrays['a'].tolist() == [0, 1, 2]
+    assert arrays['b'].dtype == object
+    assert arrays['b'].tolist() == ['0', '1', '2']
+    assert isinstance(arrays['c'], np.ma.MaskedArray)
+    assert arrays['c'].dtype == np.dtype('datetime64[D]')
+    assert arrays['c'].mask.tolist() == [False, True, False]
+    assert arrays['c'][2] == np.datetime64('1970-01-03')
+    assert arrays['d'].shape == (3,)
+    assert arrays['d'].tolist() == [[], [0], [0, 1]]
+
+
+@pytest.mark.parametrize(
+    'type_str', ['UInt32', 'Nullable(UInt32)', 'String'],
+)
+def test_empty(type_str):
+    arrays = parse_row_binary_numpy(
+        TypeRegistry(), _header([('a', type_str)]),
+    )
+    assert len(arrays['a']) == 0
+
+
+@pytest.mark.parametrize(
+    'type_str', ['UInt32', 'Nullable(UInt32)'],
+)
+def test_incomplete(type_str):
+    content = _header([('a', type_str)]) + b'\0\0\0\0\0\0'
+    with pytest.raises(RowBinaryDecodeError):
+        parse_row_binary_numpy(TypeRegistry(), content)
+
+
+def test_exception_text_value():
+    # Data looking like exception message is not mistaken for error
+    message = 'Code: 60. DB::Exception: Table default.x does not exist.'
+    content = _header([('a', 'String')]) + _string(message)
+    arrays = parse_row_binary_numpy(TypeRegistry(), content)
+    assert arrays['a'].tolist() == [message]
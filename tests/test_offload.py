@@ -0,0 +1,119 @@
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from functools import partial
+
+import pytest
+
+from aiochsa.binary import RowBinaryDecodeError, parse_row_binary_column_list
+from aiochsa.json_codec import SimplejsonCodec, encode_json_each_row
+from aiochsa.offload import Offloader, decode_rows, rows_from_columns
+from aiochsa.parser import (
+    parse_json_compact, parse_json_compact_column_list,
+)
+from aiochsa.record import (
+    Record, lazy_record_factory, record_factory, tuple_factory,
+)
+from aiochsa.types import TypeRegistry
+
+from .test_binary import _header, _string
+
+
+JSON_CONTENT = b'''\
+    {
+        "meta": [
+            {"name": "id", "type": "UInt64"},
+            {"name": "id", "type": "String"}
+        ],
+        "data": [["1", "a"], ["2", "b"]]
+    }
+'''
+
+
+@pytest.fixture(params=[ThreadPoolExecutor, ProcessPoolExecutor])
+def executor(request):
+    with request.param(max_workers=1) as executor:
+        yield executor
+
+
+def test_should_offload():
+    offloader = Offloader(None, 0)
+    assert not offloader.should_offload(3)
+
+    offloader = Offloader(ThreadPoolExecutor(), 3)
+    assert not offloader.should_offload(2)
+    assert offloader.should_offload(3)
+    assert not offloader.in_process
+
+
+async def test_run_columns(executor):
+    offloader = Offloader(executor, 0)
+    types = TypeRegistry()
+    # Generated functions in type registry cache are not passed to worker
+    list(parse_json_compact(types, JSON_CONTENT))
+
+    names, columns = await offloader.run(
+        parse_json_compact_column_list, types, JSON_CONTENT,
+        size=len(JSON_CONTENT),
+    )
+    # Duplicate names are preserved
+    assert names == ['id', 'id']
+    assert [list(column) for column in columns] == [[1, 2], ['a', 'b']]
+
+    content = _header([('a', 'String')]) + _string('x')
+    names, columns = await offloader.run(
+        parse_row_binary_column_list, types, content, size=len(content),
+    )
+    assert (names, columns) == (['a'], [['x']])
+
+    info = offloader.info()
+    assert info.calls == 2
+    assert info.size == len(JSON_CONTENT) + len(content)
+    assert info.seconds > 0
+
+
+async def test_run_error(executor):
+    offloader = Offloader(executor, 0)
+    content = _header([('a', 'UInt32')]) + b'\0\0'
+    with pytest.raises(RowBinaryDecodeError):
+        await offloader.run(
+            parse_row_binary_column_list, TypeRegistry(), content, size=0,
+        )
+    assert offloader.info().calls == 0
+
+
+async def test_run_rows():
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        offloader = Offloader(executor, 0)
+        rows = await offloader.run(
+            partial(
+                decode_rows,
+                partial(parse_json_compact, row_factory=tuple_factory),
+            ),
+            TypeRegistry(), JSON_CONTENT, size=len(JSON_CONTENT),
+        )
+    assert rows == [(1, 'a'), (2, 'b')]
+
+
+async def test_run_chunked(executor):
+    offloader = Offloader(executor, 0)
+    types = TypeRegistry()
+    codec = SimplejsonCodec()
+    rows = [{'a': idx} for idx in range(5)]
+    result = await offloader.run_chunked(
+        partial(encode_json_each_row, types, codec), rows, 2,
+    )
+    assert result == [
+        ['{"a": 0}', '{"a": 1}'], ['{"a": 2}', '{"a": 3}'], ['{"a": 4}'],
+    ]
+    info = offloader.info()
+    assert (info.calls, info.size) == (3, 5)
+
+
+@pytest.mark.parametrize(
+    'row_factory', [record_factory, lazy_record_factory, tuple_factory],
+)
+def test_rows_from_columns(row_factory):
+    rows = rows_from_columns(row_factory, ['a', 'b'], [[1, 2], ['x', 'y']])
+    assert [tuple(row) for row in rows] == [(1, 'x'), (2, 'y')]
+    if row_factory is not tuple_factory:
+        assert isinstance(rows[0], Record)
+        assert rows[1]['b'] == 'y'
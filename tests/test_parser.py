@@ -1,18 +1,25 @@
+from array import array
 import asyncio
+from datetime import date, datetime, timedelta, timezone
 from decimal import Decimal
 
 import pytest
+import simplejson as json
 
-from aiochsa.parser import parse_type, parse_json_compact
+from aiochsa.parser import (
+    make_json_decoder, parse_type, parse_json_compact,
+    parse_json_compact_columns, JSONCompactEachRowParser, JSONDecodeError,
+)
 from aiochsa import types as t
+from aiochsa.record import LazyRecord, lazy_record_factory, tuple_factory
 
 
 @pytest.mark.parametrize(
     'type_str,type_obj',
     [
         ('String', t.StrType()),
-        ("Enum8('' = -128, 'a' = 0, '\t\n\0\\\'' = 127)", t.StrType()),
-        ("Enum16('a' = 1)", t.StrType()),
+        ("Enum8('' = -128, 'a' = 0, '\t\n\0\\\'' = 127)", t.EnumType()),
+        ("Enum16('a' = 1)", t.EnumType()),
         ('FixedString(8)', t.StrStripZerosType()),
         *[
             (ts, t.IntType()) for ts in [
@@ -56,10 +63,10 @@ from aiochsa import types as t
                     t.NullableType(t.StrStripZerosType())
                 ),
                 t.ArrayType(
-                    t.TupleType(t.DecimalType(), t.StrType()),
+                    t.TupleType(t.DecimalType(), t.EnumType()),
                 ),
                 t.TupleType(
-                    t.NullableType(t.StrType()),
+                    t.NullableType(t.EnumType()),
                     t.NullableType(t.NothingType()),
                 ),
             )
@@ -87,3 +94,219 @@ async def test_parse_json_compact_decimal():
     [[value]] = list(parse_json_compact(t.TypeRegistry(), content))
     assert isinstance(value, Decimal)
     assert str(value) == '1.2345678901230'
+
+
+def test_parse_type_cache():
+    types = t.TypeRegistry()
+    type_str = "DateTime('Europe/Moscow')"
+    type_obj = parse_type(types, type_str)
+    assert parse_type(types, type_str) is type_obj
+    assert types.cache_info().hits == 1
+
+    # Converters might be changed, so cache must be invalidated
+    types.register(t.DateTimeUTCType, ['DateTime'])
+    assert types.cache_info().currsize == 0
+    assert parse_type(types, type_str) == t.DateTimeUTCType('Europe/Moscow')
+
+
+@pytest.mark.parametrize(
+    'type_str,value',
+    [
+        ('String', 'abc'),
+        ('UInt64', '18446744073709551615'),
+        ('Float64', '0.5'),
+        ('Decimal(9, 4)', '1.2345'),
+        ('Date', '2020-01-01'),
+        ('Nullable(String)', None),
+        ('Nullable(UInt8)', None),
+        ('Nullable(UInt8)', 1),
+        ('Array(String)', ['a', 'b']),
+        ('Array(Nullable(Int8))', [1, None]),
+        ('Array(Array(Date))', [['2020-01-01'], []]),
+        ('Tuple(String, UInt8, Array(Date))', ['a', 1, ['2020-01-01']]),
+        ('Array(Tuple(UInt8))', [[1], [2]]),
+        ('LowCardinality(Nullable(String))', 'a'),
+    ],
+)
+def test_json_decoder(type_str, value):
+    types = t.TypeRegistry()
+    decode = make_json_decoder(types, ['String', type_str])
+    expected = parse_type(types, type_str).from_json(value)
+    assert decode(['x', value]) == ['x', expected]
+
+
+def test_json_decoder_cache():
+    types = t.TypeRegistry()
+    make_json_decoder(types, ['String', 'UInt8'])
+    hits = types.cache_info().hits
+    make_json_decoder(types, ['String', 'UInt8'])
+    assert types.cache_info().hits == hits + 1
+
+
+@pytest.mark.parametrize(
+    'type_str,values',
+    [
+        ('LowCardinality(String)', ['abc', 'abc']),
+        ('LowCardinality(Nullable(String))', ['abc', 'abc', None]),
+        ("Enum8('abc' = 1)", ['abc', 'abc']),
+        ('Date', ['2020-01-01', '2020-01-01']),
+        ('Nullable(Date)', ['2020-01-01', '2020-01-01', None]),
+    ],
+)
+def test_json_decoder_interning(type_str, values):
+    types = t.TypeRegistry()
+    decode = make_json_decoder(types, [type_str])
+    # Parser creates separate objects for equal values
+    values = [json.loads(json.dumps(value)) for value in values]
+    assert values[0] is not values[1]
+    results = [decode([value])[0] for value in values]
+    assert results[0] == parse_type(types, type_str).from_json(values[0])
+    assert results[0] is results[1]
+
+
+def test_json_decoder_interning_per_result():
+    types = t.TypeRegistry()
+    results = [
+        make_json_decoder(types, ['Date'])(['2020-01-01'])[0]
+        for _ in range(2)
+    ]
+    assert results[0] == results[1]
+    assert results[0] is not results[1]
+
+
+def test_json_decoder_not_interned():
+    types = t.TypeRegistry()
+    decode = make_json_decoder(types, ['String'])
+    values = [json.loads('"abc"') for _ in range(2)]
+    assert decode([values[0]])[0] is values[0]
+    assert decode([values[1]])[0] is values[1]
+
+
+def test_json_decoder_custom_type():
+    class UpperStrType(t.StrType):
+        def from_json(self, value):
+            return value.upper()
+
+    types = t.TypeRegistry()
+    types.register(UpperStrType, ['String'])
+    decode = make_json_decoder(types, ['Array(String)'])
+    assert decode([['a', 'b']]) == [['A', 'B']]
+
+
+def test_parse_json_compact_fast_wire():
+    content = b'''\
+        {
+            "meta": [
+                {"name": "id", "type": "UInt64"},
+                {"name": "ids", "type": "Array(Nullable(Int64))"},
+                {"name": "ts", "type": "DateTime"},
+                {"name": "ts_tz", "type": "DateTime('Europe/Moscow')"},
+                {"name": "ts_zero", "type": "DateTime"},
+                {"name": "amount", "type": "Decimal(38, 19)"}
+            ],
+            "data": [
+                [
+                    18446744073709551615, [-9223372036854775808, null],
+                    "1577836800", "1577836800", "0", 1.2345678912345678912
+                ]
+            ]
+        }
+    '''
+    types = t.TypeRegistry(t.FAST_WIRE_CONVERTERS)
+    [row] = parse_json_compact(types, content)
+    assert row['id'] == 18446744073709551615
+    assert row['ids'] == [-9223372036854775808, None]
+    # Naive, like in text format
+    assert row['ts'] == datetime(2020, 1, 1)
+    assert row['ts'].tzinfo is None
+    assert row['ts_tz'] == datetime(2020, 1, 1, tzinfo=timezone.utc)
+    assert row['ts_tz'].utcoffset() == timedelta(hours=3)
+    assert row['ts_zero'] is None
+    # Decimals are still exact
+    assert row['amount'] == Decimal('1.2345678912345678912')
+
+    columns = parse_json_compact_columns(types, content)
+    assert columns['id'] == array('Q', [18446744073709551615])
+
+
+def test_parse_json_compact_columns():
+    content = b'''\
+        {
+            "meta": [
+                {"name": "id", "type": "UInt64"},
+                {"name": "small", "type": "Int8"},
+                {"name": "ratio", "type": "Float32"},
+                {"name": "name", "type": "String"},
+                {"name": "day", "type": "Date"}
+            ],
+            "data": [
+                ["1", -1, 0.5, "a", "2020-01-01"],
+                ["2", 1, 1, "b", "2020-01-02"]
+            ]
+        }
+    '''
+    columns = parse_json_compact_columns(t.TypeRegistry(), content)
+    assert list(columns) == ['id', 'small', 'ratio', 'name', 'day']
+    assert columns['id'] == array('Q', [1, 2])
+    assert columns['small'] == array('b', [-1, 1])
+    assert columns['ratio'] == array('f', [.5, 1.])
+    assert columns['name'] == ['a', 'b']
+    assert columns['day'] == [date(2020, 1, 1), date(2020, 1, 2)]
+
+
+def test_parse_json_compact_columns_empty():
+    content = b'{"meta": [{"name": "id", "type": "UInt32"}], "data": []}'
+    columns = parse_json_compact_columns(t.TypeRegistry(), content)
+    assert columns == {'id': array('I')}
+
+
+def test_json_compact_each_row_parser():
+    parser = JSONCompactEachRowParser(t.TypeRegistry())
+    lines = [
+        b'["id", "amount"]',
+        b'["UInt64", "Decimal(18, 13)"]',
+        b'["1", 1.2345678901230]',
+        b'',
+        b'["2", 0.1]',
+    ]
+    records = [parser.feed(line) for line in lines]
+    assert records[:2] == [None, None]
+    assert records[3] is None
+    assert records[2] == {'id': 1, 'amount': Decimal('1.2345678901230')}
+    assert records[4] == {'id': 2, 'amount': Decimal('0.1')}
+
+
+def test_json_compact_each_row_parser_row_factory():
+    parser = JSONCompactEachRowParser(t.TypeRegistry(), tuple_factory)
+    parser.feed(b'["id"]')
+    parser.feed(b'["UInt64"]')
+    assert parser.feed(b'["1"]') == (1,)
+
+
+def test_parse_json_compact_lazy():
+    content = b'''{
+        "meta": [{"name": "id", "type": "UInt64"}, {"name": "d", "type": "Date"}],
+        "data": [["1", "2020-01-01"]]
+    }'''
+    [record] = parse_json_compact(
+        t.TypeRegistry(), content, row_factory=lazy_record_factory,
+    )
+    assert isinstance(record, LazyRecord)
+    assert record == {'id': 1, 'd': date(2020, 1, 1)}
+
+
+def test_json_compact_each_row_parser_lazy():
+    parser = JSONCompactEachRowParser(t.TypeRegistry(), lazy_record_factory)
+    parser.feed(b'["id"]')
+    parser.feed(b'["UInt64"]')
+    record = parser.feed(b'["1"]')
+    assert isinstance(record, LazyRecord)
+    assert record['id'] == 1
+
+
+def test_json_compact_each_row_parser_exception():
+    parser = JSONCompactEachRowParser(t.TypeRegistry())
+    parser.feed(b'["id"]')
+    parser.feed(b'["UInt64"]')
+    with pytest.raises(JSONDecodeError):
+        parser.feed(b'Code: 395. DB::Exception: Value passed to throwIf')
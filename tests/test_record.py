@@ -1,6 +1,11 @@
+from dataclasses import dataclass
+
 import pytest
 
-from aiochsa.record import Record
+from aiochsa.record import (
+    LazyRecord, Record, dataclass_factory, lazy_record_factory, make_index,
+    namedtuple_factory, record_factory, slots_factory, tuple_factory,
+)
 
 
 @pytest.fixture
@@ -19,6 +24,23 @@ def test_getitem_name(record):
         record['c']
 
 
+def test_getitem_shared_index():
+    names = ['a', 'b']
+    index = make_index(names)
+    records = [Record(names, [i, str(i)], index) for i in range(2)]
+    assert [record['b'] for record in records] == ['0', '1']
+
+
+def test_getitem_duplicate_names():
+    record = Record(['a', 'a'], [1, 2])
+    assert record['a'] == 1
+
+
+def test_contains(record):
+    assert 'a' in record
+    assert 'c' not in record
+
+
 def test_getitem_index(record):
     assert record[0] == record[-2] == 1
     assert record[1] == record[-1] == 'v'
@@ -80,3 +102,113 @@ def test_mapping_interface(record):
 
 def test_repr(record):
     assert repr(record) == "<Record a=1 b='v'>"
+
+
+def test_record_factory():
+    make_row = record_factory(['a', 'b'])
+    row = make_row([1, 'v'])
+    assert isinstance(row, Record)
+    assert row == {'a': 1, 'b': 'v'}
+
+
+def test_tuple_factory():
+    assert tuple_factory(['a', 'b'])([1, 'v']) == (1, 'v')
+
+
+def test_namedtuple_factory():
+    row = namedtuple_factory(['a', 'count()'])([1, 'v'])
+    assert row == (1, 'v')
+    assert row.a == 1
+    assert row._1 == 'v'
+
+
+@dataclass
+class Item:
+    b: str
+    a: int
+
+
+def test_dataclass_factory():
+    row = dataclass_factory(Item)(['a', 'b'])([1, 'v'])
+    assert row == Item(a=1, b='v')
+
+
+def test_slots_factory():
+    names = ['a', 'count()', 'a', 'class']
+    make_row = slots_factory(names)
+    # Class is generated once per schema
+    assert slots_factory(list(names)) is make_row
+    row = make_row([1, 2, 3, 4])
+    assert (row.a, row._1, row._2, row._3) == (1, 2, 3, 4)
+    assert not hasattr(row, '__dict__')
+    assert repr(row) == '<Row a=1 _1=2 _2=3 _3=4>'
+    a, *rest = row
+    assert (a, rest) == (1, [2, 3, 4])
+    assert len(row) == 4 and row[1] == 2 and row[-1] == 4
+    assert row == make_row([1, 2, 3, 4])
+    assert row != make_row([1, 2, 3, 5])
+
+
+def test_slots_factory_no_columns():
+    row = slots_factory([])([])
+    assert list(row) == []
+    assert repr(row) == '<Row>'
+
+
+class CountingConverter:
+
+    def __init__(self, convert):
+        self.convert = convert
+        self.calls = 0
+
+    def __call__(self, value):
+        self.calls += 1
+        return self.convert(value)
+
+
+@pytest.fixture
+def converters():
+    return [CountingConverter(int), CountingConverter(str.upper)]
+
+
+@pytest.fixture
+def lazy_record(converters):
+    make_row = lazy_record_factory(['a', 'b'], converters)
+    return make_row(['1', 'v'])
+
+
+def test_lazy_getitem(lazy_record, converters):
+    assert isinstance(lazy_record, LazyRecord)
+    assert lazy_record['a'] == 1
+    assert lazy_record[0] == lazy_record[-2] == lazy_record.get('a') == 1
+    assert [c.calls for c in converters] == [1, 0]
+    assert lazy_record[-1] == 'V'
+    assert [c.calls for c in converters] == [1, 1]
+
+
+def test_lazy_slice(lazy_record, converters):
+    assert lazy_record[1:] == ['V']
+    assert lazy_record[:] == [1, 'V']
+    assert [c.calls for c in converters] == [1, 1]
+
+
+@pytest.mark.parametrize('convert', [
+    list, dict, lambda r: list(r.values()), lambda r: list(r.items()), repr,
+])
+def test_lazy_convert_all(lazy_record, converters, convert):
+    lazy_record['a']
+    assert convert(lazy_record) == convert(Record(['a', 'b'], [1, 'V']))
+    assert [c.calls for c in converters] == [1, 1]
+
+
+def test_lazy_eq(lazy_record):
+    assert lazy_record == {'a': 1, 'b': 'V'}
+    assert lazy_record == (1, 'V')
+    assert lazy_record != (1, 'v')
+
+
+def test_lazy_converted(converters):
+    # Values are already converted (e.g. RowBinary format)
+    record = lazy_record_factory(['a', 'b'], None)([1, 'V'])
+    assert record == (1, 'V')
+    assert [c.calls for c in converters] == [0, 0]
@@ -7,14 +7,16 @@ from random import randrange
 from typing import Iterable, Tuple, Type, Union
 import uuid
 
+import aiohttp
 import pytest
 import sqlalchemy as sa
 from clickhouse_sqlalchemy import types as t
 
 import aiochsa
 from aiochsa.types import (
-    ArrayType, BaseType, DateTimeUTCType, IntType, NullableType, ProxyType,
-    StrType, TupleType, TypeRegistry,
+    FAST_WIRE_CONVERTERS, FAST_WIRE_SETTINGS, ArrayType, BaseType,
+    DateTimeUTCType, IntType, NullableType, ProxyType, StrType, TupleType,
+    TypeRegistry,
 )
 
 
@@ -146,6 +148,86 @@ async def test_insert_select_round(conn, table_for_type, sa_type, value):
     assert result == value
 
 
+@pytest.mark.parametrize(
+    'sa_type,value',
+    TYPED_PARAMETERS,
+    ids = parametrized_id,
+)
+async def test_insert_binary_select_round(
+    conn, table_for_type, sa_type, value,
+):
+    # Insert parameters go through `to_binary()` method of type
+    table = await table_for_type(sa_type)
+    await conn.execute(
+        table.insert(),
+        {'value': value},
+        insert_format='RowBinary',
+    )
+    result = await conn.fetchval(
+        table.select()
+    )
+    assert result == value
+
+
+@pytest.fixture
+async def conn_binary(dsn):
+    async with aiochsa.connect(
+        dsn, result_format='RowBinaryWithNamesAndTypes',
+    ) as conn:
+        yield conn
+
+
+@pytest.mark.parametrize(
+    'sa_type,value',
+    TYPED_PARAMETERS,
+    ids = parametrized_id,
+)
+async def test_cast_round_binary(conn_binary, sa_type, value):
+    result = await conn_binary.fetchval(
+        sa.select([sa.func.cast(value, sa_type)])
+    )
+    assert result == value
+
+
+@pytest.fixture
+async def conn_fast_wire(dsn):
+    async with aiochsa.connect(dsn, fast_wire=True) as conn:
+        yield conn
+
+
+@pytest.mark.parametrize(
+    'sa_type,value',
+    TYPED_PARAMETERS,
+    ids = parametrized_id,
+)
+async def test_cast_round_fast_wire(conn_fast_wire, sa_type, value):
+    result = await conn_fast_wire.fetchval(
+        sa.select([sa.func.cast(value, sa_type)])
+    )
+    assert result == value
+
+
+@pytest.mark.parametrize(
+    'fast_wire,enabled',
+    [('1', True), ('true', True), ('False', False), ('0', False)],
+)
+async def test_fast_wire_dsn(fast_wire, enabled):
+    dsn = f'clickhouse://host?fast_wire={fast_wire}'
+    async with aiochsa.connect(dsn) as conn:
+        params = conn._client.params
+        assert (FAST_WIRE_SETTINGS.items() <= params.items()) == enabled
+        assert 'fast_wire' not in params
+
+
+async def test_fast_wire_custom_types():
+    async with aiohttp.ClientSession() as session:
+        with pytest.raises(ValueError):
+            aiochsa.Client(session, fast_wire=True, types=TypeRegistry())
+        types = TypeRegistry(FAST_WIRE_CONVERTERS)
+        client = aiochsa.Client(session, fast_wire=True, types=types)
+        assert client._types is types
+
+
 @pytest.mark.parametrize(
     'value',
     [